@@ -0,0 +1,518 @@
+"""
+    Access log and status messages of the webservers, written by a background thread instead of the threads answering requests.
+
+    A request is logged by putting a tuple on a queue, which takes no lock and does no formatting or writing.
+    A writer thread takes every queued record a few times a second, formats them in Combined Log Format
+    or as JSON lines, and writes them all with one write, so threads answering requests never wait for stdout or the disk.
+    Messages below the log level are thrown away before they are formatted, so debug messages cost almost nothing when they are off.
+    Log files are rotated when they grow too large, like access.log being renamed to access.log.1
+"""
+
+import os               # imported so log files can be rotated
+import sys              # imported so log can be written to stdout
+import json             # imported so records can be written as JSON lines
+import time             # imported so records are timestamped
+import random           # imported so only a sample of requests can be logged
+import atexit           # imported so queued records are written when server exits
+import threading        # imported so records are written by a background thread
+
+from collections import deque   # imported so records are queued without taking a lock
+
+
+# Escapes of characters in quoted values of Combined Log Format: backslash and quote get a backslash in front,
+# control characters and bytes that are not printable ASCII are written as "\xHH". Values are decoded as latin-1,
+# so no other characters can occur
+logEscapes = {character: f'\\x{character:02x}' for character in [*range(0x20), *range(0x7f, 0x100)]}
+logEscapes[ord('\\')] = '\\\\'
+logEscapes[ord('"')] = '\\"'
+
+
+# Beginning of AccessLog
+
+class AccessLog:
+
+    """
+        Description:
+        Queues access records and messages, and writes them in batches from a background thread.
+        Safe to use from several threads at once, and from worker processes forked after it is made
+
+        Arguments:
+        level:         Lowest level of messages written, "debug", "info", "warning" or "error"
+        logFormat:     Format of access records, "combined" for Combined Log Format or "json" for JSON lines
+        path:          File the log is written to, None writes it to stdout
+        sampleRate:    Share of requests logged, between 0 and 1. Responses with status 500 or more are always logged
+        maxBytes:      Log file is rotated when it grows larger than this, 0 never rotates it
+        backups:       Number of rotated log files kept
+        flushInterval: Seconds between writing queued records
+        maxRecords:    Most records queued at once. If the writer thread falls behind, more are dropped and counted,
+                       so the queue can not grow until the server runs out of memory
+    """
+
+    # Levels in order, messages below the log level are not written
+    levels = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+
+
+    # Beginning of __init__()
+
+    def __init__(self, level = 'info', logFormat = 'combined', path = None, sampleRate = 1.0,
+                 maxBytes = 10 * 1024 * 1024, backups = 5, flushInterval = 0.2, maxRecords = 100000):
+
+        self.level = self.levels[level]
+        self.logFormat = logFormat
+        self.path = path
+        self.sampleRate = sampleRate
+        self.maxBytes = maxBytes
+        self.backups = backups
+        self.flushInterval = flushInterval
+        self.maxRecords = maxRecords
+
+        # Records waiting to be written. Appending to and popping from a deque are atomic, so no lock is taken
+        self.records = deque()
+        # Records dropped because the queue was full, taken no lock for either, so the count may fall a little short
+        self.dropped = 0
+
+        self.logFile = None                 # Open log file, None when writing to stdout or not opened yet
+        self.writer = None                  # Background writer thread, started when first record is queued
+        self.stopped = threading.Event()    # Tells writer thread to write what is left and stop
+        self.startLock = threading.Lock()   # Makes sure only one writer thread is started
+
+        # Last formatted timestamp, records within the same second share it
+        self.stampSecond = None
+        self.stamp = ''
+
+        # Writer thread is not copied into forked worker processes, they start their own
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child = self.forked)
+
+        # Queued records are written when server exits
+        atexit.register(self.close)
+
+    # End of __init__()
+
+
+
+    # Beginning of configure()
+
+    def configure(self, level = None, logFormat = None, path = None, sampleRate = None, maxBytes = None, backups = None):
+
+        """
+            Description:
+            Changes settings of the log, arguments left as None are not changed.
+            Meant to be called once from main() before server starts, the log file is opened again if path changed
+
+            Arguments:
+            level:      Lowest level of messages written, "debug", "info", "warning" or "error"
+            logFormat:  Format of access records, "combined" or "json"
+            path:       File the log is written to, empty string writes it to stdout
+            sampleRate: Share of requests logged, between 0 and 1
+            maxBytes:   Log file is rotated when it grows larger than this, 0 never rotates it
+            backups:    Number of rotated log files kept
+        """
+
+        if level is not None:
+            self.level = self.levels[level]
+        if logFormat is not None:
+            self.logFormat = logFormat
+        if sampleRate is not None:
+            self.sampleRate = sampleRate
+        if maxBytes is not None:
+            self.maxBytes = maxBytes
+        if backups is not None:
+            self.backups = backups
+
+        if path is not None:
+            self.flush()
+            self.path = path or None
+            if self.logFile is not None:
+                self.logFile.close()
+                self.logFile = None
+
+    # End of configure()
+
+
+
+    # Beginning of access()
+
+    def access(self, clientAddress, httpRequestMessage, status, sentBytes, seconds):
+
+        """
+            Description:
+            Queues an access record of an answered request. Record is formatted by the writer thread.
+            Only a sample of requests is queued if sampleRate is below 1, responses with status 500 or more always are
+
+            Arguments:
+            clientAddress:      (IP-address, port) of the client
+            httpRequestMessage: The parsed request message, None if request could not be parsed
+            status:             HTTP status of the response, like "200 OK"
+            sentBytes:          Bytes of the response message
+            seconds:            Time from request being received until response was sent
+        """
+
+        if self.sampleRate < 1 and status[0] != '5' and random.random() >= self.sampleRate:
+            return
+        if len(self.records) >= self.maxRecords:
+            self.dropped += 1
+            return
+
+        self.records.append(('access', time.time(), clientAddress, httpRequestMessage, status, sentBytes, seconds))
+        if self.writer is None:
+            self.writerStarter()
+
+    # End of access()
+
+
+
+    # Beginning of message()
+
+    def message(self, level, text, *arguments):
+
+        """
+            Description:
+            Queues a status message if its level is written. Text is formatted with the arguments
+            by the writer thread, like "%s", so messages below the log level are never formatted
+
+            Arguments:
+            level:     "debug", "info", "warning" or "error"
+            text:      Message, may have %-placeholders
+            arguments: Values put into the placeholders
+        """
+
+        if self.levels[level] < self.level:
+            return
+        if len(self.records) >= self.maxRecords:
+            self.dropped += 1
+            return
+
+        self.records.append(('message', time.time(), level, text, arguments))
+        if self.writer is None:
+            self.writerStarter()
+
+    # End of message()
+
+
+
+    # Beginning of debug()
+
+    def debug(self, text, *arguments):
+
+        """
+            Description:
+            Queues a debug message, like a connection being opened or closed. These are not written by default
+
+            Arguments:
+            text:      Message, may have %-placeholders
+            arguments: Values put into the placeholders
+        """
+
+        if self.level <= self.levels['debug']:
+            self.message('debug', text, *arguments)
+
+    # End of debug()
+
+
+
+    # Beginning of info()
+
+    def info(self, text, *arguments):
+
+        """
+            Description:
+            Queues an info message, like server starting or stopping
+
+            Arguments:
+            text:      Message, may have %-placeholders
+            arguments: Values put into the placeholders
+        """
+
+        self.message('info', text, *arguments)
+
+    # End of info()
+
+
+
+    # Beginning of warning()
+
+    def warning(self, text, *arguments):
+
+        """
+            Description:
+            Queues a warning, like a malformed request or a client being turned away
+
+            Arguments:
+            text:      Message, may have %-placeholders
+            arguments: Values put into the placeholders
+        """
+
+        self.message('warning', text, *arguments)
+
+    # End of warning()
+
+
+
+    # Beginning of error()
+
+    def error(self, text, *arguments):
+
+        """
+            Description:
+            Queues an error, like an exception while answering a request
+
+            Arguments:
+            text:      Message, may have %-placeholders
+            arguments: Values put into the placeholders
+        """
+
+        self.message('error', text, *arguments)
+
+    # End of error()
+
+
+
+    # Beginning of writerStarter()
+
+    def writerStarter(self):
+
+        """
+            Description:
+            Starts the background writer thread if it is not running yet
+        """
+
+        with self.startLock:
+            if self.writer is None:
+                self.stopped.clear()
+                self.writer = threading.Thread(target = self.writerLoop, name = 'access-log', daemon = True)
+                self.writer.start()
+
+    # End of writerStarter()
+
+
+
+    # Beginning of writerLoop()
+
+    def writerLoop(self):
+
+        """
+            Description:
+            Runs in the writer thread. Writes queued records every flushInterval seconds until log is closed
+        """
+
+        while not self.stopped.wait(self.flushInterval):
+            self.flush()
+        self.flush()
+
+    # End of writerLoop()
+
+
+
+    # Beginning of flush()
+
+    def flush(self):
+
+        """
+            Description:
+            Formats every queued record and writes them with one write.
+            A record that can not be formatted, like a message with fewer arguments than placeholders, is left out
+            and reported on stderr, so it does not stop the writer thread.
+            Errors while writing are printed to stderr, server keeps running without its log
+        """
+
+        # Another thread may flush at the same time, like main() calling configure(), so popping is what tells it is empty
+        lines = []
+        while True:
+            try:
+                record = self.records.popleft()
+            except IndexError:
+                break
+            try:
+                lines.append(self.recordFormatter(record))
+            except Exception as error:
+                sys.stderr.write(f'Log record could not be formatted: {error!r} in {record!r}\n')
+
+        # Records dropped since last time are reported in the log itself, where the gap in it shows
+        dropped = self.dropped
+        if dropped:
+            self.dropped -= dropped
+            lines.append(self.recordFormatter(('message', time.time(), 'warning',
+                                               'Log fell behind, %s records were dropped', (dropped,))))
+
+        if not lines:
+            return
+
+        batch = '\n'.join(lines) + '\n'
+        try:
+            if self.path is None:
+                sys.stdout.write(batch)
+                sys.stdout.flush()
+            else:
+                self.fileWriter(batch.encode())
+        except (OSError, ValueError) as error:
+            sys.stderr.write(f'Access log could not be written: {error}\n')
+
+    # End of flush()
+
+
+
+    # Beginning of fileWriter()
+
+    def fileWriter(self, batch):
+
+        """
+            Description:
+            Appends a batch to the log file, rotating it first if it would grow larger than maxBytes.
+            Worker processes append to the same file, a process notices that another one has rotated it
+            and opens the new file
+
+            Argument:
+            batch: Formatted records in the form of bytes
+        """
+
+        # Opens log file, again if another process has renamed it
+        if self.logFile is not None:
+            try:
+                if os.stat(self.path).st_ino != os.fstat(self.logFile.fileno()).st_ino:
+                    self.logFile.close()
+                    self.logFile = None
+            except FileNotFoundError:
+                self.logFile.close()
+                self.logFile = None
+        if self.logFile is None:
+            self.logFile = open(self.path, 'ab', buffering = 0)
+
+        # Rotates log file, access.log.4 becomes access.log.5 and so on, the oldest is overwritten
+        if self.maxBytes and self.logFile.tell() + len(batch) > self.maxBytes and self.logFile.tell() > 0:
+            self.logFile.close()
+            for number in range(self.backups - 1, 0, -1):
+                if os.path.exists(f'{self.path}.{number}'):
+                    os.replace(f'{self.path}.{number}', f'{self.path}.{number + 1}')
+            if self.backups > 0:
+                os.replace(self.path, f'{self.path}.1')
+            else:
+                os.remove(self.path)
+            self.logFile = open(self.path, 'ab', buffering = 0)
+
+        self.logFile.write(batch)
+
+    # End of fileWriter()
+
+
+
+    # Beginning of recordFormatter()
+
+    def recordFormatter(self, record):
+
+        """
+            Description:
+            Formats a queued record as one line
+
+            Argument:
+            record: Access record or message, as queued by access() or message()
+
+            Returns:
+            line: The record in Combined Log Format or as JSON, without a newline
+        """
+
+
+        # Status message, like "[18/Oct/2026:14:39:56 +0000] info Server is ready to receive on port 6969..."
+        if record[0] == 'message':
+            _, timestamp, level, text, arguments = record
+            if arguments:
+                text = text % arguments
+            if self.logFormat == 'json':
+                return json.dumps({'time': timestamp, 'level': level, 'message': text})
+            return f'[{self.timestampWriter(timestamp)}] {level} {text}'
+
+
+        # Access record
+        _, timestamp, clientAddress, httpRequestMessage, status, sentBytes, seconds = record
+        if httpRequestMessage is not None:
+            requestLine = f'{httpRequestMessage.method} {httpRequestMessage.target} {httpRequestMessage.version}'
+            referer = httpRequestMessage.headers.get('referer', '-')
+            userAgent = httpRequestMessage.headers.get('user-agent', '-')
+        else:
+            requestLine, referer, userAgent = '-', '-', '-'
+
+        if self.logFormat == 'json':
+            return json.dumps({'time': timestamp, 'client': clientAddress[0], 'request': requestLine,
+                               'status': int(status[:3]), 'bytes': sentBytes, 'duration': round(seconds, 6),
+                               'referer': referer, 'user_agent': userAgent})
+
+        # Combined Log Format, with the duration in microseconds added at the end like Apache's %D
+        # Values are written by the client, so they are escaped like Apache does, a value can then neither end its quotes
+        # nor start a forged line
+        requestLine, referer, userAgent = (value.translate(logEscapes) for value in (requestLine, referer, userAgent))
+        return f'{clientAddress[0]} - - [{self.timestampWriter(timestamp)}] "{requestLine}" {status[:3]} {sentBytes} ' \
+               f'"{referer}" "{userAgent}" {int(seconds * 1_000_000)}'
+
+    # End of recordFormatter()
+
+
+
+    # Beginning of timestampWriter()
+
+    def timestampWriter(self, timestamp):
+
+        """
+            Description:
+            Writes a timestamp in the format of Common Log Format, the same second is only formatted once
+
+            Argument:
+            timestamp: Seconds since epoch
+
+            Returns:
+            stamp: Timestamp like "18/Oct/2026:14:39:56 +0000"
+        """
+
+        second = int(timestamp)
+        if second != self.stampSecond:
+            self.stampSecond = second
+            self.stamp = time.strftime('%d/%b/%Y:%H:%M:%S +0000', time.gmtime(second))
+
+        return self.stamp
+
+    # End of timestampWriter()
+
+
+
+    # Beginning of forked()
+
+    def forked(self):
+
+        """
+            Description:
+            Called in a newly forked process. Writer thread of the parent is not running here,
+            a new one is started when the process queues its first record. Records queued by the parent are dropped,
+            the parent writes them
+        """
+
+        self.records = deque()
+        self.dropped = 0
+        self.writer = None
+        self.stopped = threading.Event()
+        self.startLock = threading.Lock()
+        self.logFile = None
+
+    # End of forked()
+
+
+
+    # Beginning of close()
+
+    def close(self):
+
+        """
+            Description:
+            Writes every queued record and stops the writer thread. Log can still be used afterwards,
+            a new writer thread is started for the next record
+        """
+
+        with self.startLock:
+            writer = self.writer
+            self.writer = None
+        if writer is not None:
+            self.stopped.set()
+            writer.join()
+        self.flush()
+
+    # End of close()
+
+# End of AccessLog
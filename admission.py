@@ -0,0 +1,398 @@
+"""
+    Admission control, which decides if a new connection is answered or turned away while the server is overloaded.
+
+    A server that accepts every connection under overload queues more work than it can do, until every client
+    waits so long that nobody is served in time. Turning some connections away early, with a response that costs
+    almost nothing to send, keeps the ones that are let in fast. Three checks decide, in this order:
+
+    client rate:     Every client IP-address has a token bucket, refilled at a fixed rate up to a burst size.
+                     Every connection takes a token, so one busy client can not crowd out everyone else
+    max connections: Connections let in and not yet closed are limited, so work that has been let in can be finished.
+                     It limits connections, not requests: a keep-alive connection counts once however many requests
+                     it sends, and counts until it is closed, also while it is idle between requests
+    queue delay:     If the oldest connection waiting for a worker thread has waited too long,
+                     the server is behind, and new connections are turned away until it catches up
+
+    Every check is off until it is given a limit. Connections are also turned away when the queue of connections
+    waiting for a worker thread is full, if the server is told to turn them away instead of waiting for room
+
+    A connection turned away still has its request unread. Closing it right away would make the kernel answer with a reset,
+    which can throw away the response before the client reads it, so a LingeringCloser reads and drops what the client
+    sends for a short while before closing
+"""
+
+import os               # imported so the closer thread of a parent process is not expected in forked worker processes
+import time             # imported so token buckets can be refilled
+import socket           # imported so sending side of a connection can be shut down before it is closed
+import selectors        # imported so one thread can wait on every lingering connection
+import threading        # imported so connections let in can be counted by many threads
+from collections import OrderedDict, deque  # imported so token buckets of clients not seen for a while are forgotten first,
+                                            # and connections are handed to the closer thread without taking a lock
+
+
+# Beginning of AdmissionControl
+
+class AdmissionControl:
+
+    """
+        Description:
+        Decides if new connections are let in. admit() is called by the thread accepting connections,
+        release() by the thread that closes a connection that was let in
+
+        Arguments:
+        maxConnections: Most connections let in and not yet closed, 0 for no limit.
+                        A connection counts from admit() to release(), however many requests it sends
+        clientRate:     Connections per second one client IP-address may open over time, 0 for no limit
+        clientBurst:    Connections one client IP-address may open at once before its rate applies,
+                        twice the rate by default, at least 1
+        maxQueueDelay:  Seconds the oldest waiting connection may have waited before new ones are turned away,
+                        0 for no limit
+        maxClients:     Most token buckets kept, buckets of clients not seen for the longest time are forgotten first
+    """
+
+
+    # Beginning of __init__()
+
+    def __init__(self, maxConnections = 0, clientRate = 0, clientBurst = 0, maxQueueDelay = 0, maxClients = 65536):
+
+        self.maxConnections = maxConnections
+        self.clientRate = clientRate
+        self.clientBurst = clientBurst or max(1, 2 * clientRate)
+        self.maxQueueDelay = maxQueueDelay
+        self.maxClients = maxClients
+
+        self.connections = 0                # Connections let in and not yet closed
+        self.lock = threading.Lock()        # Guards connections, it is changed by every worker thread
+
+        # Client IP-address mapped to [tokens, time tokens were last counted], least recently seen first
+        # Only used by the thread accepting connections, so it needs no lock
+        self.buckets = OrderedDict()
+
+        # Connections turned away, by the check that turned them away or by the queue being full
+        # Counted by the server when it sends the response, since the queue is checked after admit()
+        self.shed = {'client rate': 0, 'max connections': 0, 'queue delay': 0, 'queue full': 0}
+
+    # End of __init__()
+
+
+
+    # Beginning of admit()
+
+    def admit(self, clientIP, queueDelay = 0):
+
+        """
+            Description:
+            Decides if a new connection is let in. A connection that is let in is counted as open
+            until release() is called for it
+
+            Arguments:
+            clientIP:   IP-address of the client
+            queueDelay: Seconds the oldest connection waiting for a worker thread has waited, 0 if none is waiting
+
+            Returns:
+            reason: None if connection is let in,
+                    otherwise the check that turned it away: "client rate", "max connections" or "queue delay"
+        """
+
+
+        # Client that opens connections too fast is turned away first, so it does not use up the other limits
+        if self.clientRate and not self.tokenTaker(clientIP):
+            reason = 'client rate'
+
+        # Server is behind on the connections it already has
+        elif self.maxQueueDelay and queueDelay > self.maxQueueDelay:
+            reason = 'queue delay'
+
+        else:
+            with self.lock:
+                if not self.maxConnections or self.connections < self.maxConnections:
+                    self.connections += 1
+                    return None
+            reason = 'max connections'
+
+        return reason
+
+    # End of admit()
+
+
+
+    # Beginning of release()
+
+    def release(self):
+
+        """
+            Description:
+            Tells that a connection that was let in has been closed
+        """
+
+        with self.lock:
+            self.connections -= 1
+
+    # End of release()
+
+
+
+    # Beginning of tokenTaker()
+
+    def tokenTaker(self, clientIP):
+
+        """
+            Description:
+            Refills token bucket of a client for the time since it was last counted, and takes a token from it
+
+            Argument:
+            clientIP: IP-address of the client
+
+            Returns:
+            taken: True if bucket had a token, False if client has opened connections too fast
+        """
+
+
+        now = time.monotonic()
+        bucket = self.buckets.get(clientIP)
+
+        # New client starts with a full bucket, the client not seen for the longest time is forgotten if there are too many
+        if bucket is None:
+            bucket = self.buckets[clientIP] = [self.clientBurst, now]
+            if len(self.buckets) > self.maxClients:
+                self.buckets.popitem(last = False)
+        else:
+            self.buckets.move_to_end(clientIP)
+            bucket[0] = min(self.clientBurst, bucket[0] + (now - bucket[1]) * self.clientRate)
+            bucket[1] = now
+
+        if bucket[0] < 1:
+            return False
+
+        bucket[0] -= 1
+        return True
+
+    # End of tokenTaker()
+
+
+
+    # Beginning of retryAfter()
+
+    def retryAfter(self, reason):
+
+        """
+            Description:
+            Tells how many seconds a client that was turned away should wait before it tries again
+
+            Argument:
+            reason: The check that turned the client away
+
+            Returns:
+            seconds: Whole seconds for the "Retry-After" field, at least 1
+        """
+
+        # Client over its rate gets a token back after 1 / rate seconds, the others wait for the server to catch up
+        if reason == 'client rate' and self.clientRate:
+            return max(1, round(1 / self.clientRate))
+        return max(1, round(self.maxQueueDelay))
+
+    # End of retryAfter()
+
+
+
+    # Beginning of stats()
+
+    def stats(self):
+
+        """
+            Description:
+            Returns counters of admission control
+
+            Returns:
+            stats: Dictionary with connections let in and not yet closed, clients with a token bucket, and connections turned away by each check
+        """
+
+        return {'connections': self.connections, 'clients': len(self.buckets), **self.shed}
+
+    # End of stats()
+
+# End of AdmissionControl
+
+
+
+# Beginning of LingeringCloser
+
+class LingeringCloser:
+
+    """
+        Description:
+        Closes connections that were answered without their request being read. Sending side is shut down, so the client
+        sees the end of the response, and what the client still sends is read and dropped by a background thread
+        until the client closes or lingerTime runs out. Only then is the socket closed, so no reset is sent
+        while the response may still be unread
+
+        Arguments:
+        lingerTime:  Seconds a connection is kept open at most, waiting for the client to close it
+        maxSockets:  Most connections lingering at once, more are closed right away so a flood can not pile them up
+    """
+
+
+    # Beginning of __init__()
+
+    def __init__(self, lingerTime = 2.0, maxSockets = 1024):
+
+        self.lingerTime = lingerTime
+        self.maxSockets = maxSockets
+
+        # Sockets handed over and not yet taken by the closer thread. Appending and popping are atomic, so no lock is taken
+        self.handed = deque()
+        self.lingering = 0                  # Sockets handed over and not yet closed, checked against maxSockets
+        self.lock = threading.Lock()        # Guards lingering, it is counted up and down by different threads
+        self.closer = None                  # Background closer thread, started when first socket is handed over
+        self.wakeup = threading.Event()     # Wakes the closer thread up when it has nothing to wait on
+        self.startLock = threading.Lock()   # Makes sure only one closer thread is started
+
+        # Closer thread is not copied into forked worker processes, they start their own
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child = self.forked)
+
+    # End of __init__()
+
+
+
+    # Beginning of close()
+
+    def close(self, connectionSocket):
+
+        """
+            Description:
+            Shuts down the sending side of a connection and hands it to the closer thread.
+            Closes it right away if the client is already gone, or too many connections are lingering
+
+            Argument:
+            connectionSocket: A TCP socket connected to a client, the response is already sent
+        """
+
+
+        try:
+            connectionSocket.shutdown(socket.SHUT_WR)
+        except OSError:
+            connectionSocket.close()
+            return
+
+        with self.lock:
+            full = self.lingering >= self.maxSockets
+            if not full:
+                self.lingering += 1
+        if full:
+            connectionSocket.close()
+            return
+
+        connectionSocket.setblocking(False)
+        self.handed.append((connectionSocket, time.monotonic() + self.lingerTime))
+        self.closerStarter()
+        self.wakeup.set()
+
+    # End of close()
+
+
+
+    # Beginning of closerStarter()
+
+    def closerStarter(self):
+
+        """
+            Description:
+            Starts the background closer thread if it is not running yet
+        """
+
+        with self.startLock:
+            if self.closer is None:
+                self.closer = threading.Thread(target = self.closerLoop, name = 'lingering-closer', daemon = True)
+                self.closer.start()
+
+    # End of closerStarter()
+
+
+
+    # Beginning of closerLoop()
+
+    def closerLoop(self):
+
+        """
+            Description:
+            Runs in the closer thread. Reads and drops what lingering connections send,
+            and closes each one when the client closes it or its time runs out
+        """
+
+
+        selector = selectors.DefaultSelector()
+        while True:
+
+            # Nothing to wait on, sleeps until a socket is handed over. Event is cleared before the hand-off is emptied,
+            # so a socket handed over meanwhile sets it again
+            if not selector.get_map() and not self.handed:
+                self.wakeup.wait()
+            self.wakeup.clear()
+            while self.handed:
+                connectionSocket, deadline = self.handed.popleft()
+                selector.register(connectionSocket, selectors.EVENT_READ, deadline)
+
+            # Wakes up a few times a second, so sockets handed over and deadlines are seen soon enough
+            for key, _ in selector.select(timeout = 0.1):
+                try:
+                    data = key.fileobj.recv(65536)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except OSError:
+                    data = b''
+                if not data:
+                    self.socketCloser(selector, key.fileobj)
+
+            now = time.monotonic()
+            for key in list(selector.get_map().values()):
+                if now >= key.data:
+                    self.socketCloser(selector, key.fileobj)
+
+    # End of closerLoop()
+
+
+
+    # Beginning of socketCloser()
+
+    def socketCloser(self, selector, connectionSocket):
+
+        """
+            Description:
+            Stops waiting on a lingering connection and closes it
+
+            Arguments:
+            selector:         Selector of the closer thread
+            connectionSocket: The lingering connection
+        """
+
+        selector.unregister(connectionSocket)
+        connectionSocket.close()
+        with self.lock:
+            self.lingering -= 1
+
+    # End of socketCloser()
+
+
+
+    # Beginning of forked()
+
+    def forked(self):
+
+        """
+            Description:
+            Called in a newly forked process. Closer thread of the parent is not running here,
+            a new one is started when the process hands over its first socket.
+            Sockets handed over by the parent are left to the parent
+        """
+
+        self.handed = deque()
+        self.lingering = 0
+        self.lock = threading.Lock()
+        self.closer = None
+        self.wakeup = threading.Event()
+        self.startLock = threading.Lock()
+
+    # End of forked()
+
+# End of LingeringCloser
@@ -0,0 +1,566 @@
+"""
+    Runs the same webserver as webserver.py, but with asyncio.
+    Every connection is a coroutine in a single event loop, so many thousand connections
+    can be open at once in one process without a thread for each of them.
+
+    HTTP messages are read and written with the functions from webserver.py.
+    Response messages are written in a worker thread, since that is where files are read,
+    so a slow disk never blocks other connections.
+    Large files are streamed with sendfile, so they are never read into memory
+"""
+
+import asyncio          # imported so connections can be handled by coroutines in an event loop
+import argparse         # imported so arguments can be parsed
+import time             # imported so requests can be timed
+
+# Functions shared with webserver.py, settings of webserver.py are changed through the module
+import webserver
+from webserver import httpResponseBuilder, httpResponseWriter, httpResponseLength, httpResponseCloser, httpSendDeadline, \
+                      httpTimeoutFinder, fileCache, documentIndex, metrics, requestProfiler, accessLog
+from streaming import ResponseStream
+from httpparser import HttpRequestParser, HttpParseError
+
+
+# Beginning of main()
+
+def main():
+
+    """
+        Description:
+        The main method. It retreives arguments using argumentParser() function
+        and runs serverHandler() coroutine in an event loop until user interrupts server
+    """
+
+    # Saves arguments using argumentParser() function
+    arguments = argumentParser()
+
+    # Byte budget of the file cache, given in megabytes
+    fileCache.maxBytes = arguments.cache_size * 1024 * 1024
+    # "Cache-Control" field sent with files, empty string leaves it out
+    webserver.cacheControl = arguments.cache_control or None
+    # Persistent connections are closed after being idle this long, or after this many requests
+    webserver.keepAliveTimeout = arguments.keep_alive_timeout
+    webserver.keepAliveMaxRequests = arguments.max_requests
+    # Limits on slow and oversized requests, and on clients receiving responses slowly
+    webserver.requestTimeout = arguments.request_timeout
+    webserver.maxHeaderBytes = arguments.max_header_size * 1024
+    webserver.maxHeaderFields = arguments.max_header_fields
+    webserver.maxBodyBytes = arguments.max_body_size * 1024
+    webserver.minSendRate = arguments.min_send_rate
+    # Access log and status messages, "-" writes them to stdout. Configured first, so every message is written where and how it was asked for
+    accessLog.configure(level = arguments.log_level, logFormat = arguments.log_format,
+                        path = '' if arguments.log_file == '-' else arguments.log_file, sampleRate = arguments.log_sample,
+                        maxBytes = arguments.log_max_size * 1024 * 1024, backups = arguments.log_backups)
+    # Served directory is indexed once here, and rescanned for changes while server runs
+    documentIndex.rescanInterval = arguments.rescan_interval
+    documentIndex.scan()
+    accessLog.info('Indexed %s files in %s', len(documentIndex.documents), documentIndex.root)
+    # Phase timing and profiling, can also be turned on and off with SIGUSR2 and SIGUSR1 while server runs
+    requestProfiler.timing = arguments.timing
+    requestProfiler.profiling = arguments.profile
+    requestProfiler.signalInstaller()
+
+    # Runs serverHandler() in a new event loop
+    try:
+        asyncio.run(serverHandler(arguments.ip, arguments.port))
+
+    # In case of user interrupting server, event loop is stopped
+    except KeyboardInterrupt:
+        # Status message for log
+        accessLog.info('Received order to close server')
+
+    # Queued records are written before server exits
+    finally:
+        accessLog.close()
+
+# End of main()
+
+
+
+# Beginning of argumentParser()
+
+def argumentParser():
+
+    """
+        Description:
+        Creates an argument parser and retreives provided arguments from it
+        All arguments have default values, so server can be run without arguments
+
+        Returns:
+        arguments: Parsed arguments, with these attributes
+            ip:         IP-address of server
+            port:       port number to be attached to server socket
+            cache_size: Byte budget of the file cache in megabytes
+            cache_control:      "Cache-Control" field sent with files, empty string if it is left out
+            keep_alive_timeout: Seconds an idle persistent connection is kept open
+            max_requests:       Requests answered on one connection before it is closed
+            rescan_interval:    Seconds between rescans of the document index
+            timing:     True if requests are timed in phases from the start
+            profile:    True if requests are profiled from the start
+            log_level, log_format, log_file, log_sample, log_max_size, log_backups: Settings of the access log
+    """
+
+    # An argument parser with appropriate description
+    parser = argparse.ArgumentParser(description = 'Runs a webserver that handles all connections in an asyncio event loop')
+
+    # Argument for IP-address. Type is string. Is not required
+    parser.add_argument('-i', '--ip', type = str, default = '127.0.0.1',
+                        help = 'Server IP-address: IP adress server socket is bound to')
+    # Argument for port. Type is int. Is not required
+    parser.add_argument('-p', '--port', type = int, default = 6969,
+                        help = 'Socket port number: Port number attatched to server socket')
+    # Argument for size of file cache. Type is int. Is not required
+    parser.add_argument('-c', '--cache-size', type = int, default = 64,
+                        help = 'Cache size: Megabytes of requested files kept in memory, 0 turns cache off')
+    # Argument for Cache-Control field of sent files. Type is string. Is not required
+    parser.add_argument('-C', '--cache-control', type = str, default = webserver.cacheControl,
+                        help = 'Cache control: "Cache-Control" field sent with files, like "max-age=3600", '
+                               'an empty string leaves the field out')
+    # Argument for idle timeout of persistent connections. Type is int. Is not required
+    parser.add_argument('-t', '--keep-alive-timeout', type = int, default = webserver.keepAliveTimeout,
+                        help = 'Keep-alive timeout: Seconds a connection without requests is kept open')
+    # Argument for requests per connection. Type is int. Is not required
+    parser.add_argument('-x', '--max-requests', type = int, default = webserver.keepAliveMaxRequests,
+                        help = 'Max requests: Requests answered on one connection before it is closed')
+    # Arguments for limits on slow and oversized requests. Types are float and int. Are not required
+    parser.add_argument('--request-timeout', type = float, default = webserver.requestTimeout,
+                        help = 'Request timeout: Seconds a request may take to arrive from its first byte, slower ones get 408')
+    parser.add_argument('--max-header-size', type = int, default = webserver.maxHeaderBytes // 1024,
+                        help = 'Max header size: Kilobytes of request line and header fields, larger ones get 431')
+    parser.add_argument('--max-header-fields', type = int, default = webserver.maxHeaderFields,
+                        help = 'Max header fields: Header fields in one request, more get 431')
+    parser.add_argument('--max-body-size', type = int, default = webserver.maxBodyBytes // 1024,
+                        help = 'Max body size: Kilobytes of request body, larger ones get 413')
+    parser.add_argument('--min-send-rate', type = int, default = webserver.minSendRate,
+                        help = 'Min send rate: Bytes per second a client must receive a response at, after the first '
+                               f'{webserver.sendGrace} seconds, slower clients are closed. 0 for no limit')
+    # Argument for rescans of the document index. Type is float. Is not required
+    parser.add_argument('-R', '--rescan-interval', type = float, default = documentIndex.rescanInterval,
+                        help = 'Rescan interval: Seconds between checks of the served directory for added or removed files')
+    # Argument for phase timing. Is a flag. Is not required
+    parser.add_argument('-T', '--timing', action = 'store_true',
+                        help = 'Timing: Time every request in phases, send them in a "Server-Timing" field and log totals, '
+                               'SIGUSR2 turns it on or off while server runs')
+    # Argument for profiling. Is a flag. Is not required
+    parser.add_argument('-P', '--profile', action = 'store_true',
+                        help = 'Profile: Profile writing of every response with cProfile and keep profiles '
+                               'of the slowest requests, SIGUSR1 turns it on or off while server runs')
+    # Argument for log level. Type is string. Is not required
+    parser.add_argument('-L', '--log-level', type = str, choices = ['debug', 'info', 'warning', 'error'], default = 'info',
+                        help = 'Log level: Lowest level of status messages written, "debug" also writes every connection')
+    # Argument for format of access log. Type is string. Is not required
+    parser.add_argument('--log-format', type = str, choices = ['combined', 'json'], default = 'combined',
+                        help = 'Log format: "combined" writes Combined Log Format, "json" writes one JSON object per line')
+    # Argument for log file. Type is string. Is not required
+    parser.add_argument('--log-file', type = str, default = '-',
+                        help = 'Log file: File the log is written to, "-" writes it to stdout')
+    # Argument for sampling of access log. Type is float. Is not required
+    parser.add_argument('--log-sample', type = float, default = 1.0,
+                        help = 'Log sample: Share of requests written to the access log, between 0 and 1. '
+                               'Responses with status 500 or more are always written')
+    # Argument for size of log file. Type is int. Is not required
+    parser.add_argument('--log-max-size', type = int, default = 10,
+                        help = 'Log max size: Megabytes a log file grows to before it is rotated, 0 never rotates it')
+    # Argument for rotated log files. Type is int. Is not required
+    parser.add_argument('--log-backups', type = int, default = 5,
+                        help = 'Log backups: Number of rotated log files kept')
+
+    # Parses arguments
+    arguments = parser.parse_args()
+
+    # Connections must be kept open for some time and at least one request
+    if arguments.keep_alive_timeout < 1 or arguments.max_requests < 1:
+        parser.error('keep-alive timeout and max requests must be at least 1')
+    if arguments.request_timeout <= 0 or min(arguments.max_header_size, arguments.max_header_fields, arguments.max_body_size) < 1:
+        parser.error('request timeout must be more than 0, max header size, header fields and body size at least 1')
+    if arguments.min_send_rate < 0:
+        parser.error('min send rate can not be negative')
+    if arguments.rescan_interval <= 0:
+        parser.error('rescan interval must be more than 0')
+    if not 0 <= arguments.log_sample <= 1 or arguments.log_max_size < 0 or arguments.log_backups < 0:
+        parser.error('log sample must be between 0 and 1, log max size and log backups can not be negative')
+
+    return arguments
+
+# End of argumentParser()
+
+
+
+# Beginning of serverHandler()
+
+async def serverHandler(serverIP, serverPort):
+
+    """
+        Description:
+        Creates a server bound to provided IP-address and port.
+        Every accepted client is handled by its own connectionHandler() coroutine
+        Server runs until the event loop is stopped
+
+        Arguments:
+        serverIP:   IP-address of server
+        serverPort: port number to be attached to server socket
+    """
+
+
+    # Creates server, kernel may queue many connections waiting to be accepted
+    server = await asyncio.start_server(connectionHandler, serverIP, serverPort, backlog = 1024)
+    # Status message for log
+    accessLog.info('Server is ready to receive on port %s...', serverPort)
+
+
+    # Serves clients until event loop is stopped, server socket is closed afterwards
+    try:
+        async with server:
+            await server.serve_forever()
+
+    # Always executed after server is stopped
+    finally:
+        # Status message for log
+        accessLog.info('Closing server socket on port %s...', serverPort)
+        accessLog.info('File cache: %s', fileCache.stats())
+        accessLog.info('Document index: %s', documentIndex.stats())
+
+# End of serverHandler()
+
+
+
+# Beginning of connectionHandler()
+
+async def connectionHandler(reader, writer):
+
+    """
+        Description:
+        Coroutine that handles a connection.
+        Runs a loop that receives HTTP requests from- and sends HTTP response messages to client
+        If client disconnects, loop is broken and connection is closed
+        Connection is also closed after a response with "Connection: close", after keepAliveMaxRequests requests,
+        or when client has been idle for keepAliveTimeout seconds
+
+        If requested file exists, it is sent in an HTTP response message with "200 OK" as status
+        If unknown file is requested, an HTTP response message with "404 Not Found" as status is sent
+        If request message is malformed, an HTTP response message with "400 Bad Request" as status is sent
+        If an exception occurs, an HTTP response message with "500 Internal Server Error" as status is sent
+        and the connection is closed. Other connections are not affected
+
+        Arguments:
+        reader: Stream the HTTP request messages are read from
+        writer: Stream the HTTP response messages are written to
+    """
+
+
+    # Client IP and port number
+    clientAddress = writer.get_extra_info('peername')
+    metrics.connectionOpened()
+    # Status message for log
+    accessLog.debug('Connection established with %s on client port %s', clientAddress[0], clientAddress[1])
+
+
+    try:
+
+        # Parses request messages out of received bytes
+        parser = HttpRequestParser(webserver.maxHeaderBytes, webserver.maxHeaderFields, webserver.maxBodyBytes)
+        # Requests answered on this connection so far
+        requestsServed = 0
+
+        while True:     # Loop to ensure files can be requested several times
+
+            # Waits for client to send a full HTTP request message
+            try:
+                httpRequestMessage, receivedAt, parseStart = await httpRequestReceiver(reader, parser)
+
+            # Handles malformed request message
+            # Sends HTTP response with status from the parser, like "400 Bad Request", and closes connection
+            except HttpParseError as error:
+                httpResponseMessage = httpResponseWriter(error.status, 'close', f'<h1>{error.status}<h1>')
+                writer.write(httpResponseMessage)
+                metrics.requestRecorder(error.status, 0, len(httpResponseMessage))
+                accessLog.access(clientAddress, None, error.status, len(httpResponseMessage), 0)
+                # Error and status message for log
+                accessLog.warning('Malformed or too slow request message from %s: %s, appropriate response message sent, '
+                                  'closing connection socket...', clientAddress[0], error)
+                break
+
+            # Handles client being idle for too long, connection is closed without a response
+            except TimeoutError:
+                # Status message for log
+                accessLog.debug('Client has been idle for %s seconds, closing connection socket...',
+                                webserver.keepAliveTimeout)
+                break
+
+            # Handles client closing connection
+            if httpRequestMessage is None:
+                # Status message for log
+                accessLog.debug('Client has closed connection, closing connection socket...')
+                break
+
+            # Request is timed from when it has been received completely
+            requestStart = time.perf_counter()
+
+
+            # Responds to HTTP GET requests if possible
+            try:
+
+                # Writes HTTP response message in a worker thread, event loop keeps serving other connections meanwhile
+                # Status is 200 OK, 206 Partial Content, 304 Not Modified, 404 Not Found or 416 Range Not Satisfiable
+                trace, status, connection, httpResponseParts = await asyncio.to_thread(
+                    tracedResponseBuilder, httpRequestMessage, requestsServed, receivedAt, parseStart)
+                requestsServed += 1
+
+                # Sends HTTP response to client, streamed bodies are counted after they are sent
+                await httpResponseSender(writer, httpResponseParts)
+                sentBytes = httpResponseLength(httpResponseParts)
+                requestDuration = time.perf_counter() - requestStart
+                metrics.requestRecorder(status, requestDuration, sentBytes)
+                accessLog.access(clientAddress, httpRequestMessage, status, sentBytes, requestDuration)
+                # Kept profile is written to disk in a worker thread, so the event loop never waits for the disk
+                keptProfile = requestProfiler.traceRecorder(trace, status, httpRequestMessage.target)
+                if keptProfile is not None:
+                    await asyncio.to_thread(requestProfiler.profileWriter, *keptProfile)
+
+                # Connection is closed after response is sent if client asked for it, or it has served enough requests
+                if connection == 'close':
+                    break
+
+
+            # Handles client going away while a response is sent, like in the middle of a streamed body,
+            # or receiving it slower than minSendRate. Nothing more can be sent, connection is closed without a response
+            except (ConnectionError, TimeoutError) as error:
+                # Status message for log
+                accessLog.debug('Client went away or received too slowly while response was sent: %s, '
+                                'closing connection socket...', repr(error))
+                break
+
+            # Handles any other exception
+            # Sends HTTP response with "500 Internal Server Error" as status and closes connection
+            except Exception as error:
+
+                # writes HTTP response message with "500 Internal Server Error" as status
+                status = '500 Internal Server Error'                                # HTTP status
+                connection = 'close'                                                # Close the connection
+                data = '<h1>Oh no<h1>'                                              # very simple HTML data
+                httpResponseMessage = httpResponseWriter(status, connection, data)  # HTTP response message
+
+                # Sends HTTP response to client
+                writer.write(httpResponseMessage)
+                requestDuration = time.perf_counter() - requestStart
+                metrics.requestRecorder(status, requestDuration, len(httpResponseMessage))
+                accessLog.access(clientAddress, httpRequestMessage, status, len(httpResponseMessage), requestDuration)
+                # Error and status message for log
+                accessLog.error('An error has occured: %s, appropriate response message sent, closing connection socket...',
+                                error)
+                break
+
+
+    # Always executed after loop is exited
+    finally:
+        # Closes connection, client may already be gone
+        metrics.connectionClosed()
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+# End of connectionHandler()
+
+
+
+# Beginning of httpRequestReceiver()
+
+async def httpRequestReceiver(reader, parser):
+
+    """
+        Description:
+        Waits until parser has a complete HTTP request message, feeding it bytes as they are received
+        Request messages received earlier, like pipelined ones, are returned without waiting
+
+        Raises HttpParseError if received bytes are not a valid request message,
+        or with "408 Request Timeout" if a request has not arrived completely within requestTimeout seconds of its first bytes
+        Raises TimeoutError if client sends nothing for keepAliveTimeout seconds
+
+        Arguments:
+        reader: Stream the HTTP request messages are read from
+        parser: HttpRequestParser of the connection
+
+        Returns:
+        httpRequestMessage: The parsed request message, None if client closed connection
+        receivedAt:         Time in nanoseconds from perf_counter_ns() the first bytes of the request arrived
+        parseStart:         Time in nanoseconds from perf_counter_ns() the request message was parsed
+    """
+
+
+    receivedAt = parseStart = time.perf_counter_ns()
+    requestDeadline = time.monotonic() + webserver.requestTimeout     # Time request must have arrived completely by
+    httpRequestMessage = parser.next()
+
+    # Waits for more bytes until a request message is complete
+    while httpRequestMessage is None:
+        waiting = not parser.pending()      # No bytes of the next request have arrived yet
+
+        # Idle client may wait keepAliveTimeout seconds before a request, a request that has started must be done in time
+        try:
+            timeout = webserver.keepAliveTimeout if waiting else httpTimeoutFinder(requestDeadline)
+            received = await asyncio.wait_for(reader.read(65536), timeout)
+        except ConnectionError:
+            return None, receivedAt, parseStart
+        except TimeoutError:
+            if waiting:
+                raise
+            raise HttpParseError('408 Request Timeout',
+                                 f'request was not received within {webserver.requestTimeout} seconds') from None
+
+        # Client has closed connection
+        if not received:
+            return None, receivedAt, parseStart
+
+        if waiting:
+            receivedAt = time.perf_counter_ns()
+            requestDeadline = time.monotonic() + webserver.requestTimeout
+        parser.feed(received)
+        parseStart = time.perf_counter_ns()
+        httpRequestMessage = parser.next()
+
+    return httpRequestMessage, receivedAt, parseStart
+
+# End of httpRequestReceiver()
+
+
+
+# Beginning of tracedResponseBuilder()
+
+def tracedResponseBuilder(httpRequestMessage, requestsServed, receivedAt, parseStart):
+
+    """
+        Description:
+        Runs httpResponseBuilder() in a worker thread, tracing the request if phase timing or profiling is on
+        Profiling is started and stopped in the worker thread, since cProfile only profiles the thread it is started in,
+        so the event loop's other connections never end up in the profile, nor does sending the response.
+        Parse phase includes waiting for a free worker thread, since the trace is started here
+
+        Arguments:
+        httpRequestMessage: An HTTP GET request message asking for specific file, parsed by HttpRequestParser
+        requestsServed:     Requests answered on the connection before this one
+        receivedAt:         Time in nanoseconds from perf_counter_ns() the first bytes of the request arrived
+        parseStart:         Time in nanoseconds from perf_counter_ns() the request message was parsed
+
+        Returns:
+        trace:             RequestTrace of the request, None if it is not traced
+        status:            HTTP status of the response message
+        connection:        Either "keep-alive" or "close", telling if connection is closed after the response
+        httpResponseParts: HTTP response message as a list of parts
+    """
+
+
+    trace = requestProfiler.start(receivedAt, parseStart)
+
+    try:
+        status, connection, httpResponseParts = httpResponseBuilder(httpRequestMessage, requestsServed, trace)
+
+    # Always executed, worker thread must not be left profiling when it is handed the next request
+    finally:
+        if trace is not None and trace.profile is not None:
+            trace.profile.disable()
+
+    return trace, status, connection, httpResponseParts
+
+# End of tracedResponseBuilder()
+
+
+
+# Beginning of httpResponseSender()
+
+async def httpResponseSender(writer, httpResponseParts):
+
+    """
+        Description:
+        Sends an HTTP response message written by httpResponseBuilder() to client
+        Bytes are written to the stream, file parts are sent with sendfile straight from disk
+        Waits whenever client is receiving slower than server is sending
+        Streamed bodies are produced a chunk at a time in a worker thread, since producing may read from disk,
+        and the next chunk is only produced once the one before it has been taken by the client.
+        Producing stops when client goes away
+        Files and streams in the parts are always closed, also if sending fails
+        Raises TimeoutError if client receives slower than minSendRate, after the first sendGrace seconds.
+        Time spent producing chunks of a streamed body does not count
+
+        Arguments:
+        writer:            Stream the HTTP response message is written to
+        httpResponseParts: HTTP response message as a list of parts
+    """
+
+
+    # Time sending started and bytes written so far, they give the time the bytes must be sent by
+    sendStart = time.monotonic()
+    sentBytes = 0
+
+    try:
+        for part in httpResponseParts:
+
+            # Part is a streamed body, chunks are sent as they are produced until it ends or client goes away
+            if isinstance(part, ResponseStream):
+                while True:
+                    # Time spent producing the chunk is server's, not client's, so it is left out of the rate
+                    produceStart = time.monotonic()
+                    frame = await asyncio.to_thread(part.nextFrame)
+                    sendStart += time.monotonic() - produceStart
+                    if frame is None:
+                        break
+                    if writer.transport.is_closing():
+                        raise ConnectionResetError('client closed connection while body was streamed')
+                    writer.write(frame)
+                    sentBytes += len(frame)
+                    await httpDrainer(writer, httpSendDeadline(sendStart, sentBytes))
+                continue
+
+            # Part is bytes
+            if not isinstance(part, tuple):
+                writer.write(part)
+                sentBytes += len(part)
+                continue
+
+            # Part is count bytes from offset in an open file, bytes written before it are sent first
+            # File is sent a block at a time, so the rate is checked between blocks
+            responseFile, offset, count = part
+            await httpDrainer(writer, httpSendDeadline(sendStart, sentBytes))
+            for blockOffset in range(offset, offset + count, webserver.sendBlockSize):
+                blockCount = min(webserver.sendBlockSize, offset + count - blockOffset)
+                sentBytes += blockCount
+                deadline = httpSendDeadline(sendStart, sentBytes)
+                await asyncio.wait_for(asyncio.get_running_loop().sendfile(writer.transport, responseFile, blockOffset, blockCount),
+                                       None if deadline is None else httpTimeoutFinder(deadline))
+
+        await httpDrainer(writer, httpSendDeadline(sendStart, sentBytes))
+
+    # Always executed, also if sending fails
+    finally:
+        httpResponseCloser(httpResponseParts)
+
+# End of httpResponseSender()
+
+
+
+# Beginning of httpDrainer()
+
+async def httpDrainer(writer, deadline):
+
+    """
+        Description:
+        Waits until bytes written to the stream have been handed to the kernel, or until deadline
+
+        Arguments:
+        writer:   Stream bytes were written to
+        deadline: Time from time.monotonic() bytes must be sent by, None to wait as long as it takes.
+                  Raises TimeoutError after it
+    """
+
+    if deadline is None:
+        await writer.drain()
+    else:
+        await asyncio.wait_for(writer.drain(), httpTimeoutFinder(deadline))
+
+# End of httpDrainer()
+
+
+
+if __name__ == '__main__':  # runs the main method
+    main()
@@ -0,0 +1,718 @@
+"""
+    Benchmark suite for the webservers.
+    Starts every server mode on loopback, one fresh server for every workload, and drives it with the load mode of client.py.
+    While a workload runs, the server's processes are sampled from /proc, so memory, threads and CPU time are recorded with the results
+
+    Workloads:
+    small-file:      Many connections asking for a small HTML file over and over
+    large-file:      A few connections asking for a large file, which is streamed with sendfile
+    404-storm:       Many connections asking for files that do not exist
+    idle-keep-alive: Small files are asked for while hundreds of other connections are open and idle
+    slow-clients:    Small files are asked for while other clients send their requests and read their responses a byte at a time
+
+    Results are written as JSON and CSV, and can be compared against the results of an earlier run,
+    so a change that makes a server slower is seen before it is used
+"""
+
+import argparse         # imported so arguments can be parsed
+import subprocess       # imported so servers can be started as their own processes
+import threading        # imported so servers can be sampled while load is generated
+import socket           # imported so idle and slow clients can be made, and free ports found
+import tempfile         # imported so files served by the benchmark are kept out of the repository
+import platform         # imported so results tell which system they were measured on
+import signal           # imported so servers can be stopped like a user would stop them
+import json             # imported so results can be written in a machine-readable form
+import csv              # imported so results can be opened in a spreadsheet
+import time             # imported so the benchmark can wait for servers
+import sys              # imported so servers are run with the same Python as the benchmark
+import os               # imported so processes can be read from /proc
+
+from client import loadRunner    # imported so load is generated the same way as client.py does it
+
+
+# Directory the servers are in
+repository = os.path.dirname(os.path.abspath(__file__))
+
+# Every server mode, and how it is started on a port
+serverModes = {
+    'webserver':  lambda port: [sys.executable, '-c', f'import webserver; webserver.serverHandler("127.0.0.1", {port})'],
+    'threads':    lambda port: [sys.executable, os.path.join(repository, 'multithreading-webserver.py'), '-p', str(port), '-m', 'threads'],
+    'selectors':  lambda port: [sys.executable, os.path.join(repository, 'multithreading-webserver.py'), '-p', str(port), '-m', 'selectors'],
+    'prefork':    lambda port: [sys.executable, os.path.join(repository, 'multithreading-webserver.py'), '-p', str(port), '-m', 'prefork'],
+    'asyncio':    lambda port: [sys.executable, os.path.join(repository, 'asyncio-webserver.py'), '-p', str(port)]
+}
+
+# Every workload, with the files asked for, connections asking for them, and clients running alongside them
+workloads = {
+    'small-file':      {'files': ['small.html'], 'concurrency': 16},
+    'large-file':      {'files': ['large.bin'], 'concurrency': 4},
+    '404-storm':       {'files': [f'missing-{number}.html' for number in range(64)], 'concurrency': 16},
+    'idle-keep-alive': {'files': ['small.html'], 'concurrency': 8, 'idle': 256},
+    'slow-clients':    {'files': ['small.html'], 'concurrency': 8, 'slow': 32}
+}
+
+
+# Beginning of main()
+
+def main():
+
+    """
+        Description:
+        The main method. It retreives arguments using argumentParser() function,
+        runs every chosen workload against every chosen server mode, and writes the results
+    """
+
+
+    # Saves arguments using argumentParser() function
+    arguments = argumentParser()
+
+    # Files served by every server, written once
+    documentRoot = tempfile.mkdtemp(prefix = 'benchmark-')
+    documentRootWriter(documentRoot)
+
+
+    results = []
+    try:
+        for mode in arguments.modes:
+            for workload in arguments.workloads:
+                # Status message for console
+                print(f'Running {workload} against {mode} for {arguments.duration} seconds...')
+
+                result = benchmarkRunner(mode, workload, documentRoot, arguments.duration, arguments.processes)
+                results.append(result)
+
+                # Status message for console
+                print(f'  {result["throughput"]} requests/s, p99 {result["p99"]} ms, {result["errors"]} errors, '
+                      f'peak RSS {result["peakRssMB"]} MB, {result["threads"]} threads, {result["cpuSeconds"]} s CPU')
+
+    # In case of user interrupting benchmark, results measured so far are still written
+    except KeyboardInterrupt:
+        # Status message for console
+        print('Received order to stop benchmark, writing results measured so far')
+
+
+    # Writes results, and compares them against an earlier run if asked to
+    report = {
+        'commit': commitFinder(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'duration': arguments.duration,
+        'results': results
+    }
+    reportWriter(report, arguments.output)
+
+    if arguments.compare:
+        with open(arguments.compare) as compareFile:
+            print(reportComparer(json.load(compareFile), report))
+
+# End of main()
+
+
+
+# Beginning of argumentParser()
+
+def argumentParser():
+
+    """
+        Description:
+        Creates an argument parser and retreives provided arguments from it
+        All arguments have default values, so benchmark can be run without arguments
+
+        Returns:
+        arguments: Parsed arguments, with these attributes
+            modes:     Server modes that are benchmarked
+            workloads: Workloads every server mode is benchmarked with
+            duration:  Seconds every workload runs for
+            processes: Processes generating load
+            output:    Path results are written to, without extension. ".json" and ".csv" are added
+            compare:   JSON results of an earlier run the results are compared against, None to not compare
+    """
+
+    # An argument parser with appropriate description
+    parser = argparse.ArgumentParser(description = 'Benchmarks every webserver mode with a set of workloads on loopback')
+
+    parser.add_argument('-m', '--modes', type = str, nargs = '+', choices = list(serverModes), default = list(serverModes),
+                        help = 'Server modes: Modes that are benchmarked, all of them by default')
+    parser.add_argument('-w', '--workloads', type = str, nargs = '+', choices = list(workloads), default = list(workloads),
+                        help = 'Workloads: Workloads every mode is benchmarked with, all of them by default')
+    parser.add_argument('-d', '--duration', type = float, default = 5,
+                        help = 'Duration: Seconds every workload runs for. Is 5 by default')
+    parser.add_argument('-n', '--processes', type = int, default = os.cpu_count() or 1,
+                        help = 'Processes: Processes generating load, one per CPU core by default')
+    parser.add_argument('-o', '--output', type = str, default = 'benchmark-results',
+                        help = 'Output: Path results are written to, ".json" and ".csv" are added to it')
+    parser.add_argument('-c', '--compare', type = str,
+                        help = 'Compare: JSON results of an earlier run, throughput and latency are compared against it')
+
+    # Parses arguments
+    arguments = parser.parse_args()
+
+    if arguments.duration <= 0 or arguments.processes < 1:
+        parser.error('duration must be above 0 and processes at least 1')
+
+    return arguments
+
+# End of argumentParser()
+
+
+
+# Beginning of documentRootWriter()
+
+def documentRootWriter(documentRoot):
+
+    """
+        Description:
+        Writes the files the workloads ask for. Contents are the same in every run, so runs can be compared
+
+        Argument:
+        documentRoot: Directory the servers serve files from
+    """
+
+    # Small HTML file, about 4 KB
+    with open(os.path.join(documentRoot, 'small.html'), 'w') as smallFile:
+        smallFile.write('<!DOCTYPE html>\n<title>Benchmark</title>\n' + '<p>Halla Balla</p>\n' * 220)
+
+    # Large file, 8 MB, streamed by the servers instead of cached
+    with open(os.path.join(documentRoot, 'large.bin'), 'wb') as largeFile:
+        largeFile.write(bytes(range(256)) * (8 * 1024 * 4))
+
+# End of documentRootWriter()
+
+
+
+# Beginning of benchmarkRunner()
+
+def benchmarkRunner(mode, workload, documentRoot, duration, processes):
+
+    """
+        Description:
+        Starts a fresh server of mode, runs workload against it, and stops it again
+        A fresh server for every workload means memory and CPU time of one workload never count for another
+
+        Arguments:
+        mode:         Server mode, a key of serverModes
+        workload:     Workload, a key of workloads
+        documentRoot: Directory the server serves files from
+        duration:     Seconds the workload runs for
+        processes:    Processes generating load
+
+        Returns:
+        result: Dictionary with the results of the workload
+    """
+
+
+    settings = workloads[workload]
+    port = freePortFinder()
+    server = serverStarter(mode, port, documentRoot)
+
+    # Clients running alongside the measured ones, stopped when the workload is done
+    stop = threading.Event()
+    helpers = []
+    idleSockets = []
+    try:
+
+        # Idle connections are opened first, so the server holds them while the workload runs
+        idleSockets = idleClientOpener(port, settings.get('idle', 0))
+        if settings.get('slow'):
+            helpers.append(threading.Thread(target = slowClientRunner, args = (port, settings['slow'], stop), daemon = True))
+        for helper in helpers:
+            helper.start()
+
+        # Server is sampled while the workload runs
+        sampler = ProcessSampler(server.pid)
+        sampler.start()
+
+        load = loadRunner({
+            'serverIP': '127.0.0.1',
+            'serverPort': port,
+            'files': settings['files'],
+            'concurrency': settings['concurrency'],
+            'requests': 1,
+            'duration': duration,
+            'rate': None,
+            'connection': 'keep-alive',
+            'timeout': 5
+        }, processes)
+
+        usage = sampler.stop()
+
+    # Server and helper clients are always stopped, also if the workload fails
+    finally:
+        stop.set()
+        for helper in helpers:
+            helper.join()
+        for idleSocket in idleSockets:
+            idleSocket.close()
+        serverStopper(server)
+
+
+    return {
+        'mode': mode,
+        'workload': workload,
+        'throughput': load['throughput'],
+        'requests': load['requests'],
+        'errors': load['errors'],
+        'statuses': load['statuses'],
+        'p50': load['latencyMs']['p50'],
+        'p90': load['latencyMs']['p90'],
+        'p99': load['latencyMs']['p99'],
+        'p99.9': load['latencyMs']['p99.9'],
+        'max': load['latencyMs']['max'],
+        'bytesPerSecond': load['bytesPerSecond'],
+        **usage
+    }
+
+# End of benchmarkRunner()
+
+
+
+# Beginning of freePortFinder()
+
+def freePortFinder():
+
+    """
+        Description:
+        Finds a port on loopback no other socket is bound to
+
+        Returns:
+        port: The free port number
+    """
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+# End of freePortFinder()
+
+
+
+# Beginning of serverStarter()
+
+def serverStarter(mode, port, documentRoot):
+
+    """
+        Description:
+        Starts a server in its own process, serving files from documentRoot, and waits until it accepts connections
+        Status messages of the server are thrown away, so the console stays readable
+        Raises RuntimeError if server does not accept connections within 10 seconds
+
+        Arguments:
+        mode:         Server mode, a key of serverModes
+        port:         Port the server is bound to
+        documentRoot: Directory the server serves files from
+
+        Returns:
+        server: The server process
+    """
+
+
+    # Servers are imported from the repository, but serve files from documentRoot
+    environment = dict(os.environ, PYTHONPATH = repository + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    server = subprocess.Popen(serverModes[mode](port), cwd = documentRoot, env = environment,
+                              stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, start_new_session = True)
+
+    # Waits until server accepts connections
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout = 1).close()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.05)
+
+    serverStopper(server)
+    raise RuntimeError(f'{mode} server did not start on port {port}')
+
+# End of serverStarter()
+
+
+
+# Beginning of serverStopper()
+
+def serverStopper(server):
+
+    """
+        Description:
+        Stops a server like a user would, with ctrl+c, and kills it and its worker processes if it does not stop
+
+        Argument:
+        server: The server process
+    """
+
+    if server.poll() is None:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout = 5)
+        except subprocess.TimeoutExpired:
+            pass
+
+    # Worker processes of prefork mode are in the same process group as the server
+    try:
+        os.killpg(server.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    server.wait()
+
+# End of serverStopper()
+
+
+
+# Beginning of idleClientOpener()
+
+def idleClientOpener(port, count):
+
+    """
+        Description:
+        Opens connections that ask for one file and then stay idle, like browsers keeping connections for later
+        Responses are never read, so opening them does not wait for a server that handles one connection at a time
+
+        Arguments:
+        port:  Port the server is bound to
+        count: Number of idle connections
+
+        Returns:
+        idleSockets: The open sockets, closed by the caller when the workload is done
+    """
+
+    idleSockets = []
+    for _ in range(count):
+        try:
+            idleSocket = socket.create_connection(('127.0.0.1', port), timeout = 1)
+            idleSocket.sendall(b'GET /small.html HTTP/1.1\r\nHost: benchmark\r\n\r\n')
+            idleSockets.append(idleSocket)
+        except OSError:
+            break
+
+    return idleSockets
+
+# End of idleClientOpener()
+
+
+
+# Beginning of slowClientRunner()
+
+def slowClientRunner(port, count, stop):
+
+    """
+        Description:
+        Runs slow clients until stop is set. Every client sends its request a byte every 100 ms,
+        then reads the response 64 bytes every 100 ms, and connects again when the server has closed the connection
+
+        Arguments:
+        port:  Port the server is bound to
+        count: Number of slow clients
+        stop:  Event that is set when the workload is done
+    """
+
+
+    request = b'GET /small.html HTTP/1.1\r\nHost: benchmark\r\nConnection: close\r\n\r\n'
+    clients = [None] * count        # Every client is [socket, bytes of request sent]
+
+    while not stop.is_set():
+        for index, client in enumerate(clients):
+            try:
+                # Client connects again when it has no connection
+                if client is None:
+                    slowSocket = socket.create_connection(('127.0.0.1', port), timeout = 1)
+                    slowSocket.setblocking(False)
+                    client = clients[index] = [slowSocket, 0]
+
+                # Sends the next byte of the request, or reads a bit of the response
+                if client[1] < len(request):
+                    client[1] += client[0].send(request[client[1]:client[1] + 1])
+                elif not client[0].recv(64):
+                    client[0].close()
+                    clients[index] = None
+
+            except BlockingIOError:
+                pass
+            except OSError:
+                if client is not None:
+                    client[0].close()
+                clients[index] = None
+
+        stop.wait(0.1)
+
+    for client in clients:
+        if client is not None:
+            client[0].close()
+
+# End of slowClientRunner()
+
+
+
+# Beginning of ProcessSampler
+
+class ProcessSampler:
+
+    """
+        Description:
+        Samples a server process and its worker processes from /proc every 100 ms in a thread
+        Records peak memory, most threads at once, and CPU time used while sampling. Only works on Linux,
+        on other systems the results are None
+
+        Argument:
+        pid: Process id of the server
+    """
+
+
+    # Beginning of __init__()
+
+    def __init__(self, pid):
+
+        self.pid = pid                          # Process id of the server
+        self.stopped = threading.Event()        # Set when sampling should stop
+        self.peakRss = 0                        # Most resident memory of all processes at once, in bytes
+        self.peakThreads = 0                    # Most threads of all processes at once
+        self.thread = threading.Thread(target = self.run, daemon = True)
+
+        # CPU time before sampling starts, so starting the server is not counted
+        self.startCpu = self.sample()[2]
+
+    # End of __init__()
+
+
+
+    # Beginning of start()
+
+    def start(self):
+
+        """
+            Description:
+            Starts sampling in a thread
+        """
+
+        self.thread.start()
+
+    # End of start()
+
+
+
+    # Beginning of run()
+
+    def run(self):
+
+        """
+            Description:
+            Samples until stop() is called
+        """
+
+        while not self.stopped.wait(0.1):
+            self.sample()
+
+    # End of run()
+
+
+
+    # Beginning of stop()
+
+    def stop(self):
+
+        """
+            Description:
+            Stops sampling and takes one last sample
+
+            Returns:
+            usage: Dictionary with peakRssMB, threads and cpuSeconds, None where /proc could not be read
+        """
+
+        self.stopped.set()
+        self.thread.join()
+        _, _, cpu = self.sample()
+
+        if self.startCpu is None or cpu is None:
+            return {'peakRssMB': None, 'threads': None, 'cpuSeconds': None}
+
+        return {
+            'peakRssMB': round(self.peakRss / 1024 / 1024, 1),
+            'threads': self.peakThreads,
+            'cpuSeconds': round(cpu - self.startCpu, 3)
+        }
+
+    # End of stop()
+
+
+
+    # Beginning of sample()
+
+    def sample(self):
+
+        """
+            Description:
+            Reads memory, threads and CPU time of the server and its worker processes, and updates the peaks
+
+            Returns:
+            rss:     Resident memory of all processes in bytes, None if /proc could not be read
+            threads: Threads of all processes, None if /proc could not be read
+            cpu:     CPU time of all processes in seconds, worker processes that have exited included
+        """
+
+
+        rss = threads = 0
+        cpu = 0.0
+        ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+        try:
+            for pid in [self.pid] + processChildren(self.pid):
+                # Memory and threads are in status, like "VmRSS:    12345 kB"
+                with open(f'/proc/{pid}/status') as statusFile:
+                    for line in statusFile:
+                        if line.startswith('VmRSS:'):
+                            rss += int(line.split()[1]) * 1024
+                        elif line.startswith('Threads:'):
+                            threads += int(line.split()[1])
+
+                # CPU time is in stat, fields after the process name: user, system, and the same for exited children
+                with open(f'/proc/{pid}/stat') as statFile:
+                    fields = statFile.read().rpartition(')')[2].split()
+                    cpu += sum(int(field) for field in fields[11:15]) / ticks
+
+        except (OSError, ValueError):
+            return None, None, None
+
+        self.peakRss = max(self.peakRss, rss)
+        self.peakThreads = max(self.peakThreads, threads)
+        return rss, threads, cpu
+
+    # End of sample()
+
+# End of ProcessSampler
+
+
+
+# Beginning of processChildren()
+
+def processChildren(pid):
+
+    """
+        Description:
+        Finds the child processes of a process, like the worker processes of prefork mode
+
+        Argument:
+        pid: Process id of the parent
+
+        Returns:
+        children: List of process ids of the children
+    """
+
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as statFile:
+                # Parent process id is the second field after the process name
+                if int(statFile.read().rpartition(')')[2].split()[1]) == pid:
+                    children.append(int(entry))
+        except (OSError, ValueError, IndexError):
+            pass
+
+    return children
+
+# End of processChildren()
+
+
+
+# Beginning of commitFinder()
+
+def commitFinder():
+
+    """
+        Description:
+        Finds the git commit the benchmark is run on, so results can be matched with the code they measured
+
+        Returns:
+        commit: Hash of the commit, with "-dirty" added if files have changed since, None if git is not available
+    """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = repository, capture_output = True,
+                                text = True, check = True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd = repository,
+                               capture_output = True, text = True, check = True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# End of commitFinder()
+
+
+
+# Beginning of reportWriter()
+
+def reportWriter(report, output):
+
+    """
+        Description:
+        Writes results as JSON, with the details of the run, and as CSV, one row per mode and workload
+
+        Arguments:
+        report: Dictionary with the details of the run and its results
+        output: Path results are written to, without extension
+    """
+
+    with open(output + '.json', 'w') as jsonFile:
+        json.dump(report, jsonFile, indent = 2)
+
+    columns = ['mode', 'workload', 'throughput', 'requests', 'errors', 'p50', 'p90', 'p99', 'p99.9', 'max',
+               'bytesPerSecond', 'peakRssMB', 'threads', 'cpuSeconds']
+    with open(output + '.csv', 'w', newline = '') as csvFile:
+        writer = csv.DictWriter(csvFile, fieldnames = ['commit'] + columns, extrasaction = 'ignore')
+        writer.writeheader()
+        for result in report['results']:
+            writer.writerow(dict(result, commit = report['commit']))
+
+    # Status message for console
+    print(f'Results written to {output}.json and {output}.csv')
+
+# End of reportWriter()
+
+
+
+# Beginning of reportComparer()
+
+def reportComparer(before, after):
+
+    """
+        Description:
+        Compares throughput and p99 latency of two runs, for every mode and workload both have results for
+
+        Arguments:
+        before: JSON results of the earlier run
+        after:  Results of this run
+
+        Returns:
+        comparison: The comparison as a table in the form of a string
+    """
+
+
+    earlier = {(result['mode'], result['workload']): result for result in before['results']}
+
+    lines = [f'Compared against {before.get("commit")}:',
+             f'  {"mode":<10} {"workload":<16} {"throughput":>22} {"p99 ms":>24}']
+
+    for result in after['results']:
+        old = earlier.get((result['mode'], result['workload']))
+        if old is None:
+            continue
+
+        # Change in percent, positive means more
+        def change(name):
+            return f'{(result[name] - old[name]) / old[name] * 100:+.1f} %' if old[name] else 'n/a'
+
+        lines.append(f'  {result["mode"]:<10} {result["workload"]:<16} '
+                     f'{old["throughput"]:>9} -> {result["throughput"]:<9} {change("throughput"):>9} '
+                     f'{old["p99"]:>8} -> {result["p99"]:<8} {change("p99"):>9}')
+
+    return '\n'.join(lines)
+
+# End of reportComparer()
+
+
+
+if __name__ == '__main__':  # runs the main method
+    main()
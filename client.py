@@ -1,7 +1,20 @@
-
 from socket import *    # imported to program with sockets
 import argparse         # imported so arguments can be parsed
 import sys              # imported so program can be terminated
+import os               # imported so number of CPU cores can be found
+import time             # imported so latency and throughput can be measured
+import math             # imported so latencies can be sorted into logarithmic buckets
+import json             # imported so load test results can be written in a machine-readable form
+import threading        # imported so each load process can hold many connections at once
+import multiprocessing  # imported so load is generated by several processes, not limited to one CPU core
+import asyncio          # imported so many files can be fetched at once in one thread
+import urllib.parse     # imported so files can be given as URLs
+import queue            # imported so waiting for results of load processes can time out
+from collections import Counter     # imported so responses can be counted by status
+
+
+# Bytes received at a time when a file is downloaded to disk. One buffer of this size is used for every download
+downloadBufferSize = 256 * 1024
 
 
 # Beginning of main()
@@ -11,22 +24,45 @@ def main():
     """
         Description:
         The main method. It retreives arguments using argumentParser() function
-        and then prints HTTP response message from httpMessageHandler() function.
+        and then prints HTTP response messages from httpMessageHandler() function.
+        Every requested file is fetched over the same connection when server keeps it open
+
+        With an output directory, downloadHandler() streams the files to disk instead, and resumes interrupted downloads
+        In asyncio mode, fetchHandler() fetches all files at once and streams them to disk or console
+        In load mode, loadHandler() sends requests to the server as fast as it can, or at a given rate,
+        and prints throughput and latency instead
 
-        In case of error, program is terminated 
+        In case of error, program is terminated
     """
 
 
     try:
 
         # Saves arguments using argumentParser() function
-        ip, port, file = argumentParser()
+        arguments = argumentParser()
+
+        # Load test, results are printed by loadHandler()
+        if arguments.load:
+            loadHandler(arguments)
+            return
+
+        # Files are fetched at once with asyncio, and written to disk or console by fetchHandler()
+        if arguments.asyncio:
+            fetchHandler(arguments)
+            return
+
+        # Files are downloaded to disk one after another by downloadHandler()
+        if arguments.output:
+            downloadHandler(arguments)
+            return
+
+        # Saves HTTP response messages from httpMessageHandler()
+        httpResponseMessages = httpMessageHandler(arguments.ip, arguments.port, arguments.file)
 
-        # Saves an HTTP response message from httpMessageHandler()
-        httpResponseMessage = httpMessageHandler(ip, port, file)
-        # Prints HTTP response message to console
-        print(f'HTTP response message received:\n' \
-              f'{httpResponseMessage}')
+        # Prints HTTP response messages to console
+        for httpResponseMessage in httpResponseMessages:
+            print(f'HTTP response message received:\n' \
+                  f'{httpResponseMessage}')
 
 
     # Handles exceptions
@@ -35,9 +71,9 @@ def main():
 
         # Error and status message for console
         print(f'An error has occured: {error}\n' \
-              'exiting program...')  
+              'exiting program...')
 
-# End of main()    
+# End of main()
 
 
 
@@ -50,40 +86,97 @@ def argumentParser():
         Creates an argument parser and retreives provided arguments from it
 
         Returns:
-        ip:   IP-address of server interface
-        port: Port number attached to server socket user wants to connect to
-        file: File user wants to retreive from server
+        arguments: Parsed arguments, with these attributes
+            ip:          IP-address of server interface
+            port:        Port number attached to server socket user wants to connect to
+            file:        List of files user wants to retreive from server
+            timeout:     Seconds to wait for server before giving up, in load and asyncio mode
+            load:        True if client runs a load test instead of printing responses
+            concurrency: Connections open at once in load mode
+            requests:    Requests sent in load mode
+            duration:    Seconds load mode runs for, None if it stops after requests
+            rate:        Requests per second sent in load mode, None to send as fast as server answers
+            keep_alive:  "on" to reuse connections in load mode, "off" to use a new one for every request
+            processes:   Processes sending requests in load mode
+            json:        File load test results are written to as JSON, "-" for console, None to not write them
+            asyncio:         True if files are fetched at once with asyncio
+            max_connections: Most connections to one server in asyncio mode
+            pipeline:        Most requests sent on a connection before reading responses in asyncio mode
+            output:          Directory files are downloaded to, None to print them to console
     """
 
     # An argument parser with appropriate description
-    parser = argparse.ArgumentParser(description = 'Attempts to connect to a server and send HTTP GET request for file')
-    
+    parser = argparse.ArgumentParser(description = 'Attempts to connect to a server and send HTTP GET requests for files')
+
     # Argument for IP-address. Type is string and only 1 argument is allowed. Is required
     parser.add_argument('-i', '--ip', type = str, nargs = 1, required = True,
                         help = 'Server IP-address: IP adress of server interface')
     # Argument for port. Type is int and only 1 argument is allowed. Is required
     parser.add_argument('-p', '--port', type = int, nargs = 1, required = True,
                         help = 'Socket port number: Port number attatched to server socket')
-    # Argument for file. Type is string and 0-1 arguments are allowed. Is not required
+    # Argument for files. Type is string and any number of arguments are allowed. Is not required
     # The reason this is not required and 0 arguments are allowed is so index.html can be asked for by default
-    parser.add_argument('-f', '--file', type = str, nargs = '?',
-                        help = 'Requested file: File asked for in HTTP GET request')
-        
+    parser.add_argument('-f', '--file', type = str, nargs = '*',
+                        help = 'Requested files: Files asked for in HTTP GET requests, fetched over one connection')
+    # Argument for timeout. Type is float. Is not required
+    parser.add_argument('-t', '--timeout', type = float, default = 10,
+                        help = 'Timeout: Seconds to wait for server before a request is given up, in load and asyncio mode')
+
+    # Arguments for load mode, none of them are required
+    parser.add_argument('-l', '--load', action = 'store_true',
+                        help = 'Load mode: Sends many requests for the files and prints throughput and latency')
+    parser.add_argument('-c', '--concurrency', type = int, default = 16,
+                        help = 'Concurrency: Connections open at once in load mode')
+    parser.add_argument('-n', '--requests', type = int, default = 1000,
+                        help = 'Requests: Requests sent in load mode, spread over the files in turn')
+    parser.add_argument('-d', '--duration', type = float,
+                        help = 'Duration: Seconds load mode runs for, instead of a number of requests')
+    parser.add_argument('-r', '--rate', type = float,
+                        help = 'Rate: Requests per second sent in load mode no matter how fast server answers, '
+                               'as fast as server answers by default')
+    parser.add_argument('-k', '--keep-alive', type = str, choices = ['on', 'off'], default = 'on',
+                        help = 'Keep-alive: "on" reuses connections in load mode, "off" makes a new one for every request')
+    parser.add_argument('-w', '--processes', type = int, default = os.cpu_count() or 1,
+                        help = 'Processes: Processes sending requests in load mode, one per CPU core by default')
+    parser.add_argument('-j', '--json', type = str,
+                        help = 'JSON: File load test results are written to as JSON, "-" writes them to console')
+
+    # Arguments for asyncio mode, none of them are required
+    parser.add_argument('-a', '--asyncio', action = 'store_true',
+                        help = 'Asyncio mode: Fetches all files at once, -f may also take URLs like http://host:port/path')
+    parser.add_argument('-m', '--max-connections', type = int, default = 4,
+                        help = 'Max connections: Most connections open at once to one server in asyncio mode')
+    parser.add_argument('-P', '--pipeline', type = int, default = 1,
+                        help = 'Pipeline: Requests sent on a connection before their responses are read in asyncio mode, '
+                               '1 turns pipelining off')
+    parser.add_argument('-o', '--output', type = str,
+                        help = 'Output: Directory fetched files are written to, console by default. '
+                               'Interrupted downloads are resumed when client is run again, except in asyncio mode')
+
     # Parses arguments
     arguments = parser.parse_args()
 
 
     # Stores arguments in variables
-    ip = arguments.ip[0]        # Retreives ip argument
-    port = arguments.port[0]    # Retreives port argument
-    # if argument.file is empty, file is set to ''
-    if not arguments.file:      
-        file = ''
-    # if argument.file is not empty, file argument is retreived
-    else:                       
-        file = arguments.file
+    arguments.ip = arguments.ip[0]          # Retreives ip argument
+    arguments.port = arguments.port[0]      # Retreives port argument
+    # if argument.file is empty, files is set to [''] so index.html is asked for
+    if not arguments.file:
+        arguments.file = ['']
 
-    return ip, port, file
+    # Load mode needs at least one connection, process and request
+    if arguments.concurrency < 1 or arguments.processes < 1 or arguments.requests < 1:
+        parser.error('concurrency, processes and requests must be at least 1')
+    if (arguments.duration is not None and arguments.duration <= 0) or (arguments.rate is not None and arguments.rate <= 0):
+        parser.error('duration and rate must be above 0')
+
+    # Asyncio mode needs at least one connection per server, and one request per connection
+    if arguments.max_connections < 1 or arguments.pipeline < 1:
+        parser.error('max connections and pipeline must be at least 1')
+    if arguments.timeout <= 0:
+        parser.error('timeout must be above 0')
+
+    return arguments
 
 # End of argumentParser()
 
@@ -91,95 +184,2096 @@ def argumentParser():
 
 # Beginning of httpMessageHandler()
 
-def httpMessageHandler(serverIP, serverPort, requestFile):
+def httpMessageHandler(serverIP, serverPort, requestFiles):
 
     """
         Description:
         Connects to webserver using an IP-address and a port number
-        Sends HTTP GET request message to server, requesting a wanted file
-        Receives an HTTP response message from server and closes connection
+        Sends an HTTP GET request message for every wanted file, and receives the HTTP response messages.
+        Connection is kept open between requests, so only one TCP handshake is needed for all files
 
-        In case of error, connection is closed and program is terminated
+        In case of error, connections are closed and program is terminated
 
         Arguments:
-        serverIP:    IP-address of server, user wants to connect to
-        serverPort:  port number attached to server socket, user wants to connect to
-        requestFile: file requested from server in HTTP GET request message
+        serverIP:     IP-address of server, user wants to connect to
+        serverPort:   port number attached to server socket, user wants to connect to
+        requestFiles: files requested from server in HTTP GET request messages
 
         Returns:
-        httpResponseMessage: HTTP response message received from server
+        httpResponseMessages: HTTP response messages received from server, as text, in the order files were requested
     """
 
 
-    # Attempts to connect to server, send and receive HTTP message
+    # Client keeps connections open between requests, all of them are closed when it is done
+    client = HttpClient()
+
+    # Attempts to send and receive HTTP messages
     try:
-        
-        # Creates a TCP socket with IPv4 as underlying network
-        clientSocket = socket(AF_INET, SOCK_STREAM)
-        
-        # Connects to server from clientSocket
-        clientSocket.connect((serverIP, serverPort))
-        # Status message for console 
-        print('Connection established, ready to send...')
-
-        
-        # HTTP GET request message
-        httpRequestMessage = httpGETWriter(serverIP, serverPort, requestFile)
-        
-        
-        # Status message for console 
-        print('Sending HTTP request message to server...')
-        # Sends HTTP GET request message through clientSocket to server
-        clientSocket.send(httpRequestMessage.encode())
-
-
-        # Waits for server to send HTTP response message through clientSocket
-        httpResponseMessage = clientSocket.recv(1024).decode()
-        
-        # Status message for console 
-        print('Response message received, closing connection...')
-        # Closes clientSocket
-        clientSocket.close()
-
-        return httpResponseMessage
-    
+
+        httpResponseMessages = []
+        for requestFile in requestFiles:
+
+            # Status message for console
+            print(f'Sending HTTP request message for /{requestFile.lstrip("/")} to server...')
+
+            # Sends HTTP GET request message and waits for the full HTTP response message
+            httpResponse = client.request(serverIP, serverPort, requestFile)
+
+            # Status message for console
+            print('Response message received')
+            httpResponseMessages.append(httpResponse.text())
+
+        return httpResponseMessages
+
 
     # Handles exceptions
-    # Prints error message to console, closes socket and terminates program
+    # Prints error message to console, closes connections and terminates program
     except Exception as error:
 
         # Error and status message for console
         print(f'An error has occured: {error}\n' \
-              'exiting program...')          
-        # Closes connection and terminates program
-        clientSocket.close()
+              'exiting program...')
+        # Terminates program, connections are closed below
         sys.exit()
 
-# End of connectionHandler()
+    # Always executed, closes connections that are still open
+    finally:
+        # Status message for console
+        print('Closing connection...')
+        client.close()
 
+# End of httpMessageHandler()
 
 
-# Beginning of httpGETWriter()
 
-def  httpGETWriter(serverIP, serverPort, requestFile): 
+# Beginning of downloadHandler()
+
+def downloadHandler(arguments):
+
+    """
+        Description:
+        Downloads every wanted file to the output directory, one after another over the same connection,
+        showing progress and throughput while it runs. Bodies are streamed to disk through one reusable buffer,
+        so memory used stays the same no matter how large the files are
+
+        A file is written to "name.part" until it is complete. If a download is interrupted, the partial file is kept,
+        and running client again resumes it from where it stopped
+
+        In case of error, connections are closed and program is terminated
+
+        Argument:
+        arguments: Parsed arguments from argumentParser()
+    """
+
+
+    # Client keeps connections open between requests, all of them are closed when it is done
+    client = HttpClient()
+    buffer = bytearray(downloadBufferSize)
+    server = (arguments.ip, arguments.port)
+
+    try:
+        for requestFile in arguments.file:
+
+            # Files are written with the same paths as on the server, like asyncio mode does
+            outputPath = fetchOutputPath(arguments.output, server, '/' + requestFile.lstrip('/'), False)
+            progress = DownloadProgress(outputPath)
+
+            status, reason, received = client.download(arguments.ip, arguments.port, requestFile, outputPath,
+                                                       buffer, progress.update)
+
+            # Status message for console
+            if status in (200, 206, 416):
+                progress.finish()
+            else:
+                print(f'{status} {reason} for /{requestFile.lstrip("/")}, nothing written')
+
+
+    # Handles interrupts and exceptions
+    # Partial file is kept, prints error message to console, closes connections and terminates program
+    except (Exception, KeyboardInterrupt) as error:
+
+        # Error and status message for console
+        print(f'\nDownload stopped: {error!r}\n'
+              'partial file is kept, run client again to resume, exiting program...')
+        sys.exit(1)
+
+    # Always executed, closes connections that are still open
+    finally:
+        client.close()
+
+# End of downloadHandler()
+
+
+
+# Beginning of DownloadProgress
+
+class DownloadProgress:
+
+    """
+        Description:
+        Shows progress and throughput of a download on one console line, which is written again at most every interval.
+        Bytes that were on disk before the download was resumed do not count towards throughput
+
+        Arguments:
+        name:     Name the download is shown with
+        interval: Seconds between updates of the line
+    """
+
+
+    # Beginning of __init__()
+
+    def __init__(self, name, interval = 0.5):
+
+        self.name = name
+        self.interval = interval
+
+        self.start = time.perf_counter()    # Time download started
+        self.shown = 0                      # Time line was last written
+        self.width = 0                      # Length of line last written, a shorter line is padded to cover it
+
+        self.first = None                   # Bytes on disk when download started
+        self.done = 0                       # Bytes on disk
+        self.total = None                   # Size of the file, None if server has not told
+
+    # End of __init__()
+
+
+
+    # Beginning of update()
+
+    def update(self, done, total):
+
+        """
+            Description:
+            Tells how far download has come, line is written again if interval has passed
+
+            Arguments:
+            done:  Bytes of the file on disk
+            total: Size of the file in bytes, None if it is not known
+        """
+
+        if self.first is None:
+            self.first = done
+        self.done = done
+        self.total = total
+
+        now = time.perf_counter()
+        if now - self.shown >= self.interval:
+            self.shown = now
+            sys.stdout.write('\r' + self.line(now))
+            sys.stdout.flush()
+
+    # End of update()
+
+
+
+    # Beginning of finish()
+
+    def finish(self):
+
+        """
+            Description:
+            Writes the line a last time, with the average throughput of the whole download
+        """
+
+        print('\r' + self.line(time.perf_counter()))
+
+    # End of finish()
+
+
+
+    # Beginning of line()
+
+    def line(self, now):
+
+        """
+            Description:
+            Writes the progress line
+
+            Argument:
+            now: Time from time.perf_counter() throughput is measured up to
+
+            Returns:
+            line: Name, bytes done out of total, and throughput, padded to cover the line written before it
+        """
+
+        first = self.first or 0
+        throughput = (self.done - first) / max(now - self.start, 1e-9)
+
+        # Sizes are shown in kilobytes until they reach a megabyte
+        def size(count):
+            return f'{count / 1e6:.1f} MB' if count >= 1e6 else f'{count / 1e3:.1f} KB'
+
+        line = f'{self.name}: {size(self.done)}'
+        if self.total:
+            line += f' of {size(self.total)} ({self.done / self.total * 100:.0f} %)'
+        line += f', {size(throughput)}/s'
+        if first:
+            line += f', resumed at {size(first)}'
+
+        self.width = max(self.width, len(line))
+        return line.ljust(self.width)
+
+    # End of line()
+
+# End of DownloadProgress
+
+
+
+# Beginning of loadHandler()
+
+def loadHandler(arguments):
+
+    """
+        Description:
+        Runs a load test against a webserver. Requests for the files are sent over many connections at once
+        by several processes, so one CPU core on the client side does not limit the load.
+        Connections are spread evenly over the processes, each connection is handled by its own thread
+
+        Without a rate, every connection sends its next request as soon as the last one is answered (closed loop).
+        With a rate, requests are sent on a fixed schedule no matter how fast server answers (open loop),
+        and latency is measured from when a request should have been sent, so a slow server can not hide its queue
+
+        Prints throughput, responses by status, errors and latency percentiles, and writes them as JSON if asked to
+
+        Argument:
+        arguments: Parsed arguments from argumentParser()
+    """
+
+
+    # Settings every connection needs to know
+    settings = {
+        'serverIP': arguments.ip,
+        'serverPort': arguments.port,
+        'files': arguments.file,
+        'concurrency': arguments.concurrency,
+        'requests': arguments.requests,
+        'duration': arguments.duration,
+        'rate': arguments.rate,
+        'connection': 'keep-alive' if arguments.keep_alive == 'on' else 'close',
+        'timeout': arguments.timeout
+    }
+
+    # Status message for console
+    print(f'Load test of {arguments.ip}:{arguments.port} with {arguments.concurrency} connections, '
+          + (f'{arguments.duration} seconds' if arguments.duration else f'{arguments.requests} requests')
+          + (f' at {arguments.rate} requests per second' if arguments.rate else '') + '...')
+
+    result = loadRunner(settings, arguments.processes)
+
+    # Prints results to console
+    print(loadReportWriter(result))
+
+    # Writes results as JSON, to a file or to console
+    if arguments.json == '-':
+        print(json.dumps(result, indent = 2))
+    elif arguments.json:
+        with open(arguments.json, 'w') as jsonFile:
+            json.dump(result, jsonFile, indent = 2)
+        # Status message for console
+        print(f'Results written to {arguments.json}')
+
+# End of loadHandler()
+
+
+
+# Beginning of loadRunner()
+
+def loadRunner(settings, processes):
 
     """
         Description:
-        Writes HTTP response message with provided serverIP, serverPort and requestFile.
-        Inclueded fields in HTTP GET request message are: Host and Connection
+        Runs a load test with the given settings and returns its results, without printing anything
+        Used by loadHandler(), and by benchmark.py to drive the servers
+
+        Arguments:
+        settings:  Dictionary with the settings of the load test: serverIP, serverPort, files, concurrency,
+                   requests, duration, rate, connection ("keep-alive" or "close") and timeout in seconds
+        processes: Most processes sending requests, never more than there are connections
 
         Returns:
-        httpRequestMessage: Fully written HTTP GET request message in the form of a string
+        result: Dictionary with the final results from loadResultFinisher(), and the settings used.
+                A process that dies, or is still running long after the duration is over, is counted as an error
+                under "ProcessDied" or "ProcessHung", and the results of the other processes are kept
     """
 
-    # If requestFile starts with "/" it is removed
-    if requestFile != '' and requestFile.startswith('/'): requestFile = requestFile[1:]
-    # Writes the HTTP GET request message
-    httpRequestMessage = f'GET /{requestFile} HTTP/1.1\r\n' \
-                         f'Host: {serverIP}:{serverPort}\r\n' \
-                         'Connection: close\r\n' \
-                         '\r\n'
-    
+
+    # Every process gets its share of the connections
+    processes = min(processes, settings['concurrency'])
+    connectionIds = [list(range(settings['concurrency']))[process::processes] for process in range(processes)]
+
+    # Starts the processes, each of them puts its number and merged results in the queue when it is done
+    resultQueue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target = loadProcess, args = (settings, ids, resultQueue, number))
+               for number, ids in enumerate(connectionIds)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+
+    # With a duration, every process should be done when it is over and its last requests have timed out,
+    # margin covers starting the processes and merging their results
+    deadline = time.monotonic() + settings['duration'] + settings['timeout'] + 10 if settings['duration'] else None
+
+    # Results are collected as they come, and the processes are checked every second in between
+    results = {}
+    while len(results) < len(workers):
+        try:
+            number, result = resultQueue.get(timeout = 1)
+            results[number] = result
+            continue
+        except queue.Empty:
+            pass
+
+        # Process that exited with an error never puts its results, one that exited normally has put them already
+        for number, worker in enumerate(workers):
+            if number not in results and worker.exitcode not in (None, 0):
+                results[number] = loadFailedResult('ProcessDied', start)
+
+        # Process still running when it should long have been done is stopped
+        if deadline is not None and time.monotonic() > deadline:
+            for number, worker in enumerate(workers):
+                if number not in results:
+                    worker.terminate()
+                    results[number] = loadFailedResult('ProcessHung', start)
+
+    for worker in workers:
+        worker.join()
+    results = list(results.values())
+
+
+    # Results of all processes are merged into one
+    result = loadResultFinisher(loadResultMerger(results))
+    result['settings'] = {name: value for name, value in settings.items() if name not in ('serverIP', 'serverPort')}
+    result['settings']['processes'] = processes
+    result['server'] = f'{settings["serverIP"]}:{settings["serverPort"]}'
+
+    return result
+
+# End of loadRunner()
+
+
+
+# Beginning of loadProcess()
+
+def loadProcess(settings, connectionIds, resultQueue, number):
+
+    """
+        Description:
+        Runs in a load process. Starts a thread for each of its connections, waits for all of them,
+        and puts their merged results in the queue
+
+        Arguments:
+        settings:      Dictionary with the settings of the load test
+        connectionIds: Numbers of the connections this process handles, from 0 to concurrency - 1
+        resultQueue:   Queue the results are put in
+        number:        Number of this process, put in the queue with the results
+    """
+
+
+    results = [None] * len(connectionIds)
+
+    # Every connection is a thread, it writes its results to its own place in the list
+    def connectionRunner(index, connectionId):
+        results[index] = loadConnection(settings, connectionId)
+
+    threads = [threading.Thread(target = connectionRunner, args = (index, connectionId))
+               for index, connectionId in enumerate(connectionIds)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    resultQueue.put((number, loadResultMerger(results)))
+
+# End of loadProcess()
+
+
+
+# Beginning of loadFailedResult()
+
+def loadFailedResult(error, start):
+
+    """
+        Description:
+        Makes the results of a load process that never sent its own, so it is counted as an error
+
+        Arguments:
+        error: Name the error is counted under, like "ProcessDied"
+        start: Time the load test started, in seconds since epoch
+
+        Returns:
+        result: Results with only the error, in the form loadResultMerger() takes
+    """
+
+    # Results span no time, so the failed process does not stretch the duration throughput is counted over
+    return {
+        'start': start,
+        'end': start,
+        'statuses': Counter(),
+        'errors': Counter({error: 1}),
+        'bytes': 0,
+        'histogram': LatencyHistogram()
+    }
+
+# End of loadFailedResult()
+
+
+
+# Beginning of loadConnection()
+
+def loadConnection(settings, connectionId):
+
+    """
+        Description:
+        Sends the requests of one connection and measures how long every response takes
+        Requests are spread over the connections, so together they send the number of requests asked for
+
+        Arguments:
+        settings:     Dictionary with the settings of the load test
+        connectionId: Number of the connection, from 0 to concurrency - 1
+
+        Returns:
+        result: Dictionary with the results of the connection, in the form loadResultMerger() takes
+    """
+
+
+    concurrency = settings['concurrency']
+    files = settings['files']
+
+    # This connection's share of the requests, the first connections send one more if they do not divide evenly
+    requests = settings['requests'] // concurrency + (connectionId < settings['requests'] % concurrency)
+
+    # With a rate, every connection sends at its share of it, connections start spread over the first interval
+    interval = concurrency / settings['rate'] if settings['rate'] else 0
+
+    client = HttpClient(timeout = settings['timeout'])
+    histogram = LatencyHistogram()
+    statuses = Counter()            # Responses by status code
+    errors = Counter()              # Failed requests by type of error
+    received = 0                    # Bytes of bodies received
+
+    start = time.time()
+    startCounter = time.perf_counter()
+    deadline = startCounter + settings['duration'] if settings['duration'] else None
+    scheduled = startCounter + interval * connectionId / concurrency
+
+    sent = 0
+    while (sent < requests) if deadline is None else (time.perf_counter() < deadline):
+
+        # Open loop waits for the time the request is scheduled, closed loop sends right away
+        if interval:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if deadline is not None and scheduled >= deadline:
+                break
+            requestStart = scheduled
+            scheduled += interval
+        else:
+            requestStart = time.perf_counter()
+
+        # Files are asked for in turn
+        requestFile = files[(connectionId + sent) % len(files)]
+        sent += 1
+
+        try:
+            httpResponse = client.request(settings['serverIP'], settings['serverPort'], requestFile, settings['connection'])
+            statuses[str(httpResponse.status)] += 1
+            received += len(httpResponse.body)
+        except Exception as error:
+            errors[type(error).__name__] += 1
+            continue
+
+        histogram.record(time.perf_counter() - requestStart)
+
+    client.close()
+
+    return {
+        'start': start,
+        'end': start + time.perf_counter() - startCounter,
+        'statuses': statuses,
+        'errors': errors,
+        'bytes': received,
+        'histogram': histogram
+    }
+
+# End of loadConnection()
+
+
+
+# Beginning of loadResultMerger()
+
+def loadResultMerger(results):
+
+    """
+        Description:
+        Merges results of several connections or processes into one
+
+        Argument:
+        results: List of results from loadConnection() or loadProcess()
+
+        Returns:
+        result: Merged results, in the same form
+    """
+
+
+    histogram = LatencyHistogram()
+    statuses = Counter()
+    errors = Counter()
+    for result in results:
+        histogram.merge(result['histogram'])
+        statuses.update(result['statuses'])
+        errors.update(result['errors'])
+
+    merged = {
+        'start': min(result['start'] for result in results),
+        'end': max(result['end'] for result in results),
+        'statuses': statuses,
+        'errors': errors,
+        'bytes': sum(result['bytes'] for result in results),
+        'histogram': histogram
+    }
+
+    return merged
+
+# End of loadResultMerger()
+
+
+
+# Beginning of loadResultFinisher()
+
+def loadResultFinisher(merged):
+
+    """
+        Description:
+        Turns merged results of a load test into final results, with throughput and latency percentiles,
+        in a form that can be written as JSON
+
+        Argument:
+        merged: Merged results from loadResultMerger()
+
+        Returns:
+        result: Dictionary with the final results
+    """
+
+
+    histogram = merged['histogram']
+    elapsed = max(merged['end'] - merged['start'], 1e-9)
+    completed = sum(merged['statuses'].values())
+
+    return {
+        'duration': round(elapsed, 3),
+        'requests': completed,
+        'errors': sum(merged['errors'].values()),
+        'throughput': round(completed / elapsed, 1),                # Responses per second
+        'bytes': merged['bytes'],
+        'bytesPerSecond': round(merged['bytes'] / elapsed),
+        'statuses': dict(sorted(merged['statuses'].items())),
+        'errorTypes': dict(merged['errors']),
+        'latencyMs': {
+            'min': histogram.minimum(),
+            'mean': histogram.mean(),
+            'p50': histogram.percentile(50),
+            'p90': histogram.percentile(90),
+            'p99': histogram.percentile(99),
+            'p99.9': histogram.percentile(99.9),
+            'max': histogram.maximum()
+        },
+        'histogramMs': histogram.bins()
+    }
+
+# End of loadResultFinisher()
+
+
+
+# Beginning of loadReportWriter()
+
+def loadReportWriter(result):
+
+    """
+        Description:
+        Writes final results of a load test as text, so they can be printed to console
+
+        Argument:
+        result: Final results from loadResultFinisher()
+
+        Returns:
+        report: The results in the form of a string
+    """
+
+
+    latency = result['latencyMs']
+    lines = [
+        f'Requests:   {result["requests"]} in {result["duration"]} seconds, {result["errors"]} errors',
+        f'Throughput: {result["throughput"]} requests/s, {result["bytesPerSecond"] / 1024 / 1024:.2f} MB/s',
+        'Statuses:   ' + (', '.join(f'{status}: {count}' for status, count in result['statuses'].items()) or 'none'),
+    ]
+    if result['errorTypes']:
+        lines.append('Errors:     ' + ', '.join(f'{error}: {count}' for error, count in result['errorTypes'].items()))
+
+    lines.append('Latency:    ' + ', '.join(f'{name} {value:.3f} ms' for name, value in latency.items()))
+
+
+    # Histogram is drawn with bars scaled to the largest bin
+    lines.append('Histogram:')
+    largest = max((count for _, count in result['histogramMs']), default = 0)
+    for upper, count in result['histogramMs']:
+        bar = '#' * round(40 * count / largest) if largest else ''
+        lines.append(f'  <= {upper:>10.3f} ms {count:>9} {bar}')
+
+    return '\n'.join(lines)
+
+# End of loadReportWriter()
+
+
+
+# Beginning of LatencyHistogram
+
+class LatencyHistogram:
+
+    """
+        Description:
+        Histogram of latencies with logarithmic buckets, each about 1 % wider than the one before.
+        Memory does not grow with the number of requests, histograms of several connections or processes
+        are merged by adding their buckets, and percentiles are accurate to about 1 %
+    """
+
+    # Every bucket is this much wider than the one before
+    growth = 1.01
+
+
+    # Beginning of __init__()
+
+    def __init__(self):
+
+        self.buckets = Counter()        # Bucket number mapped to latencies in it
+        self.count = 0                  # Recorded latencies
+        self.total = 0.0                # Sum of recorded latencies in seconds
+        self.smallest = math.inf        # Smallest recorded latency in seconds
+        self.largest = 0.0              # Largest recorded latency in seconds
+
+    # End of __init__()
+
+
+
+    # Beginning of record()
+
+    def record(self, latency):
+
+        """
+            Description:
+            Records a latency
+
+            Argument:
+            latency: Latency in seconds
+        """
+
+        # Bucket number is the logarithm of latency in microseconds, latencies below one microsecond share bucket 0
+        microseconds = latency * 1_000_000
+        self.buckets[int(math.log(microseconds, self.growth)) if microseconds > 1 else 0] += 1
+        self.count += 1
+        self.total += latency
+        self.smallest = min(self.smallest, latency)
+        self.largest = max(self.largest, latency)
+
+    # End of record()
+
+
+
+    # Beginning of merge()
+
+    def merge(self, other):
+
+        """
+            Description:
+            Adds latencies of another histogram to this one
+
+            Argument:
+            other: A LatencyHistogram
+        """
+
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        self.smallest = min(self.smallest, other.smallest)
+        self.largest = max(self.largest, other.largest)
+
+    # End of merge()
+
+
+
+    # Beginning of percentile()
+
+    def percentile(self, percent):
+
+        """
+            Description:
+            Finds the latency that percent of recorded latencies are at or below
+
+            Argument:
+            percent: Percentile, like 99.9
+
+            Returns:
+            latency: Upper edge of the bucket the percentile is in, in milliseconds, never above the largest latency
+        """
+
+        if not self.count:
+            return 0.0
+
+        # Walks buckets from the fastest until enough latencies are counted
+        wanted = math.ceil(self.count * percent / 100)
+        counted = 0
+        for bucket in sorted(self.buckets):
+            counted += self.buckets[bucket]
+            if counted >= wanted:
+                return round(min(self.growth ** (bucket + 1) / 1000, self.largest * 1000), 3)
+
+        return self.maximum()
+
+    # End of percentile()
+
+
+
+    # Beginning of bins()
+
+    def bins(self):
+
+        """
+            Description:
+            Sums the fine buckets into bins that double in width, so the histogram can be printed
+
+            Returns:
+            bins: List of [upper edge in milliseconds, latencies in bin], from the fastest bin with latencies to the slowest
+        """
+
+        bins = Counter()
+        for bucket, count in self.buckets.items():
+            upper = self.growth ** (bucket + 1) / 1000
+            bins[2 ** math.ceil(math.log2(upper)) if upper > 0.001 else 0.001] += count
+
+        return [[upper, bins[upper]] for upper in sorted(bins)]
+
+    # End of bins()
+
+
+
+    # Beginning of minimum()
+
+    def minimum(self):
+
+        """
+            Description:
+            Smallest recorded latency
+
+            Returns:
+            latency: The latency in milliseconds, 0 if nothing is recorded
+        """
+
+        return round(self.smallest * 1000, 3) if self.count else 0.0
+
+    # End of minimum()
+
+
+
+    # Beginning of mean()
+
+    def mean(self):
+
+        """
+            Description:
+            Average of recorded latencies
+
+            Returns:
+            latency: The latency in milliseconds, 0 if nothing is recorded
+        """
+
+        return round(self.total / self.count * 1000, 3) if self.count else 0.0
+
+    # End of mean()
+
+
+
+    # Beginning of maximum()
+
+    def maximum(self):
+
+        """
+            Description:
+            Largest recorded latency
+
+            Returns:
+            latency: The latency in milliseconds, 0 if nothing is recorded
+        """
+
+        return round(self.largest * 1000, 3)
+
+    # End of maximum()
+
+# End of LatencyHistogram
+
+
+
+# Beginning of fetchHandler()
+
+def fetchHandler(arguments):
+
+    """
+        Description:
+        Fetches many files at once with asyncio, from one or more servers, and streams them to disk or console
+        Files can be given as paths on the server from -i and -p, or as URLs like "http://host:port/path"
+        Every server gets up to maxConnections connections, and every connection may send several requests
+        before reading the responses (pipelining), so fetching many small files is limited by latency, not by file count
+
+        Argument:
+        arguments: Parsed arguments from argumentParser()
+    """
+
+
+    # Every file is fetched from the server in its URL, or from the server in the arguments
+    targets = [fetchTargetParser(target, arguments.ip, arguments.port) for target in arguments.file]
+
+    # Files written to console must not be mixed with status messages, those are then written to stderr
+    log = sys.stdout if arguments.output else sys.stderr
+
+    start = time.perf_counter()
+    fetched, received, errors = asyncio.run(fetchAll(targets, arguments.max_connections, arguments.pipeline,
+                                                     arguments.output, log, arguments.timeout))
+    elapsed = time.perf_counter() - start
+
+    # Status message for console
+    print(f'Fetched {fetched} files, {received} bytes in {elapsed:.3f} seconds, {errors} failed', file = log)
+
+# End of fetchHandler()
+
+
+
+# Beginning of fetchTargetParser()
+
+def fetchTargetParser(target, serverIP, serverPort):
+
+    """
+        Description:
+        Finds the server and path of a file to fetch
+
+        Arguments:
+        target:     URL like "http://host:port/path", or a path on the default server
+        serverIP:   IP-address of the default server
+        serverPort: port number of the default server
+
+        Returns:
+        server: Tuple (host, port) of the server the file is on
+        path:   Path of the file on the server, starting with "/"
+    """
+
+    if target.startswith('http://'):
+        url = urllib.parse.urlsplit(target)
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        return (url.hostname, url.port or 80), path
+
+    return (serverIP, serverPort), '/' + target.lstrip('/')
+
+# End of fetchTargetParser()
+
+
+
+# Beginning of fetchAll()
+
+async def fetchAll(targets, maxConnections, pipeline, output, log, timeout = 10):
+
+    """
+        Description:
+        Fetches every target. Paths are put in one queue per server, and every connection to the server
+        takes paths from it until it is empty, so a fast connection fetches more files than a slow one
+
+        Arguments:
+        targets:        List of (server, path) tuples from fetchTargetParser()
+        maxConnections: Most connections open at once to one server
+        pipeline:       Most requests sent on a connection before their responses are read
+        output:         Directory files are written to, None to write them to console
+        log:            Where status messages are written
+        timeout:        Seconds to wait for a server to connect, take a request or send more of a response
+
+        Returns:
+        fetched:  Number of files fetched
+        received: Bytes of files fetched
+        errors:   Number of files that could not be fetched
+    """
+
+
+    # Paths waiting to be fetched, per server. A path is kept with the number of times it has failed
+    queues = {}
+    for server, path in targets:
+        queues.setdefault(server, asyncio.Queue()).put_nowait((path, 0))
+
+    # Counters shared by every connection, there are no other threads so no lock is needed
+    counters = {'fetched': 0, 'received': 0, 'errors': 0}
+
+    # Files from several servers are written in a directory per server, so equal paths do not overwrite each other
+    state = {
+        'output': output,
+        'perServer': len(queues) > 1,
+        'console': asyncio.Lock(),      # One file at a time is written to console, so files are not mixed
+        'log': log,
+        'timeout': timeout,
+        'counters': counters
+    }
+
+    connections = [fetchConnection(server, queue, pipeline, state)
+                   for server, queue in queues.items()
+                   for _ in range(min(maxConnections, queue.qsize()))]
+    await asyncio.gather(*connections)
+
+    return counters['fetched'], counters['received'], counters['errors']
+
+# End of fetchAll()
+
+
+
+# Beginning of fetchConnection()
+
+async def fetchConnection(server, queue, pipeline, state):
+
+    """
+        Description:
+        Coroutine that handles one connection to a server. Takes up to pipeline paths from the queue,
+        sends a request for each of them at once, and reads the responses in the order they were sent.
+        Connection is opened again if server closes it, requests that were not answered are put back in the queue.
+        A path that fails twice is given up on. Any error, a server that stops answering included,
+        only fails the path being fetched, so the other connections and servers carry on
+
+        Arguments:
+        server:   Tuple (host, port) of the server
+        queue:    Queue of paths waiting to be fetched from the server
+        pipeline: Most requests sent before their responses are read
+        state:    Dictionary with settings and counters shared by every connection
+    """
+
+
+    host, port = server
+    timeout = state['timeout']
+
+    while not queue.empty():
+
+        # Opens a connection, every path that would have been sent on it fails if that is not possible
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except Exception as error:
+            path, _ = queue.get_nowait()
+            print(f'Could not connect to {host}:{port} for {path}: {fetchErrorWriter(error, timeout)}',
+                  file = state['log'])
+            state['counters']['errors'] += 1
+            continue
+
+        try:
+            while not queue.empty():
+
+                # Sends several requests at once, server answers them in order
+                batch = [queue.get_nowait() for _ in range(min(pipeline, queue.qsize()))]
+                writer.write(b''.join(httpGETWriter(host, port, path).encode() for path, _ in batch))
+
+                answered = 0        # Responses read so far
+                keepAlive = True
+                try:
+                    await asyncio.wait_for(writer.drain(), timeout)
+                    while answered < len(batch) and keepAlive:
+                        keepAlive = await fetchResponseReader(reader, server, batch[answered][0], state)
+                        answered += 1
+
+                # Connection broke, server stopped answering, or response could not be read or written,
+                # path being read has failed once more. Connection is given up, since its place in the stream is lost
+                except Exception as error:
+                    keepAlive = False
+                    path, failures = batch[answered]
+                    if failures >= 1:
+                        print(f'Could not fetch {path} from {host}:{port}: {fetchErrorWriter(error, timeout)}',
+                              file = state['log'])
+                        state['counters']['errors'] += 1
+                    else:
+                        queue.put_nowait((path, failures + 1))
+                    answered += 1
+
+                # Requests that were sent but not answered are put back, to be sent on a new connection
+                for unanswered in batch[answered:]:
+                    queue.put_nowait(unanswered)
+
+                if not keepAlive:
+                    break
+
+        # Connection is always closed, a new one is opened if paths are left
+        finally:
+            writer.close()
+            try:
+                await asyncio.wait_for(writer.wait_closed(), timeout)
+            except Exception:
+                pass
+
+# End of fetchConnection()
+
+
+
+# Beginning of fetchErrorWriter()
+
+def fetchErrorWriter(error, timeout):
+
+    """
+        Description:
+        Writes why a file could not be fetched, for the status message
+
+        Arguments:
+        error:   The exception that was raised
+        timeout: Seconds that were waited for the server
+
+        Returns:
+        reason: Description of the error
+    """
+
+    # Timeout has no message of its own
+    if isinstance(error, asyncio.TimeoutError):
+        return f'server did not answer within {timeout} seconds'
+    return repr(error)
+
+# End of fetchErrorWriter()
+
+
+
+# Beginning of fetchResponseReader()
+
+async def fetchResponseReader(reader, server, path, state):
+
+    """
+        Description:
+        Reads one HTTP response message and streams its body to disk or console as it arrives,
+        so large files are never held in memory. Only bodies of "200 OK" responses are written,
+        other bodies are read and thrown away so the next response can be read
+
+        Arguments:
+        reader: Stream the response is read from
+        server: Tuple (host, port) of the server
+        path:   Path the response is for
+        state:  Dictionary with settings and counters shared by every connection
+
+        Returns:
+        keepAlive: True if connection can be used for another request message
+    """
+
+
+    # Every read waits at most timeout seconds for the server, a large body may take longer as long as data keeps coming
+    timeout = state['timeout']
+
+    header = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+    version, status, reason, headers, keepAlive = httpHeaderParser(header[:-4].decode('latin-1'))
+    framing, length = httpBodyFraming('GET', status, headers)
+
+
+    # Body is written to console, to a file, or nowhere
+    console = status == 200 and not state['output']
+    if status != 200:
+        sink = None
+    elif console:
+        await state['console'].acquire()
+        sink = sys.stdout.buffer
+    else:
+        sink = open(fetchOutputPath(state['output'], server, path, state['perServer']), 'wb')
+
+
+    received = 0
+    try:
+
+        # Body is as long as "Content-Length" field says
+        if framing == 'length':
+            while received < length:
+                data = await asyncio.wait_for(reader.read(min(65536, length - received)), timeout)
+                if not data:
+                    raise ConnectionError('server closed connection in the middle of a response')
+                received += len(data)
+                if sink:
+                    sink.write(data)
+
+        # Body is sent in chunks, each one after a line with its size in hexadecimal
+        elif framing == 'chunked':
+            while True:
+                sizeLine = (await asyncio.wait_for(reader.readuntil(b'\r\n'), timeout)).split(b';')[0].strip()
+                try:
+                    size = int(sizeLine, 16)
+                except ValueError:
+                    raise ConnectionError(f'malformed chunk size: {sizeLine!r}')
+                if size == 0:
+                    break
+
+                while size:
+                    data = await asyncio.wait_for(reader.read(min(65536, size)), timeout)
+                    if not data:
+                        raise ConnectionError('server closed connection in the middle of a response')
+                    size -= len(data)
+                    received += len(data)
+                    if sink:
+                        sink.write(data)
+                await asyncio.wait_for(reader.readexactly(2), timeout)
+
+            # Trailer fields are skipped, an empty line ends them
+            while await asyncio.wait_for(reader.readuntil(b'\r\n'), timeout) != b'\r\n':
+                pass
+
+        # Body ends when server closes connection
+        elif framing == 'close':
+            while data := await asyncio.wait_for(reader.read(65536), timeout):
+                received += len(data)
+                if sink:
+                    sink.write(data)
+            keepAlive = False
+
+    # File is closed, or console is let go for other files
+    finally:
+        if console:
+            sink.flush()
+            state['console'].release()
+        elif sink:
+            sink.close()
+
+
+    # Status message for console
+    print(f'{status} {reason} http://{server[0]}:{server[1]}{path}, {received} bytes', file = state['log'])
+    if status == 200:
+        state['counters']['fetched'] += 1
+        state['counters']['received'] += received
+    else:
+        state['counters']['errors'] += 1
+
+    return keepAlive
+
+# End of fetchResponseReader()
+
+
+
+# Beginning of fetchOutputPath()
+
+def fetchOutputPath(output, server, path, perServer):
+
+    """
+        Description:
+        Finds where a fetched file is written, so the directory structure on the server is mirrored
+        Paths ending with "/" are written as index.html. Path can never lead outside the output directory
+
+        Arguments:
+        output:    Directory files are written to
+        server:    Tuple (host, port) of the server the file is from
+        path:      Path of the file on the server
+        perServer: True if every server gets its own directory, named "host_port"
+
+        Returns:
+        outputPath: Path the file is written to, its directory is created if it does not exist
+    """
+
+
+    # Query is not part of the file name, "%20" and the like are turned back into characters
+    path = urllib.parse.unquote(path.split('?')[0])
+    if path.endswith('/'):
+        path += 'index.html'
+
+    # ".." parts are removed, so a server can not make client write outside the output directory
+    parts = [part for part in path.split('/') if part not in ('', '.', '..')]
+    if perServer:
+        parts.insert(0, f'{server[0]}_{server[1]}')
+
+    outputPath = os.path.join(output, *parts)
+    os.makedirs(os.path.dirname(outputPath), exist_ok = True)
+
+    return outputPath
+
+# End of fetchOutputPath()
+
+
+
+# Beginning of HttpResponse
+
+class HttpResponse:
+
+    """
+        Description:
+        A received HTTP response message
+
+        Arguments:
+        version: HTTP version of the response, like "HTTP/1.1"
+        status:  Status code of the response, like 200
+        reason:  Reason phrase of the response, like "OK"
+        headers: Dictionary of header fields, lower case field name mapped to value without surrounding whitespace.
+                 Fields that appear several times have their values joined with ", "
+        body:    Body of the response in the form of bytes, chunked bodies are already joined
+    """
+
+    __slots__ = ('version', 'status', 'reason', 'headers', 'body')
+
+    def __init__(self, version, status, reason, headers, body):
+        self.version = version
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+
+    # Beginning of text()
+
+    def text(self):
+
+        """
+            Description:
+            Writes the response message as text, so it can be printed to console
+            Body that is not text is replaced by its size
+
+            Returns:
+            httpResponseMessage: Status line, header fields and body in the form of a string
+        """
+
+        header = f'{self.version} {self.status} {self.reason}\r\n' + \
+                 ''.join(f'{name}: {value}\r\n' for name, value in self.headers.items())
+
+        # Only text is printed, other files would fill the console with nonsense
+        if self.headers.get('content-type', 'text/').startswith('text/') and 'content-encoding' not in self.headers:
+            return header + '\r\n' + self.body.decode(errors = 'replace')
+        return header + '\r\n' + f'<{len(self.body)} bytes of data>'
+
+    # End of text()
+
+# End of HttpResponse
+
+
+
+# Beginning of HttpConnection
+
+class HttpConnection:
+
+    """
+        Description:
+        A connection to a webserver that can be used for several request messages one after another.
+        Received bytes are buffered, so bytes after one response message are kept for the next one
+
+        Arguments:
+        serverIP:   IP-address of server
+        serverPort: port number attached to server socket
+        timeout:    Seconds to wait for server before giving up
+    """
+
+
+    # Beginning of __init__()
+
+    def __init__(self, serverIP, serverPort, timeout):
+
+        self.address = (serverIP, serverPort)   # Server the connection goes to
+        self.buffer = bytearray()               # Received bytes that are not read yet
+        self.requests = 0                       # Request messages sent on this connection
+
+        # Creates a TCP socket and connects it to server, giving up after timeout seconds
+        self.clientSocket = create_connection(self.address, timeout)
+
+    # End of __init__()
+
+
+
+    # Beginning of send()
+
+    def send(self, data):
+
+        """
+            Description:
+            Sends all of data to server
+
+            Argument:
+            data: Bytes to be sent
+        """
+
+        self.clientSocket.sendall(data)
+        self.requests += 1
+
+    # End of send()
+
+
+
+    # Beginning of receive()
+
+    def receive(self):
+
+        """
+            Description:
+            Receives whatever server has sent into the buffer
+
+            Returns:
+            received: False if server has closed connection
+        """
+
+        received = self.clientSocket.recv(65536)
+        self.buffer += received
+        return bool(received)
+
+    # End of receive()
+
+
+
+    # Beginning of readUntil()
+
+    def readUntil(self, separator, limit = 65536):
+
+        """
+            Description:
+            Reads bytes up to and including separator, like the CRLF ending a line
+            Raises ConnectionError if server closes connection or sends more than limit bytes first
+
+            Arguments:
+            separator: Bytes the read bytes end with
+            limit:     Most bytes that are read
+
+            Returns:
+            data: The read bytes, without separator
+        """
+
+        searchFrom = 0
+        while True:
+            end = self.buffer.find(separator, searchFrom)
+            if end != -1:
+                data = bytes(self.buffer[:end])
+                del self.buffer[:end + len(separator)]
+                return data
+
+            # Separator may start in the last bytes searched, they are searched again
+            searchFrom = max(len(self.buffer) - len(separator) + 1, 0)
+            if len(self.buffer) > limit:
+                raise ConnectionError('response header is too large')
+            if not self.receive():
+                raise ConnectionError('server closed connection in the middle of a response')
+
+    # End of readUntil()
+
+
+
+    # Beginning of readExactly()
+
+    def readExactly(self, count):
+
+        """
+            Description:
+            Reads exactly count bytes
+            Raises ConnectionError if server closes connection first
+
+            Argument:
+            count: Number of bytes to be read
+
+            Returns:
+            data: The read bytes
+        """
+
+        while len(self.buffer) < count:
+            if not self.receive():
+                raise ConnectionError('server closed connection in the middle of a response')
+
+        data = bytes(self.buffer[:count])
+        del self.buffer[:count]
+        return data
+
+    # End of readExactly()
+
+
+
+    # Beginning of readInto()
+
+    def readInto(self, view, count):
+
+        """
+            Description:
+            Reads up to count bytes into view, bytes already in the buffer first
+            Bytes are received straight into view, so no new bytes objects are made
+
+            Arguments:
+            view:  Writable memoryview bytes are read into, from its start
+            count: Most bytes that are read, not more than len(view)
+
+            Returns:
+            count: Number of bytes read, 0 if server has closed connection
+        """
+
+        if self.buffer:
+            count = min(count, len(self.buffer))
+            with memoryview(self.buffer) as buffered:
+                view[:count] = buffered[:count]
+            del self.buffer[:count]
+            return count
+
+        return self.clientSocket.recv_into(view, count)
+
+    # End of readInto()
+
+
+
+    # Beginning of readToEnd()
+
+    def readToEnd(self):
+
+        """
+            Description:
+            Reads every byte until server closes connection
+
+            Returns:
+            data: The read bytes
+        """
+
+        while self.receive():
+            pass
+
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+    # End of readToEnd()
+
+
+
+    # Beginning of close()
+
+    def close(self):
+
+        """
+            Description:
+            Closes the connection
+        """
+
+        self.clientSocket.close()
+
+    # End of close()
+
+# End of HttpConnection
+
+
+
+# Beginning of HttpClient
+
+class HttpClient:
+
+    """
+        Description:
+        Client that sends HTTP GET request messages and reads the full HTTP response messages.
+        Connections are kept open after a response and put in a pool, one per server (IP-address and port),
+        so later requests to the same server reuse them instead of making a new TCP connection
+
+        Arguments:
+        timeout: Seconds to wait for server before giving up
+        maxIdle: Most open connections kept in the pool for each server
+    """
+
+
+    # Beginning of __init__()
+
+    def __init__(self, timeout = 10, maxIdle = 4):
+
+        self.timeout = timeout      # Seconds to wait for server before giving up
+        self.maxIdle = maxIdle      # Most idle connections kept per server
+
+        # Idle connections, (server IP, server port) mapped to a list of open connections
+        # Most recently used connection is last, since it is the least likely to have been closed by server
+        self.pool = {}
+
+    # End of __init__()
+
+
+
+    # Beginning of request()
+
+    def request(self, serverIP, serverPort, requestFile, connection = 'keep-alive'):
+
+        """
+            Description:
+            Sends an HTTP GET request message for a file and reads the full response message
+            Uses a connection from the pool if there is one. Server may have closed an idle connection
+            without client noticing, in that case the request is sent again once on a new connection
+
+            Arguments:
+            serverIP:    IP-address of server
+            serverPort:  port number attached to server socket
+            requestFile: file requested from server
+            connection:  "keep-alive" to keep connection in the pool, or "close" to use a new connection for every request
+
+            Returns:
+            httpResponse: The received response message as an HttpResponse
+        """
+
+
+        httpRequestMessage = httpGETWriter(serverIP, serverPort, requestFile, connection).encode()
+
+        while True:
+            httpConnection, reused = self.connect(serverIP, serverPort)
+
+            try:
+                httpConnection.send(httpRequestMessage)
+                httpResponse, keepAlive = httpResponseReader(httpConnection, 'GET')
+
+            # Pooled connection was closed by server while it was idle, GET can safely be sent again
+            except ConnectionError:
+                httpConnection.close()
+                if reused:
+                    continue
+                raise
+
+            except Exception:
+                httpConnection.close()
+                raise
+
+            # Connection is put back in the pool if server keeps it open
+            if keepAlive and connection != 'close':
+                self.release(httpConnection)
+            else:
+                httpConnection.close()
+
+            return httpResponse
+
+    # End of request()
+
+
+
+    # Beginning of download()
+
+    def download(self, serverIP, serverPort, requestFile, outputPath, buffer, progress = None):
+
+        """
+            Description:
+            Downloads a file to disk, streaming the body through buffer so it is never held in memory.
+            Body is written to outputPath + ".part", which is renamed to outputPath when it is complete
+
+            If a partial file is left from an earlier download, only the rest of the file is asked for with a "Range" field.
+            The entity tag or modification time of the file is kept next to the partial file and sent in an "If-Range" field,
+            so a file that has changed on the server is downloaded again from the start instead of being pieced together.
+            A server that ignores ranges sends the whole file, which then replaces the partial file
+
+            Raises ConnectionError if connection breaks in the middle of the body, the partial file is then kept
+
+            Arguments:
+            serverIP:    IP-address of server
+            serverPort:  port number attached to server socket
+            requestFile: file requested from server
+            outputPath:  Path the file is written to
+            buffer:      Bytearray the body is received into, reused for every download
+            progress:    Function called with bytes of the file on disk and size of the file as the body arrives. Is not required
+
+            Returns:
+            status:   Status code of the response. 200 or 206 if the file was written, 416 if it was already complete
+            reason:   Reason phrase of the response
+            received: Bytes of the body received
+        """
+
+
+        partPath = outputPath + '.part'
+        validatorPath = outputPath + '.part.validator'
+
+        # Partial file left from an earlier download, and what the file looked like when it was started
+        offset = os.path.getsize(partPath) if os.path.isfile(partPath) else 0
+        validator = None
+        if offset and os.path.isfile(validatorPath):
+            with open(validatorPath) as validatorFile:
+                validator = validatorFile.read().strip() or None
+
+        headerFields = {}
+        if offset:
+            headerFields['Range'] = f'bytes={offset}-'
+            if validator:
+                headerFields['If-Range'] = validator
+        httpRequestMessage = httpGETWriter(serverIP, serverPort, requestFile, 'keep-alive', headerFields).encode()
+
+
+        # Sends request and reads header. Pooled connection may have been closed by server, GET is then sent again once
+        while True:
+            httpConnection, reused = self.connect(serverIP, serverPort)
+            try:
+                httpConnection.send(httpRequestMessage)
+                header = httpConnection.readUntil(b'\r\n\r\n').decode('latin-1')
+            except ConnectionError:
+                httpConnection.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                httpConnection.close()
+                raise
+            break
+
+
+        sink = None
+        complete = False        # True if file on disk is complete once the body has been read
+        view = memoryview(buffer)
+        try:
+            version, status, reason, headers, keepAlive = httpHeaderParser(header)
+            framing, length = httpBodyFraming('GET', status, headers)
+            total = None
+
+            # Server sends the rest of the file, which must start where the partial file ends
+            if status == 206 and offset:
+                start, total = httpContentRangeParser(headers.get('content-range', ''))
+                if start != offset:
+                    raise ConnectionError(f'server sent range from byte {start}, partial file ends at byte {offset}')
+                sink = open(partPath, 'ab')
+
+            # Server sends the whole file, because it ignores ranges, file has changed, or nothing was downloaded before.
+            # Partial file is replaced, and the entity tag or modification time is kept for a later resume.
+            # Weak entity tags can not be used in "If-Range", modification time is used instead
+            elif status == 200:
+                offset = 0
+                total = length
+                sink = open(partPath, 'wb')
+                entityTag = headers.get('etag', '')
+                validator = entityTag if entityTag.startswith('"') else headers.get('last-modified')
+                with open(validatorPath, 'w') as validatorFile:
+                    validatorFile.write(validator or '')
+
+            # Partial file already has every byte of the file, or file has become smaller on the server,
+            # then partial file is removed and the file is downloaded again from the start
+            elif status == 416 and offset:
+                _, total = httpContentRangeParser(headers.get('content-range', ''))
+                if total != offset:
+                    os.remove(partPath)
+                    httpBodyStreamer(httpConnection, framing, length, None, view)
+                    httpConnection.close()
+                    return self.download(serverIP, serverPort, requestFile, outputPath, buffer, progress)
+
+            # Body of an error is read and thrown away below, so connection can be used again
+            complete = sink is not None or status == 416
+
+            reporter = None
+            if progress and complete:
+                progress(offset, total)
+                reporter = lambda received: progress(offset + received, total)
+
+            received = httpBodyStreamer(httpConnection, framing, length, sink, view, reporter)
+            if framing == 'close':
+                keepAlive = False
+
+        # Connection can not be used after a broken response, partial file is kept for a later resume
+        except BaseException:
+            httpConnection.close()
+            raise
+
+        finally:
+            view.release()
+            if sink:
+                sink.close()
+
+
+        # Download is complete, file gets its name and the validator is not needed anymore
+        if complete:
+            os.replace(partPath, outputPath)
+            if os.path.isfile(validatorPath):
+                os.remove(validatorPath)
+
+        # Connection is put back in the pool if server keeps it open
+        if keepAlive:
+            self.release(httpConnection)
+        else:
+            httpConnection.close()
+
+        return status, reason, received
+
+    # End of download()
+
+
+
+    # Beginning of connect()
+
+    def connect(self, serverIP, serverPort):
+
+        """
+            Description:
+            Takes an idle connection to server from the pool, or makes a new one if there is none
+
+            Arguments:
+            serverIP:   IP-address of server
+            serverPort: port number attached to server socket
+
+            Returns:
+            connection: An HttpConnection to server
+            reused:     True if connection was taken from the pool
+        """
+
+        idle = self.pool.get((serverIP, serverPort))
+        if idle:
+            return idle.pop(), True
+
+        return HttpConnection(serverIP, serverPort, self.timeout), False
+
+    # End of connect()
+
+
+
+    # Beginning of release()
+
+    def release(self, connection):
+
+        """
+            Description:
+            Puts a connection back in the pool after a response has been read completely
+            Connection is closed instead if the pool of its server is full
+
+            Argument:
+            connection: An HttpConnection with no unread response
+        """
+
+        idle = self.pool.setdefault(connection.address, [])
+        if len(idle) < self.maxIdle:
+            idle.append(connection)
+        else:
+            connection.close()
+
+    # End of release()
+
+
+
+    # Beginning of close()
+
+    def close(self):
+
+        """
+            Description:
+            Closes every idle connection in the pool
+        """
+
+        for idle in self.pool.values():
+            for connection in idle:
+                connection.close()
+        self.pool.clear()
+
+    # End of close()
+
+# End of HttpClient
+
+
+
+# Beginning of httpResponseReader()
+
+def httpResponseReader(connection, method):
+
+    """
+        Description:
+        Reads one full HTTP response message from a connection
+        Length of the body is found by httpBodyFraming()
+
+        Raises ConnectionError if server closes connection in the middle of the response,
+        or sends something that is not an HTTP response message
+
+        Arguments:
+        connection: HttpConnection the request message was sent on
+        method:     Method of the request message, like "GET"
+
+        Returns:
+        httpResponse: The received response message as an HttpResponse
+        keepAlive:    True if connection can be used for another request message
+    """
+
+
+    # Header is parsed the same way for blocking and asyncio connections
+    header = connection.readUntil(b'\r\n\r\n').decode('latin-1')
+    version, status, reason, headers, keepAlive = httpHeaderParser(header)
+    framing, length = httpBodyFraming(method, status, headers)
+
+
+    # Responses without a body
+    if framing == 'none':
+        body = b''
+
+    # Body is sent in chunks, each one after a line with its size in hexadecimal
+    elif framing == 'chunked':
+        body = httpChunkReader(connection, headers)
+
+    # Body is as long as "Content-Length" field says
+    elif framing == 'length':
+        body = connection.readExactly(length)
+
+    # Body ends when server closes connection, which can then not be used again
+    else:
+        body = connection.readToEnd()
+        keepAlive = False
+
+    return HttpResponse(version, status, reason, headers, body), keepAlive
+
+# End of httpResponseReader()
+
+
+
+# Beginning of httpHeaderParser()
+
+def httpHeaderParser(header):
+
+    """
+        Description:
+        Parses status line and header fields of an HTTP response message
+        Raises ConnectionError if status line is not the one of an HTTP response message
+
+        Argument:
+        header: Status line and header fields seperated by CRLF, without the blank line
+
+        Returns:
+        version:   HTTP version of the response, like "HTTP/1.1"
+        status:    Status code of the response, like 200
+        reason:    Reason phrase of the response, like "OK"
+        headers:   Dictionary of header fields, lower case field name mapped to value
+        keepAlive: True if server keeps connection open after the response
+    """
+
+
+    # Status line is formatted like this: "HTTP/1.1 200 OK"
+    lines = header.split('\r\n')
+    statusLine = lines[0].split(' ', 2)
+    if len(statusLine) < 2 or not statusLine[0].startswith('HTTP/') or not (statusLine[1].isascii() and statusLine[1].isdigit()):
+        raise ConnectionError(f'malformed status line: {lines[0]!r}')
+    version, status, reason = statusLine[0], int(statusLine[1]), statusLine[2] if len(statusLine) == 3 else ''
+
+
+    # Header fields are formatted like this: "Name: value"
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        name = name.strip().lower()
+        if name in headers:
+            headers[name] += ', ' + value.strip()
+        else:
+            headers[name] = value.strip()
+
+
+    # Server closes connection after the response if it says so, HTTP/1.0 servers do unless they say otherwise
+    options = [option.strip().lower() for option in headers.get('connection', '').split(',')]
+    keepAlive = 'close' not in options and (version != 'HTTP/1.0' or 'keep-alive' in options)
+
+    return version, status, reason, headers, keepAlive
+
+# End of httpHeaderParser()
+
+
+
+# Beginning of httpBodyFraming()
+
+def httpBodyFraming(method, status, headers):
+
+    """
+        Description:
+        Finds how the body of an HTTP response message is framed, the same way as HTTP/1.1 does:
+        no body for HEAD requests and 1xx, 204 and 304 responses, chunks if "Transfer-Encoding" is chunked,
+        "Content-Length" bytes if that field is sent, otherwise everything until server closes connection
+        Raises ConnectionError if "Content-Length" is not a number
+
+        Arguments:
+        method:  Method of the request message, like "GET"
+        status:  Status code of the response
+        headers: Header fields of the response
+
+        Returns:
+        framing: Either "none", "chunked", "length" or "close"
+        length:  Length of the body if framing is "length", otherwise None
+    """
+
+    if method == 'HEAD' or status < 200 or status in (204, 304):
+        return 'none', None
+
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        return 'chunked', None
+
+    if 'content-length' in headers:
+        # Only ASCII digits, since int() fails on other digits like "²"
+        contentLength = headers['content-length']
+        if not (contentLength.isascii() and contentLength.isdigit()):
+            raise ConnectionError('Content-Length is not a number')
+        return 'length', int(contentLength)
+
+    return 'close', None
+
+# End of httpBodyFraming()
+
+
+
+# Beginning of httpContentRangeParser()
+
+def httpContentRangeParser(contentRange):
+
+    """
+        Description:
+        Parses the "Content-Range" field of a 206 Partial Content or 416 Range Not Satisfiable response,
+        formatted like "bytes 100-199/1000", or "bytes */1000" for a 416
+        Raises ConnectionError if field is missing or can not be understood
+
+        Argument:
+        contentRange: Value of the "Content-Range" field
+
+        Returns:
+        start: First byte sent, None for a 416
+        total: Size of the whole file, None if server does not know it
+    """
+
+    unit, _, byteRange = contentRange.strip().partition(' ')
+    sent, _, total = byteRange.partition('/')
+    first, _, last = sent.partition('-')
+
+    # Only ASCII digits, since int() fails on other digits like "²"
+    digits = (first + last + total).replace('*', '')
+    if unit.lower() != 'bytes' or not (sent == '*' or first.isdigit() and last.isdigit()) or not (total == '*' or total.isdigit()) \
+            or not digits.isascii():
+        raise ConnectionError(f'malformed Content-Range: {contentRange!r}')
+
+    return int(first) if sent != '*' else None, int(total) if total != '*' else None
+
+# End of httpContentRangeParser()
+
+
+
+# Beginning of httpChunkReader()
+
+def httpChunkReader(connection, headers):
+
+    """
+        Description:
+        Reads a body sent with chunked transfer-encoding and joins the chunks
+        Chunk is a line with its size in hexadecimal, then the data and a CRLF. A chunk of size 0 ends the body,
+        it may be followed by trailer fields, which are added to headers
+
+        Arguments:
+        connection: HttpConnection the body is read from
+        headers:    Header fields of the response, trailer fields are added to them
+
+        Returns:
+        body: The joined chunks in the form of bytes
+    """
+
+
+    chunks = []
+    while True:
+        # Size may be followed by extensions after ";", which are ignored
+        sizeLine = connection.readUntil(b'\r\n').split(b';')[0].strip()
+        try:
+            size = int(sizeLine, 16)
+        except ValueError:
+            raise ConnectionError(f'malformed chunk size: {sizeLine!r}')
+
+        if size == 0:
+            break
+
+        chunks.append(connection.readExactly(size))
+        if connection.readExactly(2) != b'\r\n':
+            raise ConnectionError('chunk is not followed by CRLF')
+
+
+    # Trailer fields, ended by an empty line
+    while True:
+        line = connection.readUntil(b'\r\n').decode('latin-1')
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    return b''.join(chunks)
+
+# End of httpChunkReader()
+
+
+
+# Beginning of httpBodyStreamer()
+
+def httpBodyStreamer(connection, framing, length, sink, view, progress = None):
+
+    """
+        Description:
+        Streams a body from a connection to a file, a piece at a time through view, however it is framed.
+        Every piece is received into the same memory, so memory used stays the same no matter how large the body is
+        Raises ConnectionError if server closes connection in the middle of the body
+
+        Arguments:
+        connection: HttpConnection the body is read from
+        framing:    How the body is framed, from httpBodyFraming()
+        length:     Length of the body if framing is "length"
+        sink:       File the body is written to, None to throw it away
+        view:       Writable memoryview pieces of the body are received into
+        progress:   Function called with bytes of the body received so far after every piece. Is not required
+
+        Returns:
+        received: Bytes of the body received
+    """
+
+
+    # Bytes received so far, in a list so stream() below can count them
+    received = [0]
+
+    # Streams left bytes of the body, or bytes until server closes connection if left is None
+    def stream(left):
+        while left is None or left > 0:
+            count = connection.readInto(view, len(view) if left is None else min(len(view), left))
+            if not count:
+                if left is None:
+                    return
+                raise ConnectionError('server closed connection in the middle of a response')
+
+            if sink:
+                sink.write(view[:count])
+            received[0] += count
+            if left is not None:
+                left -= count
+            if progress:
+                progress(received[0])
+
+
+    # Body is as long as "Content-Length" field says
+    if framing == 'length':
+        stream(length)
+
+    # Body is sent in chunks, each one after a line with its size in hexadecimal
+    elif framing == 'chunked':
+        while True:
+            sizeLine = connection.readUntil(b'\r\n').split(b';')[0].strip()
+            try:
+                size = int(sizeLine, 16)
+            except ValueError:
+                raise ConnectionError(f'malformed chunk size: {sizeLine!r}')
+            if size == 0:
+                break
+
+            stream(size)
+            if connection.readExactly(2) != b'\r\n':
+                raise ConnectionError('chunk is not followed by CRLF')
+
+        # Trailer fields are skipped, an empty line ends them
+        while connection.readUntil(b'\r\n'):
+            pass
+
+    # Body ends when server closes connection
+    elif framing == 'close':
+        stream(None)
+
+    return received[0]
+
+# End of httpBodyStreamer()
+
+
+
+# Beginning of httpGETWriter()
+
+def  httpGETWriter(serverIP, serverPort, requestFile, connection = 'keep-alive', headerFields = None):
+
+    """
+        Description:
+        Writes HTTP GET request message with provided serverIP, serverPort and requestFile.
+        Inclueded fields in HTTP GET request message are: Host and Connection, followed by provided header fields
+
+        Arguments:
+        serverIP:    IP-address of server
+        serverPort:  port number attached to server socket
+        requestFile: file requested from server
+        connection:  "keep-alive" so server keeps connection open for more requests, or "close"
+        headerFields: Dictionary of other header fields, like "Range", field name mapped to value. Is not required
+
+        Returns:
+        httpRequestMessage: Fully written HTTP GET request message in the form of a string
+    """
+
+    # If requestFile starts with "/" it is removed
+    if requestFile != '' and requestFile.startswith('/'): requestFile = requestFile[1:]
+    # Other header fields, like "Range"
+    fields = ''.join(f'{name}: {value}\r\n' for name, value in headerFields.items()) if headerFields else ''
+    # Writes the HTTP GET request message
+    httpRequestMessage = f'GET /{requestFile} HTTP/1.1\r\n' \
+                         f'Host: {serverIP}:{serverPort}\r\n' \
+                         f'Connection: {connection}\r\n' \
+                         f'{fields}\r\n'
+
     return httpRequestMessage
 
 # End of httpGETWriter()
@@ -0,0 +1,466 @@
+"""
+    Index of the files the webservers can serve, built once when a server starts.
+
+    Every file below the document root is found by its URL path, like "/sub/page.html", with one dictionary lookup,
+    along with its size, modification time and MIME type. Requests for files that do not exist are answered
+    without opening anything, and a path can never lead outside the document root, since only indexed files are served.
+    Hidden files and directories, like .git, are never indexed.
+
+    Index is kept up to date by rescanning it every few seconds. Only directories whose modification time has changed,
+    because files were added, removed or renamed in them, are listed again, so a rescan costs one stat per directory.
+    Changes to the contents of a file are noticed by the file cache, which checks files it serves against the disk.
+
+    A path not in the index is checked on disk once, so a file added since the last rescan is found right away.
+    Paths that were not found are remembered in a bounded negative cache until the next rescan that finds changes,
+    so repeated requests for them cost a dictionary lookup
+"""
+
+import os               # imported so the document root can be scanned
+import stat             # imported so regular files can be told apart from other files
+import time             # imported so index is only rescanned once per interval
+import posixpath        # imported so URL paths can be normalized
+import mimetypes        # imported so MIME type of a file can be guessed from its name
+import threading        # imported so index can be shared by many threads
+from urllib.parse import unquote    # imported so percent-encoded URL paths can be decoded
+from collections import namedtuple, OrderedDict     # imported for indexed files and the negative cache in LRU order
+
+
+# Indexed file: path on disk, size in bytes, modification time in nanoseconds and value of its "Content-Type" field
+Document = namedtuple('Document', ['path', 'size', 'modified', 'contentType'])
+
+
+# Beginning of DocumentIndex
+
+class DocumentIndex:
+
+    """
+        Description:
+        Index of every file below the document root, URL path mapped to Document.
+        Safe to use from several threads at once, lookups never wait for a lock
+
+        Arguments:
+        root:           Document root, current directory by default
+        rescanInterval: Seconds between rescans of the directories in the index
+        maxMisses:      Most paths kept in the negative cache, least recently requested are forgotten first
+    """
+
+    # MIME types of files that are compressed with an encoding, so their compressed data is labeled as what it is
+    encodingTypes = {'gzip': 'application/gzip', 'bzip2': 'application/x-bzip2', 'xz': 'application/x-xz',
+                     'br': 'application/x-brotli', 'compress': 'application/x-compress'}
+
+
+    # Beginning of __init__()
+
+    def __init__(self, root = None, rescanInterval = 5, maxMisses = 4096):
+
+        self.root = os.path.realpath(root or os.getcwd())  # Document root, with symbolic links resolved
+        self.rescanInterval = rescanInterval
+        self.maxMisses = maxMisses
+
+        # URL path mapped to Document. Replaced by a new dictionary when a rescan finds changes,
+        # so a lookup always sees a whole index. "/" and "/sub/" are mapped to the index.html in them
+        self.documents = {}
+        # Directory relative to root ("" is root) mapped to [modification time, its URL paths, its subdirectories]
+        self.directories = {}
+        # URL paths not found, in least recently requested order
+        self.misses = OrderedDict()
+
+        self.scannedAt = None                   # Time of last scan from time.monotonic(), None before first scan
+        self.scanLock = threading.Lock()        # Only one thread scans at a time, others keep using the index
+        self.missLock = threading.Lock()        # Guards the negative cache
+
+        self.lookups = 0                        # Requests found in the index
+        self.notFound = 0                       # Requests for files that do not exist
+
+    # End of __init__()
+
+
+
+    # Beginning of lookup()
+
+    def lookup(self, target):
+
+        """
+            Description:
+            Finds the file a request target asks for. Index is rescanned first if rescan interval has passed.
+            Target is normalized first: query is removed, percent-encoding is decoded, and "." and ".." are resolved,
+            so "/a/../index.html" is the same as "/index.html" and no path can climb above the document root
+
+            Argument:
+            target: Target of the request line, like "/sub/page.html?x=1"
+
+            Returns:
+            document: Document of the requested file, None if it does not exist
+        """
+
+
+        # Whole index is built by the first lookup if scan() was not called when server started
+        # After that it is kept fresh by the thread that notices a rescan is due, other threads do not wait for it
+        if self.scannedAt is None:
+            self.scan()
+        elif time.monotonic() - self.scannedAt >= self.rescanInterval:
+            self.rescan()
+
+        # Target that is already normal is found without normalizing it
+        documents = self.documents
+        document = documents.get(target)
+        if document is not None:
+            self.lookups += 1
+            return document
+
+        path = self.pathNormalizer(target)
+        document = documents.get(path) if path is not None else None
+        if document is not None:
+            self.lookups += 1
+            return document
+
+
+        # Paths known not to exist are answered from the negative cache
+        with self.missLock:
+            if path is None or path in self.misses:
+                if path is not None:
+                    self.misses.move_to_end(path)
+                self.notFound += 1
+                return None
+
+        # File may have been added since the last rescan, it is checked on disk once
+        document = self.documentFinder(path)
+        if document is not None:
+            # File is added to the index if its directory is indexed, so the next rescan of it removes it again if it is gone
+            # Index is only changed under scanLock, since a rescan copies it and shares the lists of paths with the copy.
+            # If a scan is running, the file is left to it, or to the next rescan, and found on disk until then
+            if self.scanLock.acquire(blocking = False):
+                try:
+                    directory = self.directories.get(path[1:path.rfind('/')])
+                    if directory is not None:
+                        directory[1].append(path)
+                        self.documents[path] = document
+                finally:
+                    self.scanLock.release()
+            self.lookups += 1
+            return document
+
+        with self.missLock:
+            self.misses[path] = None
+            if len(self.misses) > self.maxMisses:
+                self.misses.popitem(last = False)
+            self.notFound += 1
+
+        return None
+
+    # End of lookup()
+
+
+
+    # Beginning of pathNormalizer()
+
+    def pathNormalizer(self, target):
+
+        """
+            Description:
+            Normalizes a request target to the form URL paths have in the index
+
+            Argument:
+            target: Target of the request line
+
+            Returns:
+            path: Normalized URL path starting with "/", ending with "/" if target did,
+                  None if target can not be a path of a file
+        """
+
+
+        # Query and fragment are not part of the path
+        path = target.split('?', 1)[0].split('#', 1)[0]
+        if not path.startswith('/'):
+            return None
+
+        # Percent-encoding is decoded before "." and ".." are resolved, so "%2e%2e" can not slip through
+        path = unquote(path)
+        if '\0' in path or '\\' in path:
+            return None
+
+        # Resolves "//", "." and "..", ".." can not go above "/", so path stays inside the document root
+        normalPath = posixpath.normpath(path)
+        if normalPath.startswith('//'):
+            normalPath = '/' + normalPath.lstrip('/')
+        if path.endswith('/') and normalPath != '/':
+            normalPath += '/'
+
+        return normalPath
+
+    # End of pathNormalizer()
+
+
+
+    # Beginning of documentFinder()
+
+    def documentFinder(self, path):
+
+        """
+            Description:
+            Checks on disk if a normalized URL path is a file that can be served, one stat for a file
+            Hidden files and files outside the document root, like targets of symbolic links, are not served
+
+            Argument:
+            path: Normalized URL path
+
+            Returns:
+            document: Document of the file, None if it can not be served
+        """
+
+
+        # Directory path is a request for the index.html in it
+        if path.endswith('/'):
+            path += 'index.html'
+
+        if any(part.startswith('.') for part in path.split('/') if part):
+            return None
+
+        filePath = os.path.join(self.root, path.lstrip('/'))
+        try:
+            status = os.stat(filePath)
+            if not stat.S_ISREG(status.st_mode) or \
+               not os.path.realpath(filePath).startswith(self.root + os.sep):
+                return None
+        except (OSError, ValueError):
+            return None
+
+        return Document(filePath, status.st_size, status.st_mtime_ns, self.contentTypeGuesser(filePath))
+
+    # End of documentFinder()
+
+
+
+    # Beginning of contentTypeGuesser()
+
+    def contentTypeGuesser(self, filePath):
+
+        """
+            Description:
+            Guesses the "Content-Type" field of a file from its name. Text is labeled as UTF-8,
+            files of unknown type as "application/octet-stream", so browsers download them instead of guessing
+
+            Argument:
+            filePath: Path or name of the file
+
+            Returns:
+            contentType: Value of the "Content-Type" field, like "text/css; charset=UTF-8"
+        """
+
+
+        contentType, encoding = mimetypes.guess_type(filePath)
+
+        # "page.tar.gz" is gzip data, it is sent as it is, not as a tar file
+        if encoding is not None:
+            return self.encodingTypes.get(encoding, 'application/octet-stream')
+        if contentType is None:
+            return 'application/octet-stream'
+        if contentType.startswith('text/') or contentType in ('application/javascript', 'application/json'):
+            return contentType + '; charset=UTF-8'
+
+        return contentType
+
+    # End of contentTypeGuesser()
+
+
+
+    # Beginning of scan()
+
+    def scan(self):
+
+        """
+            Description:
+            Builds the index from scratch by scanning every directory below the document root
+        """
+
+        with self.scanLock:
+            documents, directories = {}, {}
+            self.directoryScanner('', documents, directories)
+
+            self.documents, self.directories = documents, directories
+            with self.missLock:
+                self.misses.clear()
+            self.scannedAt = time.monotonic()
+
+    # End of scan()
+
+
+
+    # Beginning of rescan()
+
+    def rescan(self):
+
+        """
+            Description:
+            Brings the index up to date. Every indexed directory is checked with one stat, only directories
+            whose modification time has changed are listed again, and directories that are gone are removed.
+            Does nothing if another thread is already scanning, that thread brings the index up to date
+        """
+
+
+        if not self.scanLock.acquire(blocking = False):
+            return
+
+        try:
+            documents, directories = None, None     # Copies of the index, made when the first change is found
+
+            for directory, (modified, paths, subdirectories) in list(self.directories.items()):
+                # Directory may have been removed by the change to its parent directory already
+                if directories is not None and directory not in directories:
+                    continue
+
+                try:
+                    currentModified = os.stat(os.path.join(self.root, directory)).st_mtime_ns
+                except OSError:
+                    currentModified = None
+
+                if currentModified == modified:
+                    continue
+
+                # Index is copied before it is changed, lookups keep using the old one meanwhile
+                if documents is None:
+                    documents, directories = dict(self.documents), dict(self.directories)
+
+                # Forgets the directory, and everything below it
+                self.directoryRemover(directory, documents, directories)
+
+                # Directory still exists, it is listed again along with subdirectories that are new
+                if currentModified is not None:
+                    self.directoryScanner(directory, documents, directories)
+
+            # Changes are put in place at once, paths that were not found may exist now
+            if documents is not None:
+                self.documents, self.directories = documents, directories
+                with self.missLock:
+                    self.misses.clear()
+
+            self.scannedAt = time.monotonic()
+
+        finally:
+            self.scanLock.release()
+
+    # End of rescan()
+
+
+
+    # Beginning of directoryScanner()
+
+    def directoryScanner(self, directory, documents, directories):
+
+        """
+            Description:
+            Lists a directory and adds its files to the index, then scans its subdirectories the same way
+            Hidden files and directories, and symbolic links leading outside the document root, are skipped
+
+            Arguments:
+            directory:   Directory relative to root, "" for root itself
+            documents:   Index being built, URL path mapped to Document
+            directories: Directories being built, directory mapped to [modification time, URL paths, subdirectories]
+        """
+
+
+        pending = [directory]       # Directories left to list, subdirectories are added as they are found
+
+        while pending:
+            directory = pending.pop()
+            directoryPath = os.path.join(self.root, directory)
+            urlDirectory = '/' + directory + '/' if directory else '/'
+            paths, subdirectories = [], []
+
+            try:
+                modified = os.stat(directoryPath).st_mtime_ns
+                entries = list(os.scandir(directoryPath))
+            except OSError:
+                continue
+
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    # Directories are scanned too, but symbolic links to directories are not followed
+                    if entry.is_dir(follow_symlinks = False):
+                        subdirectory = entry.name if not directory else directory + '/' + entry.name
+                        subdirectories.append(subdirectory)
+                        if subdirectory not in directories:
+                            pending.append(subdirectory)
+                        continue
+
+                    if entry.is_symlink() and not os.path.realpath(entry.path).startswith(self.root + os.sep):
+                        continue
+                    status = entry.stat()
+                except OSError:
+                    continue
+
+                if not stat.S_ISREG(status.st_mode):
+                    continue
+
+                urlPath = urlDirectory + entry.name
+                document = Document(entry.path, status.st_size, status.st_mtime_ns, self.contentTypeGuesser(entry.name))
+                documents[urlPath] = document
+                paths.append(urlPath)
+
+                # "/sub/" is a request for "/sub/index.html"
+                if entry.name == 'index.html':
+                    documents[urlDirectory] = document
+                    paths.append(urlDirectory)
+
+            directories[directory] = [modified, paths, subdirectories]
+
+    # End of directoryScanner()
+
+
+
+    # Beginning of directoryRemover()
+
+    def directoryRemover(self, directory, documents, directories):
+
+        """
+            Description:
+            Removes a directory from the index, along with its files and everything below it
+
+            Arguments:
+            directory:   Directory relative to root, "" for root itself
+            documents:   Index being changed, URL path mapped to Document
+            directories: Directories being changed
+        """
+
+
+        pending = [directory]
+
+        while pending:
+            entry = directories.pop(pending.pop(), None)
+            if entry is None:
+                continue
+
+            _, paths, subdirectories = entry
+            for urlPath in paths:
+                documents.pop(urlPath, None)
+            pending.extend(subdirectories)
+
+    # End of directoryRemover()
+
+
+
+    # Beginning of stats()
+
+    def stats(self):
+
+        """
+            Description:
+            Returns counters of the index
+
+            Returns:
+            stats: Dictionary with indexed files, directories, lookups, requests for missing files and cached misses
+        """
+
+        return {
+            'files': len(self.documents),
+            'directories': len(self.directories),
+            'lookups': self.lookups,
+            'not found': self.notFound,
+            'cached misses': len(self.misses)
+        }
+
+    # End of stats()
+
+# End of DocumentIndex
@@ -0,0 +1,300 @@
+"""
+    In-memory cache of files served by the webservers.
+    Files are kept in memory until the cache grows past its byte budget,
+    then the least recently used files are removed first.
+
+    A cached file is checked against the disk at most once per check interval,
+    if its modification time or size has changed since, it is read again.
+    Between checks, files are served without touching the file system at all
+
+    Files at or above the stream threshold are never read into memory,
+    they are opened so the webserver can stream them with sendfile
+
+    Variants of a cached file, like its compressed data, are cached with it and count against the byte budget.
+    They are made once per version of the file, and thrown away with it when the file changes.
+    A file that is not cached gets its variants made again for every request
+"""
+
+import os               # imported so files can be checked with stat
+import time             # imported so files are only checked once per interval
+import threading        # imported so cache can be shared by many threads
+from collections import OrderedDict     # imported to keep cached files in least recently used order
+
+
+# Beginning of FileCache
+
+class FileCache:
+
+    """
+        Description:
+        Process wide cache of file contents, keyed by the path resolved against root directory.
+        Safe to use from several threads at once
+
+        Counts hits, misses and evictions, so the byte budget can be sized from real traffic
+
+        Arguments:
+        maxBytes:        Byte budget. Files larger than this are never cached
+        checkInterval:   Seconds between checking a cached file's modification time on disk
+        streamThreshold: Files of this many bytes or more are opened instead of read
+        root:            Directory relative paths are resolved against, current directory by default
+    """
+
+
+    # Beginning of __init__()
+
+    def __init__(self, maxBytes, checkInterval, streamThreshold, root = None):
+
+        self.maxBytes = maxBytes                        # Byte budget of the cache
+        self.checkInterval = checkInterval              # Seconds between checks of a cached file
+        self.streamThreshold = streamThreshold          # Size from which files are streamed instead of read
+        self.root = root or os.getcwd()                 # Directory relative paths are resolved against
+
+        # Cached files, path mapped to [data, size, modification time, time of last check, variants]
+        # Variants is a dictionary, name of variant mapped to its data. Least recently used file is first
+        self.entries = OrderedDict()
+        self.bytes = 0                                  # Bytes currently cached, variants included
+
+        self.hits = 0                                   # Requests served from memory
+        self.misses = 0                                 # Requests that read the file from disk
+        self.evictions = 0                              # Files removed to stay within the byte budget
+
+        # Cache is shared by all worker threads
+        self.lock = threading.Lock()
+
+    # End of __init__()
+
+
+
+    # Beginning of read()
+
+    def read(self, path):
+
+        """
+            Description:
+            Returns contents of a file, from memory if it is cached and fresh.
+            File is read from disk and cached if it is not cached, or if it has changed on disk
+            File at or above the stream threshold is opened in binary mode and returned unread
+
+            Raises FileNotFoundError, like open() does, if file does not exist
+
+            Argument:
+            path: Path of the file, relative to root directory
+
+            Returns:
+            data:     Contents of the file in the form of bytes,
+                      or an open file in binary mode that must be closed by the caller
+            modified: Modification time of the file in seconds since epoch
+        """
+
+
+        # Resolves path without a system call, so hits never touch the file system
+        key = os.path.normpath(os.path.join(self.root, path))
+        now = time.monotonic()
+
+
+        # Serves file from memory if it was checked against the disk recently
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[3] < self.checkInterval:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[2] // 1_000_000_000
+
+
+        # Checks file on disk, file that is gone is removed from cache
+        try:
+            status = os.stat(key)
+        except FileNotFoundError:
+            with self.lock:
+                self.remove(key)
+            raise
+
+
+        # File has not changed since it was cached, only time of last check is updated
+        if entry is not None and entry[1] == status.st_size and entry[2] == status.st_mtime_ns:
+            with self.lock:
+                entry[3] = now
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                self.hits += 1
+            return entry[0], entry[2] // 1_000_000_000
+
+
+        # File may have been replaced since it was checked, so the open file is checked again
+        try:
+            requestedFile = open(key, 'rb')
+        except FileNotFoundError:
+            with self.lock:
+                self.remove(key)
+            raise
+        status = os.fstat(requestedFile.fileno())
+
+        # Large file is opened and streamed by the caller, it is not counted as a miss since it is never cached
+        if status.st_size >= self.streamThreshold:
+            with self.lock:
+                self.remove(key)
+            return requestedFile, status.st_mtime_ns // 1_000_000_000
+
+        # Reads file from disk, and checks it again after, since it may be written to while it is read
+        with requestedFile:
+            data = requestedFile.read()
+            after = os.fstat(requestedFile.fileno())
+        changed = len(data) != after.st_size or after.st_mtime_ns != status.st_mtime_ns
+
+
+        # Caches file if it fits within the byte budget, least recently used files are evicted to make room
+        # File that changed while it was read is sent as it was read, but not cached, the next request reads it again
+        # Size stored and counted is what was read, so the budget and the check against the disk agree with the data
+        with self.lock:
+            self.misses += 1
+            self.remove(key)
+
+            if not changed and len(data) <= self.maxBytes:
+                self.entries[key] = [data, len(data), status.st_mtime_ns, now, {}]
+                self.bytes += len(data)
+                self.evict()
+
+        return data, status.st_mtime_ns // 1_000_000_000
+
+    # End of read()
+
+
+
+    # Beginning of variant()
+
+    def variant(self, path, data, name, variantMaker):
+
+        """
+            Description:
+            Returns a variant of a cached file, like its compressed data.
+            Variant is made by variantMaker the first time it is asked for, and cached with the file,
+            so it is made once per version of the file instead of once per request
+
+            File should just have been read with read(). If it is not cached, because the cache is off or the file
+            is larger than the byte budget, variant is made from data and returned without being cached
+
+            Arguments:
+            path:         Path of the file, relative to root directory
+            data:         Data of the file as read() returned it, used when the file is not cached
+            name:         Name of the variant, like "gzip"
+            variantMaker: Function called as variantMaker(data, resolvedPath, name), returns data of the variant,
+                          or None if the variant is not worth sending
+
+            Returns:
+            variant: Data of the variant in the form of bytes, None if there is no variant
+        """
+
+
+        key = os.path.normpath(os.path.join(self.root, path))
+
+        # Variant is served from memory if it has been made for this version of the file
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and name in entry[4]:
+                return entry[4][name]
+
+
+        # Makes variant without holding the lock, so other threads are not kept waiting
+        # File that is not cached gets its variant made for this request only
+        if entry is None:
+            return variantMaker(data, key, name)
+        variant = variantMaker(entry[0], key, name)
+
+
+        # Caches variant if the file has not changed or been evicted meanwhile
+        with self.lock:
+            if self.entries.get(key) is entry and name not in entry[4]:
+                entry[4][name] = variant
+                self.bytes += len(variant or b'')
+                self.entries.move_to_end(key)
+                self.evict()
+
+        return variant
+
+    # End of variant()
+
+
+
+    # Beginning of evict()
+
+    def evict(self):
+
+        """
+            Description:
+            Removes least recently used files until cache is within its byte budget. Lock must be held by caller
+        """
+
+        while self.bytes > self.maxBytes:
+            _, evicted = self.entries.popitem(last = False)
+            self.bytes -= self.entrySize(evicted)
+            self.evictions += 1
+
+    # End of evict()
+
+
+
+    # Beginning of entrySize()
+
+    def entrySize(self, entry):
+
+        """
+            Description:
+            Counts bytes a cached file takes, variants included
+
+            Argument:
+            entry: A cached file
+
+            Returns:
+            size: Bytes of the file and its variants
+        """
+
+        return entry[1] + sum(len(variant or b'') for variant in entry[4].values())
+
+    # End of entrySize()
+
+
+
+    # Beginning of remove()
+
+    def remove(self, key):
+
+        """
+            Description:
+            Removes a file from the cache if it is cached. Lock must be held by caller
+
+            Argument:
+            key: Resolved path of the file
+        """
+
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= self.entrySize(entry)
+
+    # End of remove()
+
+
+
+    # Beginning of stats()
+
+    def stats(self):
+
+        """
+            Description:
+            Returns counters of the cache, used to size the byte budget
+
+            Returns:
+            stats: Dictionary with hits, misses, evictions, cached files and cached bytes
+        """
+
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'files': len(self.entries),
+                'bytes': self.bytes
+            }
+
+    # End of stats()
+
+# End of FileCache
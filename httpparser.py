@@ -0,0 +1,256 @@
+"""
+    Incremental parser for HTTP request messages, used by the webservers.
+    Received bytes are fed to the parser as they arrive, in pieces of any size.
+    Parser finds complete request messages in them, in the order they were sent,
+    so a request split over several TCP segments, or several pipelined requests in one, are handled the same way.
+
+    Every request message is parsed once: request line is split into method, target and version,
+    and header fields are put in a dictionary with lower case names, so later lookups are one dictionary access
+"""
+
+
+# Beginning of HttpParseError
+
+class HttpParseError(Exception):
+
+    """
+        Description:
+        Raised when received bytes are not a valid HTTP request message.
+        Connection can not be trusted after this, the webserver answers with status and closes it
+
+        Arguments:
+        status:  HTTP status the webserver answers with, like "400 Bad Request"
+        message: Description of what was wrong
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# End of HttpParseError
+
+
+
+# Beginning of HttpRequest
+
+class HttpRequest:
+
+    """
+        Description:
+        A parsed HTTP request message
+
+        Arguments:
+        method:  Method of the request, like "GET"
+        target:  Requested target, like "/index.html"
+        version: HTTP version of the request, like "HTTP/1.1"
+        headers: Dictionary of header fields, lower case field name mapped to value without surrounding whitespace.
+                 Fields that appear several times have their values joined with ", "
+    """
+
+    __slots__ = ('method', 'target', 'version', 'headers')
+
+    def __init__(self, method, target, version, headers):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+
+# End of HttpRequest
+
+
+
+# Beginning of HttpRequestParser
+
+class HttpRequestParser:
+
+    """
+        Description:
+        Buffers received bytes of one connection and parses complete HTTP request messages out of them.
+        Bytes are only searched once for the blank line ending a header, also when they arrive a few at a time
+
+        Arguments:
+        maxHeaderBytes:  Largest header the parser accepts. A larger header raises HttpParseError,
+                         so a client can not make the buffer grow without end
+        maxHeaderFields: Most header fields the parser accepts, more raise HttpParseError
+        maxBodyBytes:    Largest request body the parser skips, a larger "Content-Length" raises HttpParseError,
+                         so a client can not keep the connection busy sending a body nobody reads
+    """
+
+
+    # Beginning of __init__()
+
+    def __init__(self, maxHeaderBytes = 65536, maxHeaderFields = 100, maxBodyBytes = 1024 * 1024):
+
+        self.maxHeaderBytes = maxHeaderBytes    # Largest accepted header in bytes
+        self.maxHeaderFields = maxHeaderFields  # Most accepted header fields
+        self.maxBodyBytes = maxBodyBytes        # Largest accepted body in bytes
+        self.buffer = bytearray()               # Received bytes
+        self.start = 0                          # Where next request message starts in buffer
+        self.searched = 0                       # Bytes from start already searched for the end of the header
+        self.skip = 0                           # Bytes of a request body still to be skipped
+
+    # End of __init__()
+
+
+
+    # Beginning of feed()
+
+    def feed(self, received):
+
+        """
+            Description:
+            Adds received bytes to the buffer
+
+            Argument:
+            received: Bytes received from the connection
+        """
+
+        # Bytes of a request body the server does not use are dropped as they arrive
+        if self.skip:
+            skipped = min(self.skip, len(received))
+            self.skip -= skipped
+            received = memoryview(received)[skipped:]
+
+        self.buffer += received
+
+    # End of feed()
+
+
+
+    # Beginning of pending()
+
+    def pending(self):
+
+        """
+            Description:
+            Tells if buffer holds bytes of a request message that is not complete yet
+
+            Returns:
+            pending: True if there are unparsed bytes in the buffer
+        """
+
+        return len(self.buffer) > self.start or self.skip > 0
+
+    # End of pending()
+
+
+
+    # Beginning of next()
+
+    def next(self):
+
+        """
+            Description:
+            Parses the next complete request message in the buffer
+
+            Returns:
+            httpRequest: The parsed request message as an HttpRequest,
+                         None if no complete request message has been received yet
+        """
+
+
+        # Empty lines before a request line are ignored, some clients send one after a request body
+        while self.buffer.startswith(b'\r\n', self.start):
+            self.start += 2
+
+        # Searches for the blank line ending the header, only bytes that have not been searched before
+        # The last three searched bytes are searched again, since the blank line may start in them
+        searchFrom = self.start + max(self.searched - 3, 0)
+        end = self.buffer.find(b'\r\n\r\n', searchFrom)
+
+        # Header is not complete yet
+        if end == -1:
+            self.searched = len(self.buffer) - self.start
+            if self.searched > self.maxHeaderBytes:
+                raise HttpParseError('431 Request Header Fields Too Large', 'header is too large')
+            return None
+
+        if end - self.start > self.maxHeaderBytes:
+            raise HttpParseError('431 Request Header Fields Too Large', 'header is too large')
+
+
+        # Header is decoded once, latin-1 maps every byte to a character, so decoding never fails
+        with memoryview(self.buffer) as view:
+            header = str(view[self.start:end], 'latin-1')
+        httpRequest = self.headerParser(header)
+
+        # Next request message starts after the blank line
+        self.start = end + 4
+        self.searched = 0
+
+
+        # Body of request is skipped, so pipelined request messages after it are found
+        # Only ASCII digits are a number here, isdigit() alone also accepts characters like "²", which int() refuses
+        contentLength = httpRequest.headers.get('content-length', '0')
+        if not (contentLength.isascii() and contentLength.isdigit()):
+            raise HttpParseError('400 Bad Request', 'Content-Length is not a number')
+        contentLength = int(contentLength)
+        if 'transfer-encoding' in httpRequest.headers:
+            raise HttpParseError('501 Not Implemented', 'request bodies with Transfer-Encoding are not supported')
+        if contentLength > self.maxBodyBytes:
+            raise HttpParseError('413 Content Too Large', f'body of {contentLength} bytes is too large')
+
+        skipped = min(contentLength, len(self.buffer) - self.start)
+        self.start += skipped
+        self.skip = contentLength - skipped
+
+
+        # Parsed bytes are removed from buffer when they are at least half of it, so it is not moved for every request
+        if self.start > len(self.buffer) // 2:
+            del self.buffer[:self.start]
+            self.start = 0
+
+        return httpRequest
+
+    # End of next()
+
+
+
+    # Beginning of headerParser()
+
+    def headerParser(self, header):
+
+        """
+            Description:
+            Parses request line and header fields of a request message
+
+            Argument:
+            header: Request line and header fields seperated by CRLF, without the blank line
+
+            Returns:
+            httpRequest: The parsed request message as an HttpRequest
+        """
+
+
+        lines = header.split('\r\n')
+        if len(lines) - 1 > self.maxHeaderFields:
+            raise HttpParseError('431 Request Header Fields Too Large', f'more than {self.maxHeaderFields} header fields')
+
+        # Request line is formatted like this: "GET /file HTTP/1.1"
+        requestLine = lines[0].split()
+        if len(requestLine) != 3 or not requestLine[2].startswith('HTTP/'):
+            raise HttpParseError('400 Bad Request', f'malformed request line: {lines[0]!r}')
+        method, target, version = requestLine
+
+
+        # Header fields are formatted like this: "Name: value"
+        headers = {}
+        for line in lines[1:]:
+            name, colon, value = line.partition(':')
+            if not colon or not name or name != name.strip():
+                raise HttpParseError('400 Bad Request', f'malformed header field: {line!r}')
+
+            name = name.lower()
+            value = value.strip()
+
+            # Fields that appear several times are joined into one
+            if name in headers:
+                headers[name] += ', ' + value
+            else:
+                headers[name] = value
+
+        return HttpRequest(method, target, version, headers)
+
+    # End of headerParser()
+
+# End of HttpRequestParser
@@ -0,0 +1,337 @@
+"""
+    In-process metrics of the webservers, written in Prometheus text format when /metrics is requested.
+
+    Every thread counts in its own shard, a row of 64-bit counters no other thread writes to,
+    so counting a request never waits for a lock. Shards are only added together when metrics are scraped.
+    Shards are kept in an anonymous shared memory map, so worker processes forked after the registry
+    is made count in the same memory, and a scrape answered by any of them shows the whole server
+
+    Values that are already kept elsewhere, like the file cache's hits or the length of the accept queue,
+    are read from callbacks when metrics are scraped, they describe the process answering the scrape
+"""
+
+import os               # imported so forked worker processes get shards of their own
+import mmap             # imported so shards are shared with forked worker processes
+import threading        # imported so every thread gets its own shard
+import multiprocessing  # imported so shards are handed out safely across worker processes
+import weakref          # imported so the shard of a thread is given back when the thread exits
+import contextlib       # imported so counting in a shard of its own takes no lock
+from bisect import bisect_left  # imported so the bucket of a request duration is found quickly
+
+
+# Beginning of ShardToken
+
+class ShardToken:
+
+    """
+        Description:
+        Kept only by the thread-local storage of a thread, so it is thrown away when the thread exits.
+        Plain objects cannot be watched by weakref.finalize, instances of this class can
+    """
+
+# End of ShardToken
+
+
+
+# Beginning of MetricsRegistry
+
+class MetricsRegistry:
+
+    """
+        Description:
+        Registry of the webserver's metrics: requests by status, a histogram of request durations,
+        bytes sent, and connections opened and closed. Safe to use from several threads and forked processes at once
+
+        Arguments:
+        maxShards: Most shards. Every thread that counts something uses one until it exits, it is then given back
+                   and handed to the next new thread, with its counts kept. The last shard is kept for overflow:
+                   if more than maxShards - 1 threads count at once, across every worker process, the threads beyond
+                   that share it, and count in it under a lock, which is slower but loses no counts.
+                   Shards of a worker process that crashes are not given back
+    """
+
+    # Statuses counted on their own, any other status is counted as "other"
+    statuses = ('200', '206', '304', '400', '404', '408', '413', '416', '431', '500', '501', '503', 'other')
+
+    # Upper edges of the request duration buckets in seconds, the last bucket has no upper edge
+    durationBuckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+    # Beginning of __init__()
+
+    def __init__(self, maxShards = 1024):
+
+        # Place of every counter in a shard
+        self.requestsAt = 0                                             # Requests by status
+        self.bucketsAt = self.requestsAt + len(self.statuses)           # Requests by duration bucket
+        self.durationAt = self.bucketsAt + len(self.durationBuckets) + 1    # Sum of durations in nanoseconds
+        self.bytesAt = self.durationAt + 1                              # Bytes of responses sent
+        self.openedAt = self.bytesAt + 1                                # Connections opened
+        self.closedAt = self.openedAt + 1                               # Connections closed
+        self.shardSize = self.closedAt + 1                              # Counters in a shard
+
+        # Status mapped to place of its counter, so counting a request is one dictionary lookup
+        self.statusIndex = {status: self.requestsAt + index for index, status in enumerate(self.statuses)}
+
+        # Header comes first: shards handed out, shards given back and a stack of the shards given back.
+        # Shards follow. Anonymous maps are shared with forked processes
+        self.maxShards = maxShards
+        headerSize = 2 + maxShards
+        self.memory = mmap.mmap(-1, (headerSize + maxShards * self.shardSize) * 8)
+        header = memoryview(self.memory)[:headerSize * 8].cast('q')
+        self.handedOut = header[0:1]                    # Shards ever used, counted when metrics are scraped
+        self.givenBack = header[1:2]                    # Shards on the stack below
+        self.freeShards = header[2:]                    # Shards of exited threads, waiting for a new thread
+        self.shards = memoryview(self.memory)[headerSize * 8:].cast('q')
+
+        self.lock = multiprocessing.Lock()          # Guards handing out and giving back shards, taken once per thread
+        self.overflowLock = multiprocessing.Lock()  # Guards counting in the overflow shard, shared by many threads
+        self.noLock = contextlib.nullcontext()      # Taken instead when a thread counts in a shard of its own
+        self.local = threading.local()              # Shard of the current thread
+        self.callbacks = []                     # Metrics read from callbacks, (name, type, help, callback)
+
+        # Forked process must not keep counting in the shard of the thread that forked it, the parent still uses it
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child = self.forked)
+
+    # End of __init__()
+
+
+
+    # Beginning of shard()
+
+    def shard(self):
+
+        """
+            Description:
+            Returns the shard of the current thread, one is handed out the first time a thread asks.
+            A shard given back by an exited thread is handed out first, a new one if there is none,
+            and the overflow shard if every other shard is in use
+
+            Returns:
+            shard: Counters of the current thread, a memoryview of 64-bit integers
+            lock:  Lock taken while counting in the shard. A lock that does nothing, unless shard is the overflow shard
+        """
+
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            overflow = self.maxShards - 1
+            with self.lock:
+                if self.givenBack[0]:
+                    self.givenBack[0] -= 1
+                    index = self.freeShards[self.givenBack[0]]
+                else:
+                    index = min(self.handedOut[0], overflow)
+                    self.handedOut[0] = index + 1
+
+            shard = self.local.shard = self.shards[index * self.shardSize:(index + 1) * self.shardSize]
+            self.local.lock = self.overflowLock if index == overflow else self.noLock
+
+            # Shard is given back when the thread exits, since its thread-local token is then thrown away
+            if index != overflow:
+                self.local.token = token = ShardToken()
+                weakref.finalize(token, self.shardReleaser, index, os.getpid())
+
+        return shard, self.local.lock
+
+    # End of shard()
+
+
+
+    # Beginning of shardReleaser()
+
+    def shardReleaser(self, index, pid):
+
+        """
+            Description:
+            Gives back the shard of an exited thread, so a new thread can use it. Counts in it are kept
+
+            Arguments:
+            index: Place of the shard
+            pid:   Process the shard was handed out in. A forked process throws away the shards of the threads
+                   of its parent without giving them back, since the parent still uses them
+        """
+
+        if os.getpid() != pid:
+            return
+
+        with self.lock:
+            self.freeShards[self.givenBack[0]] = index
+            self.givenBack[0] += 1
+
+    # End of shardReleaser()
+
+
+
+    # Beginning of forked()
+
+    def forked(self):
+
+        """
+            Description:
+            Called in a newly forked process, threads of the process get new shards when they first count something
+        """
+
+        self.local = threading.local()
+
+    # End of forked()
+
+
+
+    # Beginning of requestRecorder()
+
+    def requestRecorder(self, status, seconds, sentBytes):
+
+        """
+            Description:
+            Counts an answered request
+
+            Arguments:
+            status:    HTTP status of the response, like "200 OK"
+            seconds:   Time from request being received until response was sent
+            sentBytes: Bytes of the response message
+        """
+
+        shard, lock = self.shard()
+        with lock:
+            shard[self.statusIndex.get(status[:3], self.statusIndex['other'])] += 1
+            shard[self.bucketsAt + bisect_left(self.durationBuckets, seconds)] += 1
+            shard[self.durationAt] += int(seconds * 1_000_000_000)
+            shard[self.bytesAt] += sentBytes
+
+    # End of requestRecorder()
+
+
+
+    # Beginning of connectionOpened()
+
+    def connectionOpened(self):
+
+        """
+            Description:
+            Counts an accepted connection
+        """
+
+        shard, lock = self.shard()
+        with lock:
+            shard[self.openedAt] += 1
+
+    # End of connectionOpened()
+
+
+
+    # Beginning of connectionClosed()
+
+    def connectionClosed(self):
+
+        """
+            Description:
+            Counts a closed connection, may be called from another thread than the one the connection was opened in
+        """
+
+        shard, lock = self.shard()
+        with lock:
+            shard[self.closedAt] += 1
+
+    # End of connectionClosed()
+
+
+
+    # Beginning of callback()
+
+    def callback(self, name, metricType, helpText, callback):
+
+        """
+            Description:
+            Adds a metric whose value is read from callback when metrics are scraped
+
+            Arguments:
+            name:       Name of the metric, like "webserver_cache_hits_total"
+            metricType: Prometheus type of the metric, "counter" or "gauge"
+            helpText:   Description of the metric
+            callback:   Function without arguments returning the value
+        """
+
+        self.callbacks.append((name, metricType, helpText, callback))
+
+    # End of callback()
+
+
+
+    # Beginning of totals()
+
+    def totals(self):
+
+        """
+            Description:
+            Adds every shard handed out together
+
+            Returns:
+            totals: List of counters, in the same order as in a shard
+        """
+
+        totals = [0] * self.shardSize
+        shards = min(self.handedOut[0], self.maxShards)
+        counters = self.shards[:shards * self.shardSize].tolist()
+
+        for index in range(len(counters)):
+            totals[index % self.shardSize] += counters[index]
+
+        return totals
+
+    # End of totals()
+
+
+
+    # Beginning of exposition()
+
+    def exposition(self):
+
+        """
+            Description:
+            Writes every metric in Prometheus text format
+
+            Returns:
+            exposition: The metrics in the form of a string
+        """
+
+
+        totals = self.totals()
+        lines = []
+
+        # Requests by status
+        lines += ['# HELP webserver_requests_total Requests answered, by HTTP status code.',
+                  '# TYPE webserver_requests_total counter']
+        lines += [f'webserver_requests_total{{status="{status}"}} {totals[self.statusIndex[status]]}'
+                  for status in self.statuses]
+
+        # Request durations, buckets are cumulative in Prometheus
+        lines += ['# HELP webserver_request_duration_seconds Time from receiving a request until its response is sent.',
+                  '# TYPE webserver_request_duration_seconds histogram']
+        cumulative = 0
+        for index, edge in enumerate(self.durationBuckets + ('+Inf',)):
+            cumulative += totals[self.bucketsAt + index]
+            lines.append(f'webserver_request_duration_seconds_bucket{{le="{edge}"}} {cumulative}')
+        lines += [f'webserver_request_duration_seconds_sum {totals[self.durationAt] / 1_000_000_000}',
+                  f'webserver_request_duration_seconds_count {cumulative}']
+
+        # Bytes and connections
+        lines += ['# HELP webserver_response_bytes_total Bytes of response messages sent.',
+                  '# TYPE webserver_response_bytes_total counter',
+                  f'webserver_response_bytes_total {totals[self.bytesAt]}',
+                  '# HELP webserver_connections_total Connections accepted.',
+                  '# TYPE webserver_connections_total counter',
+                  f'webserver_connections_total {totals[self.openedAt]}',
+                  '# HELP webserver_connections_active Connections open right now.',
+                  '# TYPE webserver_connections_active gauge',
+                  f'webserver_connections_active {totals[self.openedAt] - totals[self.closedAt]}']
+
+        # Metrics read from callbacks
+        for name, metricType, helpText, callback in self.callbacks:
+            lines += [f'# HELP {name} {helpText}', f'# TYPE {name} {metricType}', f'{name} {callback()}']
+
+        return '\n'.join(lines) + '\n'
+
+    # End of exposition()
+
+# End of MetricsRegistry
@@ -0,0 +1,450 @@
+"""
+    Micro-benchmarks of the functions every request and response passes through, without any sockets.
+    Every case calls one function over and over with realistic input: small and large headers, many header fields,
+    and small and large bodies. Time per call is measured with timeit, memory per call with tracemalloc
+
+    Cases:
+    get-data-*:          httpGETData() of webserver.py, a small file served from the file cache and a large file that is opened
+    connection-status-*: httpConnectionStatus() of webserver.py, on requests with a small header, many fields and a large header
+    parse-*:             HttpRequestParser of httpparser.py, parsing the same requests from bytes
+    response-writer-*:   httpResponseWriter() of webserver.py, with a small body, many header fields and a large body
+    get-writer-*:        httpGETWriter() of client.py, with a short and a long path
+
+    Results are compared against baseline numbers committed next to this script. A case that is slower,
+    or allocates more, than the baseline by more than the tolerance is a regression, and the script exits with status 1,
+    so a change that makes a hot path slower is seen before it is committed
+
+    Timings of the same code differ from run to run by tens of percent on a busy machine, more for some cases than others.
+    Every case is therefore timed in several rounds, spread over the run so a slow moment does not hit all of them,
+    and the fastest round counts. For every case the baseline also keeps its noise, how far its median round was above
+    its fastest, and a case is a regression if its fastest round is slower than the median round of the baseline
+    by more than the tolerance. A case that is noisy on the machine so gets a wider band than one that is steady.
+    Timings depend on the machine, so this is not part of the unit tests, test_microbenchmark.py only checks that
+    every case still runs and is in the baseline
+"""
+
+import argparse         # imported so arguments can be parsed
+import tempfile         # imported so files read by the benchmark are kept out of the repository
+import tracemalloc      # imported so memory allocated per call can be measured
+import platform         # imported so baseline tells which Python it was measured with
+import timeit           # imported so calls can be timed without the overhead of a loop written in Python
+import shutil           # imported so files read by the benchmark are removed afterwards
+import json             # imported so baseline can be read and written
+import sys              # imported so a regression gives exit status 1
+import os               # imported so files read by the benchmark can be written
+
+import webserver
+from webserver import httpGETData, httpConnectionStatus, httpResponseWriter
+from docroot import DocumentIndex
+from httpparser import HttpRequestParser
+from client import httpGETWriter
+
+
+# Directory the benchmark is in
+repository = os.path.dirname(os.path.abspath(__file__))
+
+# Baseline numbers the results are compared against by default
+baselinePath = os.path.join(repository, 'microbenchmark-baseline.json')
+
+# Every case, in the order they are measured
+caseNames = ['get-data-small', 'get-data-large',
+             'connection-status-small', 'connection-status-many-fields', 'connection-status-large-header',
+             'parse-small', 'parse-many-fields', 'parse-large-header',
+             'response-writer-small', 'response-writer-many-fields', 'response-writer-large',
+             'get-writer-short', 'get-writer-long']
+
+# Bytes a case may allocate above its tolerance before it is a regression.
+# Small allocations change by a few dozen bytes between runs, since the interpreter reuses freed objects
+allocationSlack = 256
+
+# Request messages the parser and httpConnectionStatus() are measured with
+requestMessages = {
+    # Smallest request a client sends
+    'small': b'GET /index.html HTTP/1.1\r\n'
+             b'Host: 127.0.0.1:6969\r\n'
+             b'\r\n',
+
+    # Request of a browser, with the fields it sends and "Connection" among them
+    'many-fields': b'GET /static/app.js?v=3 HTTP/1.1\r\n'
+                   b'Host: 127.0.0.1:6969\r\n'
+                   b'User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:131.0) Gecko/20100101 Firefox/131.0\r\n'
+                   b'Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n'
+                   b'Accept-Language: nb-NO,nb;q=0.9,no;q=0.8,en-US;q=0.6,en;q=0.4\r\n'
+                   b'Accept-Encoding: gzip, deflate, br, zstd\r\n'
+                   b'Referer: http://127.0.0.1:6969/index.html\r\n'
+                   b'Connection: keep-alive, Upgrade\r\n'
+                   b'Upgrade-Insecure-Requests: 1\r\n'
+                   b'Sec-Fetch-Dest: script\r\n'
+                   b'Sec-Fetch-Mode: no-cors\r\n'
+                   b'Sec-Fetch-Site: same-origin\r\n'
+                   b'If-None-Match: "5f3a-18c2b1e4a10"\r\n'
+                   b'If-Modified-Since: Mon, 14 Oct 2024 09:12:44 GMT\r\n'
+                   b'Cache-Control: max-age=0\r\n'
+                   b'Pragma: no-cache\r\n'
+                   b'DNT: 1\r\n'
+                   b'Priority: u=2\r\n'
+                   + b''.join(b'X-Trace-%d: %032x\r\n' % (number, number * 7919) for number in range(16)) +
+                   b'\r\n',
+
+    # HTTP/1.0 request without "Connection" field, carrying 8 KB of cookies
+    'large-header': b'GET /index.html HTTP/1.0\r\n'
+                    b'Host: 127.0.0.1:6969\r\n'
+                    b'User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:131.0) Gecko/20100101 Firefox/131.0\r\n'
+                    b'Cookie: ' + b'; '.join(b'session%d=%056x' % (number, number * 104729) for number in range(128)) + b'\r\n'
+                    b'\r\n'
+}
+
+# Header fields sent with a file, and with a response that has many fields
+fileFields = {
+    'Content-Type': 'application/octet-stream',
+    'Accept-Ranges': 'bytes',
+    'Last-Modified': 'Mon, 14 Oct 2024 09:12:44 GMT',
+    'ETag': '"100000-18c2b1e4a10"',
+    'Cache-Control': 'no-cache'
+}
+manyFields = dict(fileFields, **{f'X-Trace-{number}': f'{number * 7919:032x}' for number in range(24)})
+
+
+# Beginning of main()
+
+def main():
+
+    """
+        Description:
+        The main method. It retreives arguments using argumentParser() function,
+        measures every chosen case, and compares the results against the baseline or writes them as the new baseline
+    """
+
+
+    # Saves arguments using argumentParser() function
+    arguments = argumentParser()
+
+    # Files read by httpGETData(), written once
+    documentRoot = tempfile.mkdtemp(prefix = 'microbenchmark-')
+    try:
+        cases = caseBuilder(documentRoot)
+
+        results = caseRunner(cases, arguments.cases, arguments.repeat, arguments.samples)
+        for name, result in results.items():
+            # Status message for console
+            print(f'{name:<32} {result["nsPerCall"]:>12.0f} ns/call {result["bytesPerCall"]:>10} B/call '
+                  f'{result["noise"] * 100:>6.1f} % noise')
+
+
+        # Measured numbers become the new baseline
+        if arguments.write_baseline:
+            with open(arguments.baseline, 'w') as baselineFile:
+                json.dump({'python': platform.python_version(), 'platform': platform.platform(), 'results': results},
+                          baselineFile, indent = 2)
+                baselineFile.write('\n')
+
+            # Status message for console
+            print(f'Baseline written to {arguments.baseline}')
+            return
+
+        with open(arguments.baseline) as baselineFile:
+            baseline = json.load(baselineFile)
+
+        # Other programs slow down a few cases of a run now and then, so a case that regressed is measured again,
+        # and the better numbers are kept. A real regression stays one however many times it is measured
+        report, regressions = baselineComparer(baseline, results, arguments.tolerance)
+        for _ in range(arguments.retries):
+            if not regressions:
+                break
+            for name, result in caseRunner(cases, regressions, arguments.repeat, arguments.samples).items():
+                results[name]['nsPerCall'] = min(result['nsPerCall'], results[name]['nsPerCall'])
+                results[name]['bytesPerCall'] = min(result['bytesPerCall'], results[name]['bytesPerCall'])
+
+                # Status message for console
+                print(f'{name:<32} {result["nsPerCall"]:>12.0f} ns/call {result["bytesPerCall"]:>10} B/call, measured again')
+            report, regressions = baselineComparer(baseline, results, arguments.tolerance)
+    finally:
+        shutil.rmtree(documentRoot)
+
+    print(report)
+
+    if regressions:
+        sys.exit(1)
+
+# End of main()
+
+
+
+# Beginning of argumentParser()
+
+def argumentParser():
+
+    """
+        Description:
+        Creates an argument parser and retreives provided arguments from it
+        All arguments have default values, so benchmark can be run without arguments
+
+        Returns:
+        arguments: Parsed arguments, with these attributes
+            cases:          Cases that are measured
+            repeat:         Times every case is timed in a round, the fastest is kept
+            samples:        Rounds every case is timed in, spread over the run, the fastest round counts
+            tolerance:      Share a case may be slower than the median round of the baseline, or allocate more
+                            than the baseline, before it is a regression
+            retries:        Times a case that regressed is measured again before it counts as a regression
+            baseline:       Path of the baseline numbers
+            write_baseline: True to write the results as the new baseline instead of comparing against it
+    """
+
+    # An argument parser with appropriate description
+    parser = argparse.ArgumentParser(description = 'Micro-benchmarks functions of the request and response hot path, '
+                                                   'and compares them against baseline numbers')
+
+    parser.add_argument('-c', '--cases', type = str, nargs = '+', choices = caseNames, default = caseNames,
+                        help = 'Cases: Cases that are measured, all of them by default')
+    parser.add_argument('-r', '--repeat', type = int, default = 3,
+                        help = 'Repeat: Times every case is timed in a round, the fastest is kept. Is 3 by default')
+    parser.add_argument('-s', '--samples', type = int, default = 3,
+                        help = 'Samples: Rounds every case is timed in, the fastest round counts and the spread of them '
+                               'is the noise written to the baseline. Is 3 by default')
+    parser.add_argument('-t', '--tolerance', type = float, default = 0.5,
+                        help = 'Tolerance: Share a case may be slower than the median round of the baseline, '
+                               'or allocate more than the baseline, before it is a regression. Is 0.5 by default')
+    parser.add_argument('-R', '--retries', type = int, default = 2,
+                        help = 'Retries: Times a case that regressed is measured again before it counts as a regression. '
+                               'Is 2 by default')
+    parser.add_argument('-b', '--baseline', type = str, default = baselinePath,
+                        help = 'Baseline: Path of the baseline numbers. Is microbenchmark-baseline.json by default')
+    parser.add_argument('-w', '--write-baseline', action = 'store_true',
+                        help = 'Write baseline: Write the results as the new baseline instead of comparing against it')
+
+    # Parses arguments
+    arguments = parser.parse_args()
+
+    if arguments.repeat < 1 or arguments.samples < 1 or arguments.tolerance < 0 or arguments.retries < 0:
+        parser.error('repeat and samples must be at least 1, tolerance and retries can not be negative')
+
+    return arguments
+
+# End of argumentParser()
+
+
+
+# Beginning of caseBuilder()
+
+def caseBuilder(documentRoot):
+
+    """
+        Description:
+        Writes the files read by httpGETData() and makes a function for every case, which makes one call
+
+        Argument:
+        documentRoot: Directory the files are written to
+
+        Returns:
+        cases: Dictionary, name of case mapped to a function without arguments
+    """
+
+
+    # A small file that is served from the file cache, and a file large enough to be opened instead of read
+    with open(os.path.join(documentRoot, 'small.html'), 'wb') as smallFile:
+        smallFile.write(b'<!DOCTYPE html>\n<html><body>' + b'<p>Lorem ipsum dolor sit amet.</p>\n' * 100 + b'</body></html>\n')
+    with open(os.path.join(documentRoot, 'large.bin'), 'wb') as largeFile:
+        largeFile.write(bytes(range(256)) * (webserver.fileCache.streamThreshold // 256 * 4))
+
+    documentIndex = DocumentIndex(root = documentRoot)
+    smallDocument = documentIndex.lookup('/small.html')
+    largeDocument = documentIndex.lookup('/large.bin')
+
+    # Requests are parsed once here, so httpConnectionStatus() is measured on its own
+    parsed = {}
+    for name, message in requestMessages.items():
+        parser = HttpRequestParser()
+        parser.feed(message)
+        parsed[name] = parser.next()
+
+    # Parser is made fresh for every call, like it is for every connection
+    def parse(message):
+        parser = HttpRequestParser()
+        parser.feed(message)
+        return parser.next()
+
+    smallBody = '<!DOCTYPE html>\n<html><body><h1>404 Not Found</h1></body></html>\n'
+    largeBody = bytes(range(256)) * 4096
+    longPath = '/search/results.html?' + '&'.join(f'filter{number}=value{number}' for number in range(100))
+
+    cases = {
+        # Large file is opened for every call, and closed again like a response does once it is sent
+        'get-data-small':                   lambda: httpGETData(smallDocument),
+        'get-data-large':                   lambda: httpGETData(largeDocument)[0].close(),
+        'connection-status-small':          lambda: httpConnectionStatus(parsed['small']),
+        'connection-status-many-fields':    lambda: httpConnectionStatus(parsed['many-fields']),
+        'connection-status-large-header':   lambda: httpConnectionStatus(parsed['large-header']),
+        'parse-small':                      lambda: parse(requestMessages['small']),
+        'parse-many-fields':                lambda: parse(requestMessages['many-fields']),
+        'parse-large-header':               lambda: parse(requestMessages['large-header']),
+        'response-writer-small':            lambda: httpResponseWriter('404 Not Found', 'keep-alive', smallBody),
+        'response-writer-many-fields':      lambda: httpResponseWriter('200 OK', 'keep-alive', smallBody, manyFields),
+        'response-writer-large':            lambda: httpResponseWriter('200 OK', 'keep-alive', largeBody, fileFields),
+        'get-writer-short':                 lambda: httpGETWriter('127.0.0.1', 6969, '/index.html'),
+        'get-writer-long':                  lambda: httpGETWriter('127.0.0.1', 6969, longPath, 'close')
+    }
+
+    return cases
+
+# End of caseBuilder()
+
+
+
+
+# Beginning of caseRunner()
+
+def caseRunner(cases, names, repeat, samples):
+
+    """
+        Description:
+        Measures cases in several rounds, every round measures every case once,
+        so something slowing the machine down for a while slows down one round of a case, not all of them
+
+        Arguments:
+        cases:   Dictionary from caseBuilder(), name of case mapped to a function
+        names:   Names of the cases that are measured, in order
+        repeat:  Times a case is timed in a round
+        samples: Number of rounds
+
+        Returns:
+        results: Dictionary, name of case mapped to nanoseconds per call of the fastest round, fewest bytes per call,
+                 and noise: how much slower the median round was than the fastest, as a share of the fastest.
+                 The median is used, so one round slowed down by something else does not make the noise large
+    """
+
+
+    measured = {name: [] for name in names}
+    for _ in range(samples):
+        for name in names:
+            measured[name].append(caseMeasurer(cases[name], repeat))
+
+    results = {}
+    for name, rounds in measured.items():
+        times = sorted(nsPerCall for nsPerCall, _ in rounds)
+        results[name] = {'nsPerCall': times[0],
+                         'bytesPerCall': min(bytesPerCall for _, bytesPerCall in rounds),
+                         'noise': round(times[len(times) // 2] / times[0] - 1, 3)}
+
+    return results
+
+# End of caseRunner()
+
+
+
+# Beginning of caseMeasurer()
+
+def caseMeasurer(case, repeat):
+
+    """
+        Description:
+        Measures time and memory of one call of a case.
+        Time is measured over enough calls to take at least 0.2 seconds, repeated, and the fastest repeat is kept,
+        since a slower one was slowed down by something else running. Memory is measured separately,
+        since tracemalloc slows down every allocation
+
+        Arguments:
+        case:   Function without arguments, which makes one call
+        repeat: Times the case is timed
+
+        Returns:
+        nsPerCall:    Nanoseconds one call takes
+        bytesPerCall: Most bytes allocated at once during one call, the median of several calls.
+                      Bytes still held after the call, like a returned response, are included
+    """
+
+
+    # Calls once first, so caches are filled and files read, like they are for a running server
+    case()
+
+    timer = timeit.Timer(case)
+    calls, _ = timer.autorange()
+    nsPerCall = min(timer.repeat(repeat = repeat, number = calls)) / calls * 1e9
+
+    # Peak of traced memory during a call, above what was allocated before it
+    allocated = []
+    tracemalloc.start()
+    try:
+        for _ in range(25):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            case()
+            _, peak = tracemalloc.get_traced_memory()
+            allocated.append(peak - before)
+    finally:
+        tracemalloc.stop()
+
+    bytesPerCall = sorted(allocated)[len(allocated) // 2]
+
+    return round(nsPerCall, 1), bytesPerCall
+
+# End of caseMeasurer()
+
+
+
+# Beginning of baselineComparer()
+
+def baselineComparer(baseline, results, tolerance):
+
+    """
+        Description:
+        Compares time and memory of every case against the baseline.
+        Time is compared against the median round of the baseline, the fastest round made slower by the noise of the case,
+        memory against the baseline. Both may be worse by the tolerance
+
+        Arguments:
+        baseline:  Baseline numbers, read from JSON
+        results:   Numbers of this run, name of case mapped to nanoseconds and bytes per call
+        tolerance: Share a case may be slower, or allocate more, than the baseline before it is a regression
+
+        Returns:
+        report:      The comparison as a table in the form of a string
+        regressions: Names of cases that are regressions
+    """
+
+
+    lines = [f'Compared against baseline measured with Python {baseline.get("python")} on {baseline.get("platform")}, '
+             f'tolerance {tolerance * 100:.0f} % over the median round of the baseline:',
+             f'  {"case":<32} {"ns/call":>28} {"allowed":>9} {"B/call":>24}']
+
+    # Numbers measured with another Python are not comparable, the comparison is still shown
+    if baseline.get('python') != platform.python_version():
+        lines.insert(1, f'  Note: this run uses Python {platform.python_version()}, numbers may differ for that reason alone')
+
+    regressions = []
+    for name, result in results.items():
+        old = baseline['results'].get(name)
+        if old is None:
+            lines.append(f'  {name:<32} not in baseline')
+            continue
+
+        # Baselines written before noise was measured have none, their numbers are compared as they are
+        allowed = (1 + old.get('noise', 0)) * (1 + tolerance) - 1
+        slower = result['nsPerCall'] > old['nsPerCall'] * (1 + allowed)
+        larger = result['bytesPerCall'] > old['bytesPerCall'] * (1 + tolerance) + allocationSlack
+        if slower or larger:
+            regressions.append(name)
+
+        # Change in percent, positive means more
+        def change(new, old):
+            return f'{(new - old) / old * 100:+.1f} %' if old else 'n/a'
+
+        lines.append(f'  {name:<32} '
+                     f'{old["nsPerCall"]:>9.0f} -> {result["nsPerCall"]:<9.0f}{change(result["nsPerCall"], old["nsPerCall"]):>9} '
+                     f'{f"+{allowed * 100:.0f} %":>9} '
+                     f'{old["bytesPerCall"]:>8} -> {result["bytesPerCall"]:<8}{change(result["bytesPerCall"], old["bytesPerCall"]):>9}'
+                     f'{"  REGRESSION" if slower or larger else ""}')
+
+    if regressions:
+        lines.append(f'{len(regressions)} of {len(results)} cases regressed: {", ".join(regressions)}')
+    else:
+        lines.append(f'No regressions in {len(results)} cases')
+
+    return '\n'.join(lines), regressions
+
+# End of baselineComparer()
+
+
+
+if __name__ == '__main__':  # runs the main method
+    main()
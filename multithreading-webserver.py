@@ -1,11 +1,31 @@
-
 """
     This code was copied from webserver.py
-    The only changes are an import and added lines to serverHandler() function
+    connectionHandler() and the functions writing HTTP messages are imported from webserver.py,
+    so both servers answer requests the same way.
+    Only serverHandler() is changed, and a single threaded selectors mode is added
+    serverHandler() hands connections to a fixed number of worker threads through a bounded queue
+    A pre-fork mode runs serverHandler() in several processes, so all CPU cores can be used
 """
 
 from socket import *    # imported for socket programming
+import socket as socket_module  # imported so availability of socket options can be checked
 import threading        # imported for multithreading
+import queue            # imported so accepted connections can be handed to worker threads
+import selectors        # imported so one thread can wait for many sockets at once (epoll on Linux)
+import argparse         # imported so arguments can be parsed
+import os               # imported so worker processes can be forked and supervised
+import signal           # imported so worker processes can be stopped
+import time             # imported so crashing worker processes are not restarted too fast
+import itertools        # imported so bytes in a row can be taken from the front of the queue of unsent parts
+from collections import deque   # imported so response parts can be queued in the order they are sent
+
+# Functions shared with webserver.py, settings of webserver.py are changed through the module
+import webserver
+from webserver import connectionHandler, httpResponseBuilder, httpResponseWriter, httpResponseLength, httpResponseCloser, \
+                      fileCache, documentIndex, metrics, requestProfiler, accessLog
+from streaming import ResponseStream, FrameProducer
+from admission import AdmissionControl, LingeringCloser
+from httpparser import HttpRequestParser, HttpParseError
 
 
 # Beginning of main()
@@ -14,300 +34,1352 @@ def main():
 
     """
         Description:
-        The main method. It runs serverHandler() function with self defined arguments 
+        The main method. It retreives arguments using argumentParser() function
+        and runs the server handler of the chosen mode
     """
-  
-    # Runs serverHandler with defined port number and IP address
-    serverIP = '127.0.0.1'
-    serverPort = 6969
-    serverHandler(serverIP, serverPort)
+
+    # Saves arguments using argumentParser() function
+    arguments = argumentParser()
+
+    # Byte budget of the file cache, given in megabytes
+    fileCache.maxBytes = arguments.cache_size * 1024 * 1024
+    # "Cache-Control" field sent with files, empty string leaves it out
+    webserver.cacheControl = arguments.cache_control or None
+    # Persistent connections are closed after being idle this long, or after this many requests
+    webserver.keepAliveTimeout = arguments.keep_alive_timeout
+    webserver.keepAliveMaxRequests = arguments.max_requests
+    # Limits on slow and oversized requests, and on clients receiving responses slowly
+    webserver.requestTimeout = arguments.request_timeout
+    webserver.maxHeaderBytes = arguments.max_header_size * 1024
+    webserver.maxHeaderFields = arguments.max_header_fields
+    webserver.maxBodyBytes = arguments.max_body_size * 1024
+    webserver.minSendRate = arguments.min_send_rate
+
+    # Access log and status messages, "-" writes them to stdout. Configured first, so every message is written where and how it was asked for
+    accessLog.configure(level = arguments.log_level, logFormat = arguments.log_format,
+                        path = '' if arguments.log_file == '-' else arguments.log_file, sampleRate = arguments.log_sample,
+                        maxBytes = arguments.log_max_size * 1024 * 1024, backups = arguments.log_backups)
+
+    # Served directory is indexed once here, and rescanned for changes while server runs
+    documentIndex.rescanInterval = arguments.rescan_interval
+    documentIndex.scan()
+    accessLog.info('Indexed %s files in %s', len(documentIndex.documents), documentIndex.root)
+
+    # Limits of admission control, responses to connections turned away are written once they are known
+    admissionControl.maxConnections = arguments.max_connections
+    admissionControl.clientRate = arguments.client_rate
+    admissionControl.clientBurst = arguments.client_burst or max(1, 2 * arguments.client_rate)
+    admissionControl.maxQueueDelay = arguments.max_queue_delay
+    shedResponseWriter()
+
+    # Phase timing and profiling, can also be turned on and off with SIGUSR2 and SIGUSR1 while server runs
+    requestProfiler.timing = arguments.timing
+    requestProfiler.profiling = arguments.profile
+    requestProfiler.slowest = arguments.profile_slowest
+    requestProfiler.directory = arguments.profile_directory
+    requestProfiler.signalInstaller()
+
+    # Runs server handler of chosen mode with defined port number and IP address
+    if arguments.mode == 'selectors':
+        selectorServerHandler(arguments.ip, arguments.port, arguments.backlog)
+    elif arguments.mode == 'prefork':
+        preforkServerHandler(arguments.ip, arguments.port, arguments.backlog, arguments.workers,
+                             arguments.queue_size, arguments.overflow, arguments.processes, arguments.reuseport)
+    else:
+        serverSocket = serverSocketCreator(arguments.ip, arguments.port, arguments.backlog)
+        serverHandler(serverSocket, arguments.workers, arguments.queue_size, arguments.overflow)
 
 # End of main()
 
 
 
-# Beginning of serverHandler()
+# Beginning of argumentParser()
 
-def serverHandler(serverIP, serverPort):
+def argumentParser():
 
     """
         Description:
-        Creates a server socket and binds it to provided IP-address and port 
-        Runs an infinite loop so other clients can connect if a client disconnects
-        
-        Infinite loop can be interrupted by user or raised Exception, 
-        in which case, all sockets will close and function will end
+        Creates an argument parser and retreives provided arguments from it
+        All arguments have default values, so server can be run without arguments
+
+        Returns:
+        arguments: Parsed arguments, with these attributes
+            ip:         IP-address of server
+            port:       port number to be attached to server socket
+            mode:       How connections are handled, either "threads", "selectors" or "prefork"
+            backlog:    How many connections the kernel queues before they are accepted
+            workers:    Number of worker threads handling connections in threads mode
+            queue_size: How many accepted connections may wait for a free worker thread
+            overflow:   What happens when queue is full, either "block" or "503"
+            processes:  Number of worker processes in prefork mode
+            reuseport:  True if every worker process binds its own server socket with SO_REUSEPORT
+            cache_size: Byte budget of the file cache in megabytes
+            cache_control: "Cache-Control" field sent with files, empty string if it is left out
+            keep_alive_timeout: Seconds an idle persistent connection is kept open
+            max_requests:       Requests answered on one connection before it is closed
+            rescan_interval:    Seconds between rescans of the document index
+            max_connections:    Most connections let in and not yet closed, 0 for no limit
+            client_rate:        Connections per second one client IP-address may open, 0 for no limit
+            client_burst:       Connections one client IP-address may open at once, 0 for twice the rate
+            max_queue_delay:    Seconds the oldest queued connection may wait before new ones are turned away, 0 for no limit
+    """
+
+    # An argument parser with appropriate description
+    parser = argparse.ArgumentParser(description = 'Runs a webserver that can handle multiple connections at a time')
+
+    # Argument for IP-address. Type is string. Is not required
+    parser.add_argument('-i', '--ip', type = str, default = '127.0.0.1',
+                        help = 'Server IP-address: IP adress server socket is bound to')
+    # Argument for port. Type is int. Is not required
+    parser.add_argument('-p', '--port', type = int, default = 6969,
+                        help = 'Socket port number: Port number attatched to server socket')
+    # Argument for mode. Either one thread per connection, or one thread waiting for all connections
+    parser.add_argument('-m', '--mode', type = str, choices = ['threads', 'selectors', 'prefork'], default = 'threads',
+                        help = 'Server mode: "threads" hands connections to a pool of worker threads, '
+                               '"selectors" handles all connections in one thread with non-blocking sockets, '
+                               '"prefork" runs threads mode in several worker processes')
+    # Argument for backlog of server socket. Type is int. Is not required
+    parser.add_argument('-b', '--backlog', type = int, default = 128,
+                        help = 'Backlog: Connections queued by the kernel before they are accepted')
+    # Argument for number of worker threads. Type is int. Is not required
+    parser.add_argument('-w', '--workers', type = int, default = 16,
+                        help = 'Worker threads: Number of threads handling connections in threads mode')
+    # Argument for size of accept queue. Type is int. Is not required
+    parser.add_argument('-q', '--queue-size', type = int, default = 64,
+                        help = 'Queue size: Accepted connections waiting for a free worker thread in threads mode')
+    # Argument for overflow policy. Either stop accepting or answer 503 when queue is full
+    parser.add_argument('-o', '--overflow', type = str, choices = ['block', '503'], default = 'block',
+                        help = 'Overflow policy: "block" stops accepting until a worker thread is free, '
+                               '"503" answers new connections with "503 Service Unavailable"')
+    # Argument for number of worker processes. Type is int. Is one per CPU core by default
+    parser.add_argument('-n', '--processes', type = int, default = os.cpu_count() or 1,
+                        help = 'Worker processes: Number of processes in prefork mode, one per CPU core by default')
+    # Argument for SO_REUSEPORT. Is a flag, so it takes no value
+    parser.add_argument('-r', '--reuseport', action = 'store_true',
+                        help = 'Reuse port: Every worker process in prefork mode binds its own server socket '
+                               'with SO_REUSEPORT, so the kernel spreads connections between them')
+    # Argument for size of file cache. Type is int. Is not required
+    parser.add_argument('-c', '--cache-size', type = int, default = 64,
+                        help = 'Cache size: Megabytes of requested files kept in memory, 0 turns cache off')
+    # Argument for Cache-Control field of sent files. Type is string. Is not required
+    parser.add_argument('-C', '--cache-control', type = str, default = webserver.cacheControl,
+                        help = 'Cache control: "Cache-Control" field sent with files, like "max-age=3600", '
+                               'an empty string leaves the field out')
+    # Argument for idle timeout of persistent connections. Type is int. Is not required
+    parser.add_argument('-t', '--keep-alive-timeout', type = int, default = webserver.keepAliveTimeout,
+                        help = 'Keep-alive timeout: Seconds a connection without requests is kept open')
+    # Argument for requests per connection. Type is int. Is not required
+    parser.add_argument('-x', '--max-requests', type = int, default = webserver.keepAliveMaxRequests,
+                        help = 'Max requests: Requests answered on one connection before it is closed')
+    # Arguments for limits on slow and oversized requests. Types are float and int. Are not required
+    parser.add_argument('--request-timeout', type = float, default = webserver.requestTimeout,
+                        help = 'Request timeout: Seconds a request may take to arrive from its first byte, slower ones get 408')
+    parser.add_argument('--max-header-size', type = int, default = webserver.maxHeaderBytes // 1024,
+                        help = 'Max header size: Kilobytes of request line and header fields, larger ones get 431')
+    parser.add_argument('--max-header-fields', type = int, default = webserver.maxHeaderFields,
+                        help = 'Max header fields: Header fields in one request, more get 431')
+    parser.add_argument('--max-body-size', type = int, default = webserver.maxBodyBytes // 1024,
+                        help = 'Max body size: Kilobytes of request body, larger ones get 413')
+    parser.add_argument('--min-send-rate', type = int, default = webserver.minSendRate,
+                        help = 'Min send rate: Bytes per second a client must receive a response at, after the first '
+                               f'{webserver.sendGrace} seconds, slower clients are closed. 0 for no limit')
+    # Argument for rescans of the document index. Type is float. Is not required
+    parser.add_argument('-R', '--rescan-interval', type = float, default = documentIndex.rescanInterval,
+                        help = 'Rescan interval: Seconds between checks of the served directory for added or removed files')
+    # Arguments for admission control. Types are int and float. Are not required
+    parser.add_argument('--max-connections', type = int, default = 0,
+                        help = 'Max connections: Connections let in and not yet closed, also idle keep-alive ones, new ones get 503, 0 for no limit')
+    parser.add_argument('--client-rate', type = float, default = 0,
+                        help = 'Client rate: Connections per second one client IP-address may open, 0 for no limit')
+    parser.add_argument('--client-burst', type = float, default = 0,
+                        help = 'Client burst: Connections one client IP-address may open at once, twice the rate by default')
+    parser.add_argument('--max-queue-delay', type = float, default = 0,
+                        help = 'Max queue delay: Seconds the oldest connection waiting for a worker thread may have waited '
+                               'before new ones get 503, 0 for no limit')
+    # Argument for phase timing. Is a flag. Is not required
+    parser.add_argument('-T', '--timing', action = 'store_true',
+                        help = 'Timing: Time every request in phases, send them in a "Server-Timing" field and log totals, '
+                               'SIGUSR2 turns it on or off while server runs')
+    # Argument for profiling. Is a flag. Is not required
+    parser.add_argument('-P', '--profile', action = 'store_true',
+                        help = 'Profile: Profile every request with cProfile and keep profiles of the slowest ones, '
+                               'SIGUSR1 turns it on or off while server runs')
+    # Argument for number of kept profiles. Type is int. Is not required
+    parser.add_argument('--profile-slowest', type = int, default = requestProfiler.slowest,
+                        help = 'Profiles kept: Number of slowest requests whose profiles are kept')
+    # Argument for directory of profiles. Type is string. Is not required
+    parser.add_argument('--profile-directory', type = str, default = requestProfiler.directory,
+                        help = 'Profile directory: Directory profiles are written to')
+    # Argument for log level. Type is string. Is not required
+    parser.add_argument('-L', '--log-level', type = str, choices = ['debug', 'info', 'warning', 'error'], default = 'info',
+                        help = 'Log level: Lowest level of status messages written, "debug" also writes every connection')
+    # Argument for format of access log. Type is string. Is not required
+    parser.add_argument('--log-format', type = str, choices = ['combined', 'json'], default = 'combined',
+                        help = 'Log format: "combined" writes Combined Log Format, "json" writes one JSON object per line')
+    # Argument for log file. Type is string. Is not required
+    parser.add_argument('--log-file', type = str, default = '-',
+                        help = 'Log file: File the log is written to, "-" writes it to stdout')
+    # Argument for sampling of access log. Type is float. Is not required
+    parser.add_argument('--log-sample', type = float, default = 1.0,
+                        help = 'Log sample: Share of requests written to the access log, between 0 and 1. '
+                               'Responses with status 500 or more are always written')
+    # Argument for size of log file. Type is int. Is not required
+    parser.add_argument('--log-max-size', type = int, default = 10,
+                        help = 'Log max size: Megabytes a log file grows to before it is rotated, 0 never rotates it')
+    # Argument for rotated log files. Type is int. Is not required
+    parser.add_argument('--log-backups', type = int, default = 5,
+                        help = 'Log backups: Number of rotated log files kept')
+
+    # Parses arguments
+    arguments = parser.parse_args()
+
+    # Worker threads and queue size must be positive, otherwise no connection would ever be handled
+    if arguments.workers < 1 or arguments.queue_size < 1 or arguments.processes < 1:
+        parser.error('number of worker threads, worker processes and queue size must be at least 1')
+
+    # Connections must be kept open for some time and at least one request
+    if arguments.keep_alive_timeout < 1 or arguments.max_requests < 1:
+        parser.error('keep-alive timeout and max requests must be at least 1')
+    if arguments.request_timeout <= 0 or min(arguments.max_header_size, arguments.max_header_fields, arguments.max_body_size) < 1:
+        parser.error('request timeout must be more than 0, max header size, header fields and body size at least 1')
+    if arguments.min_send_rate < 0:
+        parser.error('min send rate can not be negative')
+    if arguments.rescan_interval <= 0:
+        parser.error('rescan interval must be more than 0')
+    if min(arguments.max_connections, arguments.client_rate, arguments.client_burst, arguments.max_queue_delay) < 0:
+        parser.error('limits of admission control can not be negative')
+    if 0 < arguments.client_burst < 1:
+        parser.error('client burst must be at least 1')
+    if arguments.profile_slowest < 1:
+        parser.error('number of kept profiles must be at least 1')
+    # Profiles in the served directory could be downloaded by anyone, they hold source paths and request targets
+    profileDirectory = os.path.realpath(arguments.profile_directory)
+    if profileDirectory == documentIndex.root or profileDirectory.startswith(documentIndex.root + os.sep):
+        parser.error('profile directory must be outside the served directory, profiles in it would be served')
+    if not 0 <= arguments.log_sample <= 1 or arguments.log_max_size < 0 or arguments.log_backups < 0:
+        parser.error('log sample must be between 0 and 1, log max size and log backups can not be negative')
+
+    # Worker processes are forked, which is not possible on every system
+    if arguments.mode == 'prefork' and not hasattr(os, 'fork'):
+        parser.error('prefork mode needs os.fork(), which is not available on this system')
+    if arguments.reuseport and not hasattr(socket_module, 'SO_REUSEPORT'):
+        parser.error('SO_REUSEPORT is not available on this system')
+
+    return arguments
+
+# End of argumentParser()
+
+
+
+# Beginning of serverSocketCreator()
+
+def serverSocketCreator(serverIP, serverPort, backlog, reusePort = False):
+
+    """
+        Description:
+        Creates a server socket, binds it to provided IP-address and port and starts listening
+        Address can be bound again right after server closes, even if old connections are in TIME_WAIT
 
         Arguments:
         serverIP:   IP-address of server
         serverPort: port number to be attached to server socket
+        backlog:    How many connections the kernel queues before they are accepted
+        reusePort:  If True, several sockets may bind the same port with SO_REUSEPORT
+                    and the kernel spreads new connections between them
+
+        Returns:
+        serverSocket: A listening TCP socket with IPv4 as underlying network
     """
 
 
     # Creates a TCP socket with IPv4 as underlying network
     serverSocket = socket(AF_INET, SOCK_STREAM)
+    serverSocket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+
+    # Lets every worker process bind its own socket to the same port
+    if reusePort:
+        serverSocket.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
 
     # Binds serverSocket to given port number and IP address
     serverSocket.bind((serverIP, serverPort))
 
-    # ServerSocket can handle five connections at a time
-    serverSocket.listen(1)
-    # Status message for console 
-    print(f'Server is ready to receive on port {serverPort}...')
+    # Kernel queues up to backlog connections before they are accepted
+    serverSocket.listen(backlog)
+
+    return serverSocket
+
+# End of serverSocketCreator()
+
+
+
+# Beginning of serverHandler()
+
+def serverHandler(serverSocket, workers, queueSize, overflow):
+
+    """
+        Description:
+        Accepts clients on a listening server socket
+        Starts a fixed number of worker threads that handle connections from a bounded queue
+        Runs an infinite loop so other clients can connect if a client disconnects
+
+        Memory and number of threads stay the same no matter how many clients connect.
+        Before a connection is queued, admissionControl may turn it away with "503 Service Unavailable",
+        if its client opens connections too fast, too many connections are open,
+        or the oldest connection in the queue has waited too long
+        When queue is full, overflow policy decides what happens:
+        "block" stops accepting until a worker is free, so new clients wait in the kernel backlog
+        "503" answers new clients right away with "503 Service Unavailable" and closes the connection
+
+        Infinite loop can be interrupted by user or raised Exception,
+        in which case, all sockets will close and function will end
+
+        Arguments:
+        serverSocket: A listening TCP socket, created by serverSocketCreator()
+        workers:      Number of worker threads handling connections
+        queueSize:    How many accepted connections may wait for a free worker thread
+        overflow:     What happens when queue is full, either "block" or "503"
+    """
+
+
+    # Port number of server socket, used in status messages
+    serverPort = serverSocket.getsockname()[1]
+
+    # Accepted connections wait here for a free worker thread
+    connectionQueue = queue.Queue(maxsize = queueSize)
+
+    # Starts worker threads, they are daemons so they do not keep server alive when it closes
+    for _ in range(workers):
+        thread = threading.Thread(target = workerHandler, args = (connectionQueue,), daemon = True)
+        thread.start()
+
+    # Connections waiting for a worker thread are shown in the metrics
+    metrics.callback('webserver_accept_queue_depth', 'gauge', 'Accepted connections waiting for a free worker thread.',
+                     connectionQueue.qsize)
+    admissionMetricsAdder()
+
+    # Status message for log
+    accessLog.info('Server is ready to receive on port %s with %s worker threads...', serverPort, workers)
 
 
     # Will attempt to establish connection with client
     try:
 
         # Infinite loop so other clients can connect if client disconnects
-        while True:    
+        while True:
             # Accepts connection from a client by creating a socket for this connection
             # Also saves client IP and port number
             connectionSocket, clientAddress = serverSocket.accept()
-            # Status message for console
-            print(f'Connection established with {clientAddress[0]} on client port {clientAddress[1]}')
+            metrics.connectionOpened()
+            # Status message for log
+            accessLog.debug('Connection established with %s on client port %s', clientAddress[0], clientAddress[1])
+
+
+            # Overloaded server turns connection away before it is queued, which costs one send
+            reason = admissionControl.admit(clientAddress[0], queueDelayFinder(connectionQueue))
+            if reason is not None:
+                shedHandler(connectionSocket, clientAddress, reason)
+                continue
 
+            # Waits for room in the queue, kernel keeps new clients in backlog meanwhile
+            # Time connection was queued is kept with it, so the wait of the oldest one can be found
+            if overflow == 'block':
+                connectionQueue.put((connectionSocket, clientAddress, time.monotonic()))
 
-            # A thread that will run connectionHandler() with connectionSocket as argument
-            thread = threading.Thread(target = connectionHandler, args = (connectionSocket,))
-            thread.start() 
+            # Hands connection to a worker thread if there is room, otherwise client is told to come back later
+            else:
+                try:
+                    connectionQueue.put_nowait((connectionSocket, clientAddress, time.monotonic()))
+                except queue.Full:
+                    admissionControl.release()
+                    shedHandler(connectionSocket, clientAddress, 'queue full')
 
 
     # In case of user interrupting server, infinite loop is exited
     except KeyboardInterrupt:
-        # Status message for console
-        print('Received order to close server')
+        # Status message for log
+        accessLog.info('Received order to close server')
 
 
     # In case of Exception being raised, infinite loop is exited
     except Exception:
-        # Status message for console
-        print('Internal error, closing server')
+        # Status message for log
+        accessLog.error('Internal error, closing server')
 
 
     # Always executed after infinite loop is exited
     finally:
-        # Status message for console 
-        print(f'Closing server socket on port {serverPort}...')
-        # Closes connectionSocket and serverSocket
-        connectionSocket.close()
+        # Status message for log, queued records are written before server exits
+        accessLog.info('Closing server socket on port %s...', serverPort)
+        accessLog.info('File cache: %s', fileCache.stats())
+        accessLog.info('Document index: %s', documentIndex.stats())
+        accessLog.info('Admission control: %s', admissionControl.stats())
+        accessLog.close()
+        # Closes serverSocket, connection sockets are closed by the worker threads
         serverSocket.close()
 
 # End of serverHandler()
 
 
 
-# Beginning of connectionHandler()
+# Beginning of workerHandler()
 
-def connectionHandler(connectionSocket):
+def workerHandler(connectionQueue):
 
     """
         Description:
-        function that handles connections. 
-        Runs an infinite while loop that receives HTTP requests from- and sends HTTP response messages to client
-        If client disconnects, infinite loop is broken
-        
-        In case of error, an appropriate HTTP response message sent to client
-        All errors except for FileNotFoundError will raise Exception for serverHandler() to catch
-
-        If index.html is requested, said file is sent in an HTTP response message with "200 OK" as status
-        If unknown file is requested, an HTTP response message with "404 Not Found" as status is sent
-        If an exception occurs, an HTTP response message with "500 Internal Server Error" as status is sent
+        Runs in a worker thread. Takes accepted connections from queue one at a time
+        and runs connectionHandler() with them until server closes
+
+        connectionHandler() raises Exception after answering with "500 Internal Server Error",
+        it is caught here so the worker thread keeps handling new connections
 
         Argument:
+        connectionQueue: Queue of accepted connection sockets, client addresses and the times they were queued
+    """
+
+
+    while True:     # Infinite loop so worker thread handles new connections after a client disconnects
+
+        # Waits for an accepted connection
+        connectionSocket, clientAddress, _ = connectionQueue.get()
+
+        # Handles connection until client disconnects
+        try:
+            connectionHandler(connectionSocket, clientAddress)
+        except Exception:
+            # Status message for log
+            accessLog.debug('Connection closed after internal error, worker thread is ready for new connections')
+        finally:
+            metrics.connectionClosed()
+            admissionControl.release()
+
+# End of workerHandler()
+
+
+
+# Beginning of queueDelayFinder()
+
+def queueDelayFinder(connectionQueue):
+
+    """
+        Description:
+        Finds how long the oldest connection in the queue has waited for a worker thread
+        Read without the lock of the queue, a worker thread taking the connection meanwhile only makes it 0
+
+        Argument:
+        connectionQueue: Queue of accepted connection sockets, client addresses and the times they were queued
+
+        Returns:
+        queueDelay: Seconds the oldest waiting connection has waited, 0 if queue is empty
+    """
+
+    try:
+        return time.monotonic() - connectionQueue.queue[0][2]
+    except IndexError:
+        return 0
+
+# End of queueDelayFinder()
+
+
+
+# Beginning of admissionMetricsAdder()
+
+def admissionMetricsAdder():
+
+    """
+        Description:
+        Shows connections let in and connections turned away by admissionControl in the metrics
+        Called in every worker process in prefork mode, since every worker process has its own admissionControl
+    """
+
+    metrics.callback('webserver_connections_admitted', 'gauge', 'Connections let in by admission control and not yet closed.',
+                     lambda: admissionControl.connections)
+    for reason in admissionControl.shed:
+        metrics.callback(f'webserver_shed_{reason.replace(" ", "_")}_total', 'counter',
+                         f'Connections turned away because of {reason}.', lambda reason = reason: admissionControl.shed[reason])
+
+# End of admissionMetricsAdder()
+
+
+
+# Beginning of shedHandler()
+
+# Decides which new connections are let in while server is overloaded, every check is off until it is given a limit
+admissionControl = AdmissionControl()
+
+# HTTP response messages sent to connections that are turned away, the check that turned them away mapped to the message
+# Written once by shedResponseWriter(), so overloaded server does not spend time writing them again for every client
+shedResponseMessages = {}
+
+# Closes connections turned away without a reset, while the requests they sent are still unread
+lingeringCloser = LingeringCloser()
+
+
+def shedHandler(connectionSocket, clientAddress, reason):
+
+    """
+        Description:
+        Answers a connection with "503 Service Unavailable" as status and closes it, without reading the request
+        Used when admissionControl turns a connection away, or when queue is full. Sending never blocks the accepting thread.
+        Connection is closed by lingeringCloser, which drops the unread request, so the client gets no reset
+
+        Arguments:
         connectionSocket: A TCP socket with IPv4 as underlying network, connected to a client
+        clientAddress:    (IP-address, port) of the client, written in the access log
+        reason:           Why connection is turned away: "client rate", "max connections", "queue delay" or "queue full"
+    """
+
+
+    shedResponseMessage = shedResponseMessages[reason]
+
+    # Sends response without waiting, client that does not receive it right away just misses it
+    try:
+        connectionSocket.setblocking(False)
+        connectionSocket.send(shedResponseMessage)
+    except OSError:
+        pass
+
+    # Status message for log
+    accessLog.debug('Connection from %s turned away (%s), "503 Service Unavailable" sent, closing connection socket...',
+                    clientAddress[0], reason)
+    # Every connection turned away is counted here, also those turned away because the queue is full
+    admissionControl.shed[reason] += 1
+    lingeringCloser.close(connectionSocket)
+    metrics.requestRecorder('503 Service Unavailable', 0, len(shedResponseMessage))
+    accessLog.access(clientAddress, None, '503 Service Unavailable', len(shedResponseMessage), 0)
+    metrics.connectionClosed()
+
+# End of shedHandler()
+
+
+
+# Beginning of shedResponseWriter()
+
+def shedResponseWriter():
+
+    """
+        Description:
+        Writes the response messages of shedHandler() once, after admissionControl has been given its limits
+        Every message has a "Retry-After" field telling the client when it is worth trying again
+    """
+
+    for reason in ('client rate', 'max connections', 'queue delay', 'queue full'):
+        shedResponseMessages[reason] = httpResponseWriter('503 Service Unavailable', 'close', '<h1>Server is busy<h1>',
+                                                          {'Retry-After': str(admissionControl.retryAfter(reason))})
+
+# End of shedResponseWriter()
+
+
+
+# Beginning of preforkServerHandler()
+
+def preforkServerHandler(serverIP, serverPort, backlog, workers, queueSize, overflow, processes, reusePort):
+
     """
-    
+        Description:
+        Runs the server in several worker processes, so it is not limited to one CPU core by the GIL.
+        Every worker process runs serverHandler() with its own pool of worker threads
+
+        Without reusePort, the server socket is created once and shared by all worker processes.
+        With reusePort, every worker process binds its own server socket with SO_REUSEPORT,
+        and the kernel spreads new connections evenly between them
+
+        This process supervises the worker processes and starts a new one if a worker process dies.
+        Infinite loop can be interrupted by user, in which case all worker processes are stopped
+
+        Arguments:
+        serverIP:   IP-address of server
+        serverPort: port number to be attached to server socket
+        backlog:    How many connections the kernel queues before they are accepted
+        workers:    Number of worker threads in each worker process
+        queueSize:  How many accepted connections may wait for a free worker thread in each worker process
+        overflow:   What happens when queue is full, either "block" or "503"
+        processes:  Number of worker processes
+        reusePort:  True if every worker process binds its own server socket with SO_REUSEPORT
+    """
+
+
+    # Shared server socket is created before forking, so every worker process inherits it
+    serverSocket = None if reusePort else serverSocketCreator(serverIP, serverPort, backlog)
+
+    # Worker processes that are running, process id mapped to the time it was started
+    workerProcesses = {}
+
+
+    # Beginning of workerProcessStarter()
+
+    def workerProcessStarter():
+
+        """
+            Description:
+            Forks a new worker process that runs serverHandler() until it is stopped
+            Worker process never returns from this function
+        """
+
+        processID = os.fork()
+
+        # Parent process remembers the worker process and returns
+        if processID != 0:
+            workerProcesses[processID] = time.monotonic()
+            return
+
+        # Worker process, supervisor stops it with SIGTERM, which exits serverHandler() so its log is written first
+        signal.signal(signal.SIGTERM, workerStopper)
+        # Worker process toggles its own timing and profiling, instead of passing signals on like the supervisor
+        requestProfiler.signalInstaller()
+        exitCode = 1
+        try:
+            workerSocket = serverSocket if serverSocket is not None \
+                           else serverSocketCreator(serverIP, serverPort, backlog, reusePort = True)
+            serverHandler(workerSocket, workers, queueSize, overflow)
+            exitCode = 0
+        finally:
+            # Leaves without running the supervisor's cleanup code
+            os._exit(exitCode)
+
+    # End of workerProcessStarter()
+
+
+    # Beginning of workerStopper()
+
+    def workerStopper(signalNumber, frame):
+
+        """
+            Description:
+            Stops a worker process when supervisor sends SIGTERM, by raising SystemExit in its main thread
+
+            Arguments:
+            signalNumber: Signal that arrived
+            frame:        Frame that was running, not used
+        """
+
+        raise SystemExit(0)
+
+    # End of workerStopper()
+
+
+    # Beginning of signalForwarder()
+
+    def signalForwarder(signalNumber, frame):
+
+        """
+            Description:
+            Passes SIGUSR1 and SIGUSR2 on to every worker process, so timing and profiling
+            are turned on and off in the processes that answer requests
+
+            Arguments:
+            signalNumber: Signal that arrived
+            frame:        Frame that was running, not used
+        """
+
+        for processID in workerProcesses:
+            try:
+                os.kill(processID, signalNumber)
+            except ProcessLookupError:
+                pass
+
+    # End of signalForwarder()
+
+
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, signalForwarder)
+        signal.signal(signal.SIGUSR2, signalForwarder)
+
+    # Starts worker processes
+    for _ in range(processes):
+        workerProcessStarter()
+    # Status message for log
+    accessLog.info('Supervising %s worker processes on port %s...', processes, serverPort)
+
+
+    # Will attempt to keep all worker processes running
+    try:
+
+        # Infinite loop, waits for a worker process to die and starts a new one
+        while True:
+            processID, status = os.wait()
+
+            # Process is not a worker process
+            if processID not in workerProcesses:
+                continue
+
+            startTime = workerProcesses.pop(processID)
+            # Status message for log
+            accessLog.warning('Worker process %s died with status %s, starting a new one...', processID, status)
+
+            # Waits a moment if worker process died right after starting, so a broken server does not spin
+            if time.monotonic() - startTime < 1:
+                time.sleep(1)
+            workerProcessStarter()
+
+
+    # In case of user interrupting server, infinite loop is exited
+    except KeyboardInterrupt:
+        # Status message for log
+        accessLog.info('Received order to close server')
+
+
+    # Always executed after infinite loop is exited
+    finally:
+        # Status message for log
+        accessLog.info('Stopping %s worker processes...', len(workerProcesses))
+
+        # Stops every worker process and waits for them to exit
+        for processID in workerProcesses:
+            try:
+                os.kill(processID, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for processID in workerProcesses:
+            try:
+                os.waitpid(processID, 0)
+            except ChildProcessError:
+                pass
+
+        # Closes shared serverSocket
+        if serverSocket is not None:
+            serverSocket.close()
+
+# End of preforkServerHandler()
+
+
+
+# Beginning of selectorServerHandler()
+
+# Most bytes of response messages waiting to be sent on one connection in selectors mode. While this much waits,
+# no more pipelined requests are answered and nothing more is read from the connection,
+# so a client that sends requests without reading the responses can not make the server hold more
+maxUnsentBytes = 256 * 1024
 
-    while True:     # Infinite loop to ensure files can be requested several times
-        
-        # Responds to HTTP GET requests if possible.  
-        # Sends HTTP response with "200 OK" as status and file as data to client
-        try: 
+# Worker threads producing chunks of streamed bodies in selectors mode, so a slow generator never holds up the event loop
+producerThreads = 4
 
-            # Waits for client to send HTTP GET request
-            httpRequestMessage = connectionSocket.recv(1024).decode()
-            
-            # Handles connectionSocket.recv() returning blank
-            if not httpRequestMessage:
 
-                # Status message for console
-                print("Client has closed connection, closing connection socket...")
-                # Closes connection and breaks the infinite loop
-                connectionSocket.close()
+def selectorServerHandler(serverIP, serverPort, backlog):
+
+    """
+        Description:
+        Creates a non-blocking server socket and binds it to provided IP-address and port
+        Runs an infinite event loop in a single thread. The selector tells which sockets are
+        ready to be read from or written to, so no thread is ever blocked by a single client.
+        Number of connections is therefore limited by memory for sockets, not by threads
+        Connections that have been idle for keepAliveTimeout seconds are closed by selectorReaper()
+        Chunks of streamed bodies are produced by producerThreads worker threads, which wake the event loop up when
+        a chunk is ready, since a generator run by the event loop would hold up every other connection while it runs
+
+        Infinite loop can be interrupted by user or raised Exception,
+        in which case, all sockets will close and function will end
+
+        Arguments:
+        serverIP:   IP-address of server
+        serverPort: port number to be attached to server socket
+        backlog:    How many connections the kernel queues before they are accepted
+    """
+
+
+    # Creates a listening server socket that never blocks the event loop
+    serverSocket = serverSocketCreator(serverIP, serverPort, backlog)
+    serverSocket.setblocking(False)
+
+    # Selector picks the best mechanism on the system (epoll on Linux)
+    # serverSocket has no data attached, which is how it is told apart from connection sockets
+    selector = selectors.DefaultSelector()
+    selector.register(serverSocket, selectors.EVENT_READ, data = None)
+    # Socket of the frame producer is readable when chunks of streamed bodies are ready, the producer is its data
+    frameProducer = FrameProducer(producerThreads)
+    selector.register(frameProducer.wakeupSocket, selectors.EVENT_READ, data = frameProducer)
+    admissionMetricsAdder()
+    # Status message for log
+    accessLog.info('Server is ready to receive on port %s...', serverPort)
+
+
+    # Will attempt to handle events from all sockets
+    try:
+
+        # Time idle connections were last looked for
+        lastReaped = time.monotonic()
+
+        # Infinite event loop, waits until at least one socket is ready, or until idle connections should be looked for
+        while True:
+            for key, events in selector.select(timeout = 1):
+
+                # serverSocket is ready, a client is waiting to be accepted
+                if key.data is None:
+                    selectorAcceptHandler(selector, serverSocket)
+
+                # Chunks of streamed bodies have been produced, they are sent on to their connections
+                elif key.data is frameProducer:
+                    for (connectionSocket, state), frame, error in frameProducer.produced():
+                        selectorFrameHandler(selector, connectionSocket, state, frame, error, frameProducer)
+
+                # A connection socket is ready to be read from and/or written to
+                else:
+                    selectorConnectionHandler(selector, key.fileobj, key.data, events, frameProducer)
+
+            # Idle connections are closed about once a second, not after every event
+            now = time.monotonic()
+            if now - lastReaped >= 1:
+                selectorReaper(selector, now)
+                lastReaped = now
+
+
+    # In case of user interrupting server, infinite loop is exited
+    except KeyboardInterrupt:
+        # Status message for log
+        accessLog.info('Received order to close server')
+
+
+    # In case of Exception being raised, infinite loop is exited
+    except Exception as error:
+        # Status message for log
+        accessLog.error('Internal error: %s, closing server', error)
+
+
+    # Always executed after infinite loop is exited
+    finally:
+        # Status message for log, queued records are written before server exits
+        accessLog.info('Closing server socket on port %s...', serverPort)
+        accessLog.info('File cache: %s', fileCache.stats())
+        accessLog.info('Document index: %s', documentIndex.stats())
+        accessLog.info('Admission control: %s', admissionControl.stats())
+        accessLog.close()
+        # Closes every registered socket, including serverSocket, and stops the frame producer
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+        frameProducer.close()
+
+# End of selectorServerHandler()
+
+
+
+# Beginning of selectorAcceptHandler()
+
+def selectorAcceptHandler(selector, serverSocket):
+
+    """
+        Description:
+        Accepts a waiting client and registers its connection socket with the selector
+        Each connection socket gets its own state with a parser for received data and a queue of unsent data
+
+        Arguments:
+        selector:     Selector the connection socket is registered with
+        serverSocket: Non-blocking server socket with a client waiting to be accepted
+    """
+
+
+    # Accepts connection from a client by creating a socket for this connection
+    # Another event may have accepted the client already, in which case there is nothing to do
+    try:
+        connectionSocket, clientAddress = serverSocket.accept()
+    except BlockingIOError:
+        return
+
+    # Status message for log
+    accessLog.debug('Connection established with %s on client port %s', clientAddress[0], clientAddress[1])
+
+    # Connection socket must never block the event loop
+    connectionSocket.setblocking(False)
+    metrics.connectionOpened()
+
+    # Overloaded server turns connection away before it is registered, nothing waits in a queue in this mode
+    reason = admissionControl.admit(clientAddress[0])
+    if reason is not None:
+        shedHandler(connectionSocket, clientAddress, reason)
+        return
+
+    # State of the connection
+    state = {
+        'parser': HttpRequestParser(webserver.maxHeaderBytes, webserver.maxHeaderFields, webserver.maxBodyBytes),
+        'unsent': deque(),          # Parts of response messages not yet sent, in order
+        'close': False,             # Connection is closed when all unsent parts are sent
+        'requests': 0,              # Requests answered on this connection so far
+        'active': time.monotonic(), # Time client last sent or received anything
+        'received': time.perf_counter_ns(), # Time first bytes of the next request arrived, for phase timing
+        'deadline': time.monotonic() + webserver.requestTimeout,   # Time next request must have arrived completely by
+        'address': clientAddress,   # Client IP and port number, written in the access log
+        'events': selectors.EVENT_READ,     # Events connection socket is registered for, 0 while it is not registered
+        'producing': False,         # Next chunk of the streamed body in front of unsent is being produced
+        'closed': False             # Connection has been closed, while a chunk was being produced
+    }
+
+    # Waits for connection socket to have data ready to be read
+    selector.register(connectionSocket, selectors.EVENT_READ, data = state)
+
+# End of selectorAcceptHandler()
+
+
+
+# Beginning of selectorConnectionHandler()
+
+def selectorConnectionHandler(selector, connectionSocket, state, events, frameProducer):
+
+    """
+        Description:
+        Handles a ready connection socket.
+        Received bytes are fed to the connection's parser until a full HTTP request message has arrived,
+        response messages are written with the same functions as the threaded server uses.
+        Response messages are sent as far as the socket allows, the rest is sent when socket is writable again
+        Large files are sent with sendfile, a piece at a time, so they are never read into memory.
+        Chunks of streamed bodies are produced by frameProducer, the connection goes on when a chunk is ready
+
+        Pipelined requests are answered while less than maxUnsentBytes wait to be sent. Above that, the connection
+        is not read from until the client has received enough, so a client that never reads can not make it grow
+
+        If client disconnects, connection socket is unregistered and closed
+        If an exception occurs, an HTTP response message with "500 Internal Server Error" as status is sent
+        and the connection is closed. Other connections are not affected
+
+        Arguments:
+        selector:         Selector the connection socket is registered with
+        connectionSocket: The ready connection socket
+        state:            State of the connection
+        events:           Events the connection socket is ready for, 0 when a chunk of a streamed body is ready instead
+        frameProducer:    FrameProducer making chunks of streamed bodies
+    """
+
+
+    # Connection socket has received data
+    if events & selectors.EVENT_READ and not state['close']:
+
+        # Reads as much as is available without blocking
+        try:
+            received = connectionSocket.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            received = None
+        except OSError:
+            received = b''
+
+        # Handles connectionSocket.recv() returning blank
+        if received == b'':
+            # Status message for log
+            accessLog.debug('Client has closed connection, closing connection socket...')
+            selectorCloseConnection(selector, connectionSocket, state)
+            return
+
+        if received:
+            if not state['parser'].pending():
+                state['received'] = time.perf_counter_ns()
+                state['deadline'] = time.monotonic() + webserver.requestTimeout
+            state['parser'].feed(received)
+            # While a response is being sent, only bytes the client receives count as activity
+            if not state['unsent']:
+                state['active'] = time.monotonic()
+
+
+    # Answers requests and sends the responses, until the socket is full or no complete request is left
+    # Requests held back while too much waited to be sent are answered once it has been sent
+    while True:
+        heldBack = selectorRequestHandler(state)
+
+        # Sends as much of the unsent parts as the socket accepts without blocking
+        # Client receiving data counts as activity, so a large file being sent is not mistaken for an idle connection.
+        # Only bytes actually sent count, a client that stops receiving is reaped even if it sends a byte now and then
+        try:
+            if selectorSender(connectionSocket, state['unsent']):
+                state['active'] = time.monotonic()
+        except OSError:
+            # Client is gone, nothing more can be sent
+            selectorCloseConnection(selector, connectionSocket, state)
+            return
+
+        if not heldBack or state['unsent']:
+            break
+
+
+    # Everything sent and client asked to close, connection is closed
+    if not state['unsent'] and state['close']:
+        # Status message for log
+        accessLog.debug('Response sent, closing connection socket...')
+        selectorCloseConnection(selector, connectionSocket, state)
+        return
+
+    # Streamed body is next, its next chunk is produced by a worker thread, the socket is not written to meanwhile
+    if state['unsent'] and isinstance(state['unsent'][0], ResponseStream) and not state['producing']:
+        state['producing'] = True
+        frameProducer.produce(state['unsent'][0], (connectionSocket, state))
+
+    # Connection socket is watched for being writable while bytes wait to be sent and no chunk is being produced.
+    # It is watched for being readable while it may be read from, not once it is to be closed or too much waits to be sent,
+    # since select() would otherwise return for it over and over while client sends anything
+    events = 0
+    if not state['close'] and selectorUnsentBytes(state['unsent']) < maxUnsentBytes:
+        events |= selectors.EVENT_READ
+    if state['unsent'] and not state['producing']:
+        events |= selectors.EVENT_WRITE
+    selectorWatcher(selector, connectionSocket, state, events)
+
+# End of selectorConnectionHandler()
+
+
+
+# Beginning of selectorRequestHandler()
+
+def selectorRequestHandler(state):
+
+    """
+        Description:
+        Answers every complete request message in the parser of a connection, in order, and queues the responses.
+        Stops early while maxUnsentBytes or more wait to be sent, the rest is answered when they have been sent
+
+        Argument:
+        state: State of the connection
+
+        Returns:
+        heldBack: True if answering stopped because too much waits to be sent, a complete request may be left
+    """
+
+
+    # Every complete request message is answered in order
+    while not state['close']:
+
+        # Client is not answered faster than it receives
+        if selectorUnsentBytes(state['unsent']) >= maxUnsentBytes:
+            return True
+
+        # Request is timed from when it has been received until its response is queued
+        requestStart = time.perf_counter()
+        parseStart = time.perf_counter_ns()
+        httpRequestMessage = trace = None
+
+        # Writes HTTP response message, status is 200 OK or 404 Not Found
+        try:
+
+            # Next request message that has been received completely
+            httpRequestMessage = state['parser'].next()
+            if httpRequestMessage is None:
                 break
-            
-            # Status message for console
-            print("Message received")
-            
-            # Attempts to retreive data from requested file, 
-            # and then write HTTP response message with status of 200 OK
-            data = httpGETData(httpRequestMessage)                              # Data from requested file
-            connection = httpConnectionStatus(httpRequestMessage)               # Connection status from HTTP request message
-            status = "200 OK"                                                   # HTTP status
-            httpResponseMessage = httpResponseWriter(status, connection, data)  # HTTP response message
-
-
-            # Sends HTTP response to client
-            connectionSocket.send(httpResponseMessage.encode())
-            # Status message for console
-            print('Requested file sent')
-
-
-        # Handles exception if other file than index.html is being requested
-        # Sends HTTP response with "404 Not Found" as status to client
-        except FileNotFoundError:
-
-            # writes HTTP response message with "404 Not Found" as status
-            status = '404 Not Found'                                            # HTTP status
-            connection = httpConnectionStatus(httpRequestMessage)               # Connection status from HTTP request message
-            data = '<h1>File not found<h1>'                                     # Very simple HTML data
-            httpResponseMessage = httpResponseWriter(status, connection, data)  # HTTP response message
-            
-
-            # Sends HTTP response to client
-            connectionSocket.send(httpResponseMessage.encode())
-            # Status message for console
-            print('Requested file not found, appropriate response message sent')
-
-        
+
+            # Next request may already have been received along with this one, its time starts now
+            state['deadline'] = time.monotonic() + webserver.requestTimeout
+
+            # Phases of the request are timed if phase timing or profiling is on, None otherwise
+            trace = requestProfiler.start(state['received'], parseStart)
+            status, connection, httpResponseParts = httpResponseBuilder(httpRequestMessage, state['requests'], trace)
+            state['requests'] += 1
+
+            # Connection is closed after response is sent if client asked for it, or it has served enough requests
+            if connection == 'close':
+                state['close'] = True
+
+        # Handles malformed request message
+        # Writes HTTP response with status from the parser, like "400 Bad Request", and closes connection after sending it
+        except HttpParseError as error:
+            status = error.status
+            httpResponseParts = [httpResponseWriter(error.status, 'close', f'<h1>{error.status}<h1>')]
+            state['close'] = True
+            # Error message for log
+            accessLog.warning('Malformed request message from %s: %s', state['address'][0], error)
+
         # Handles any other exception
-        # Sends HTTP response with "500 Internal Server" as status to client and raises Exception
+        # Writes HTTP response with "500 Internal Server Error" as status and closes connection after sending it
         except Exception as error:
-
-            # writes HTTP response message with "500 Internal Server Error" as status
             status = '500 Internal Server Error'                                # HTTP status
-            connection = 'close'                                                # Close the connection
-            data = '<h1>Oh no<h1>'                                              # very simple HTML data 
-            httpResponseMessage = httpResponseWriter(status, connection, data)  # HTTP response message
-            
+            httpResponseParts = [httpResponseWriter(status, 'close', '<h1>Oh no<h1>')]
+            state['close'] = True
+            # Error message for log
+            accessLog.error('An error has occured: %s', error)
+
+        # Response is counted and logged when it is queued, it is sent when the socket is writable
+        # Streamed bodies are produced while they are sent, so only their header is counted
+        requestDuration = time.perf_counter() - requestStart
+        sentBytes = httpResponseLength(httpResponseParts)
+        metrics.requestRecorder(status, requestDuration, sentBytes)
+        accessLog.access(state['address'], httpRequestMessage, status, sentBytes, requestDuration)
+
+        # Send phase only covers queueing the response, it is sent when the socket is writable
+        if trace is not None:
+            requestProfiler.finish(trace, status, httpRequestMessage.target)
+        # Next request may already have been received along with this one
+        state['received'] = time.perf_counter_ns()
 
-            # Sends HTTP response to client
-            connectionSocket.send(httpResponseMessage.encode())
+        # Response message is queued behind earlier unsent response messages
+        # Bytes are queued as memoryviews, so sending a part of them does not copy the rest
+        for part in httpResponseParts:
+            state['unsent'].append(part if isinstance(part, (tuple, ResponseStream)) else memoryview(part))
 
-            # Error and status message for console
-            print(f'An error has occured: {error}\n' \
-                  'appropriate response message sent, closing connection socket...')          
-            # Closes connection and raises Exception
-            connectionSocket.close()
-            raise Exception()
+    return False
 
-# End of connectionHandler()
+# End of selectorRequestHandler()
 
 
 
-# Beginning of httpGETData()
+# Beginning of selectorFrameHandler()
 
-def httpGETData(httpRequestMessage):
+def selectorFrameHandler(selector, connectionSocket, state, frame, error, frameProducer):
 
     """
         Description:
-        Retrieves data from file requested by HTTP GET request message.
-        File must exist for function to work
+        Puts a chunk produced by frameProducer in front of its streamed body, and goes on sending the connection's response.
+        Body that has ended is closed and removed. Connection is closed if producing the chunk raised an exception,
+        since the response can not be finished. Stream of a connection closed meanwhile is closed now that it is not running
+
+        Arguments:
+        selector:         Selector the connection socket is registered with
+        connectionSocket: Connection socket the streamed body is sent through
+        state:            State of the connection, its first unsent part is the streamed body
+        frame:            Chunk framed for sending, None if body has ended
+        error:            Exception producing the chunk raised, None if it raised none
+        frameProducer:    FrameProducer making chunks of streamed bodies
+    """
+
+
+    state['producing'] = False
+    stream = state['unsent'][0]
+
+    if state['closed']:
+        stream.close()
+        return
+
+    if error is not None:
+        # Error message for log
+        accessLog.error('Streamed body raised an error: %s, closing connection socket...', error)
+        selectorCloseConnection(selector, connectionSocket, state)
+        return
+
+    # Body has ended, or its chunk is sent before it
+    if frame is None:
+        stream.close()
+        state['unsent'].popleft()
+    else:
+        state['unsent'].appendleft(memoryview(frame))
+
+    # Time spent producing the chunk is server's, client has not been idle meanwhile
+    state['active'] = time.monotonic()
+    selectorConnectionHandler(selector, connectionSocket, state, 0, frameProducer)
+
+# End of selectorFrameHandler()
+
+
+
+# Beginning of selectorUnsentBytes()
+
+def selectorUnsentBytes(unsent):
+
+    """
+        Description:
+        Counts bytes of the response parts waiting to be sent on a connection.
+        Streamed body counts as nothing, only one chunk of it is held at a time
 
         Argument:
-        httpRequestMessage: An HTTP GET request message asking for specific file
+        unsent: Queue of unsent parts, memoryviews, tuples (file, offset, count) or ResponseStreams
 
         Returns:
-        data: Data from requested file in the form of a string    
+        unsentBytes: Bytes waiting to be sent
     """
 
+    return sum(part.nbytes if isinstance(part, memoryview) else part[2] if isinstance(part, tuple) else 0
+               for part in unsent)
+
+# End of selectorUnsentBytes()
+
+
+
+# Beginning of selectorWatcher()
+
+def selectorWatcher(selector, connectionSocket, state, events):
+
+    """
+        Description:
+        Registers a connection socket for the events it should be watched for, only when they have changed.
+        Socket is unregistered while it should not be watched at all, like while a chunk is produced for a connection
+        that is to be closed. A request that started arriving gets its time again when socket is read from again,
+        since the rest of it may have been waiting unread
 
-    # received HTTP GET request should be formatted like this: "GET /file ..."
-    # Word on index 1 of request String should therefore be the requested file
-    requestedFilename = httpRequestMessage.split()[1]
+        Arguments:
+        selector:         Selector the connection socket is registered with
+        connectionSocket: Connection socket
+        state:            State of the connection, its "events" are the events it is registered for
+        events:           Events the socket should be watched for, 0 for none
+    """
 
-    # if-statement that retreives data from requested file
-    if requestedFilename == '/':    # "/" is a request for index.html
 
-        # opens index.html and reads its contents to variable, data
-        with open('index.html') as requestedFile:
-            data = requestedFile.read()
+    registered = state['events']
+    if events == registered:
+        return
 
-    else:   # handles requests for explicit file
+    if events & selectors.EVENT_READ and not registered & selectors.EVENT_READ and state['parser'].pending():
+        state['deadline'] = time.monotonic() + webserver.requestTimeout
 
-        # requestedFilename should start with "/", 
-        # therefore characters from index 1 and onwards should be requested file
-        # Opens file and attempts to read its contents to variable, data
-        with open(requestedFilename[1:]) as requestedFile:
-            data = requestedFile.read()
+    if not events:
+        selector.unregister(connectionSocket)
+    elif not registered:
+        selector.register(connectionSocket, events, data = state)
+    else:
+        selector.modify(connectionSocket, events, data = state)
 
-    return data
+    state['events'] = events
 
-# End of httpGETData()
+# End of selectorWatcher()
 
 
 
-# Beginning of httpConnectionStatus()
+# Beginning of selectorSender()
 
-def httpConnectionStatus(httpRequestMessage):
+def selectorSender(connectionSocket, unsent):
 
     """
         Description:
-        Sets connection status based on provided HTTP request message's connection status
+        Sends queued response parts through a non-blocking socket until all are sent,
+        or until the socket would block.
+        Part that is only partly sent is replaced by what is left of it
 
-        Argument:
-        httpRequestMessage: An HTTP request message
+        Bytes in a row, like a header and the data after it, are sent together with sendmsg() (writev) without
+        joining them, file parts are sent with os.sendfile() straight from disk
+        File is closed when all of its part is sent
+        Sending stops at a streamed body, the caller has its next chunk produced and put in front of it
+        once everything before it is sent, so a slow client never makes the server hold more than one chunk of the body
+
+        Arguments:
+        connectionSocket: Non-blocking connection socket
+        unsent:           Queue of unsent parts, memoryviews, tuples (file, offset, count) or ResponseStreams
 
         Returns:
-        connectionStatus: Connection status indicated in HTTP request message
-                          Set to 'close' if "Connection" field is not in HTTP request message 
-    """
-
-    
-    # connectionStatus, set to 'close' by default
-    connectionStatus = 'close'
-    
-    # splits httpRequestMessage with '\r\n' as seperator, 
-    # this will generate an array containing each field in HTTP request message
-    requestMessageFields = httpRequestMessage.split('\r\n')
-
-    # For loop that iterates through all fields in httpRequestMessage
-    for field in requestMessageFields:
-        
-        # Looks for "Connection" field, by matching start of string with 'Connection:'
-        if field.startswith('Connection:'):
-            # Character 12 and onwards in "Connection" field contains connection status
-            connectionStatus = field[12:]
-            # Preemtively breaks loop
-            break
-    
-    return connectionStatus
+        sentBytes: Bytes sent, 0 if socket accepted nothing
+    """
+
+
+    sentBytes = 0       # Bytes sent so far
+
+    try:
+        while unsent:
+            part = unsent[0]
+
+            # Part is a streamed body, nothing can be sent until its next chunk has been produced
+            if isinstance(part, ResponseStream):
+                return sentBytes
+
+            # Part is bytes, it is sent along with the bytes queued after it
+            if isinstance(part, memoryview):
+                buffers = list(itertools.takewhile(lambda part: isinstance(part, memoryview),
+                                                   itertools.islice(unsent, webserver.maxSendBuffers)))
+                sent = connectionSocket.sendmsg(buffers)
+                sentBytes += sent
+
+                # Removes parts that were sent completely
+                for buffer in buffers:
+                    # Socket is full, rest of the parts is sent later
+                    if sent < buffer.nbytes:
+                        unsent[0] = buffer[sent:]
+                        return sentBytes
+                    sent -= buffer.nbytes
+                    unsent.popleft()
+                continue
+
+            # Part is count bytes from offset in an open file
+            else:
+                responseFile, offset, count = part
+                sent = os.sendfile(connectionSocket.fileno(), responseFile.fileno(), offset, count)
+                sentBytes += sent
+
+                # File was shorter than promised in Content-Length, client can not trust the connection anymore
+                if sent == 0:
+                    raise ConnectionError('file changed while it was sent')
+
+                # Socket is full, rest of the file is sent later
+                if sent < count:
+                    unsent[0] = (responseFile, offset + sent, count - sent)
+                    return sentBytes
+
+                responseFile.close()
+
+            # Whole part is sent
+            unsent.popleft()
+
+    # Socket is full, rest of the parts is sent when it is writable again
+    except (BlockingIOError, InterruptedError):
+        pass
+
+    return sentBytes
 
-# End of httpConnectionStatus()
+# End of selectorSender()
 
 
 
-# Beginning of httpResponseWriter()
+# Beginning of selectorReaper()
 
-def httpResponseWriter(status, connection, data):
+# HTTP response message sent to a client that has not sent a request completely within requestTimeout seconds
+requestTimeoutMessage = httpResponseWriter('408 Request Timeout', 'close', '<h1>408 Request Timeout<h1>')
+
+
+def selectorReaper(selector, now):
 
     """
         Description:
-        Writes HTTP response message with provided status and data.
-        Inclueded fields in HTTP response message are: Content-Length, Connection and Content-Type
+        Closes connections that have neither sent nor received anything for keepAliveTimeout seconds,
+        so idle clients do not hold on to sockets and file descriptors forever.
+        Also closes connections whose client stopped receiving a response
+        Connections with a request that has not arrived completely within requestTimeout seconds of its first bytes
+        are sent "408 Request Timeout" and closed, so clients sending a byte at a time are not kept either
 
         Arguments:
-        status:     Contains status code and phrase for the HTTP response message
-        data:       HTTP response message's attached data
-        connection: Decides if client stays connected, is either "keep-alive" or "close"
-        
-        Returns:
-        httpResponseMessage: Fully written HTTP response message in the form of a string    
+        selector: Selector the connection sockets are registered with
+        now:      Current time from time.monotonic()
+    """
+
+
+    # Registered sockets are copied, since closing a connection changes the selector's map
+    for key in list(selector.get_map().values()):
+
+        # serverSocket and the socket of the frame producer have no state and are never closed here
+        state = key.data
+        if not isinstance(state, dict):
+            continue
+
+        # Time spent producing a chunk of a streamed body is server's, client is not idle meanwhile
+        if state['producing']:
+            continue
+
+        # Request has started arriving but is late, client is told so without waiting for the socket to be writable
+        if state['parser'].pending() and not state['unsent'] and now > state['deadline']:
+            try:
+                key.fileobj.send(requestTimeoutMessage)
+            except OSError:
+                pass
+            metrics.requestRecorder('408 Request Timeout', 0, len(requestTimeoutMessage))
+            accessLog.access(state['address'], None, '408 Request Timeout', len(requestTimeoutMessage), 0)
+            # Status message for log
+            accessLog.warning('Request from %s was not received within %s seconds, "408 Request Timeout" sent, '
+                              'closing connection socket...', state['address'][0], webserver.requestTimeout)
+            selectorCloseConnection(selector, key.fileobj, state)
+
+        elif now - state['active'] > webserver.keepAliveTimeout:
+            # Status message for log
+            accessLog.debug('Client has been idle for %s seconds, closing connection socket...', webserver.keepAliveTimeout)
+            selectorCloseConnection(selector, key.fileobj, state)
+
+# End of selectorReaper()
+
+
+
+# Beginning of selectorCloseConnection()
+
+def selectorCloseConnection(selector, connectionSocket, state):
+
+    """
+        Description:
+        Unregisters a connection socket from selector and closes it
+        Files and streams of response parts that were never sent are closed as well.
+        A stream whose chunk is being produced is running in a worker thread, it is closed when the chunk is ready
+
+        Arguments:
+        selector:         Selector the connection socket is registered with
+        connectionSocket: Connection socket to be closed
+        state:            State of the connection
     """
 
+    if state['events']:
+        selector.unregister(connectionSocket)
+    state['events'] = 0
+    state['closed'] = True
+    connectionSocket.close()
+    metrics.connectionClosed()
+    admissionControl.release()
 
-    # Writes the HTTP response message
-    httpResponseMessage = f'HTTP/1.1 {status}\r\n' \
-                          f'Content-Length: {len(data)}\r\n' \
-                          f'Connection: {connection}\r\n' \
-                          'Content-Type: text/html; charset=UTF-8\r\n' \
-                          '\r\n' \
-                          f'{data}'
-    
-    return httpResponseMessage
+    # Closes files and streams that were queued to be sent
+    httpResponseCloser(list(state['unsent'])[1:] if state['producing'] else state['unsent'])
 
-# End of httpResponseWriter()
+# End of selectorCloseConnection()
 
 
 
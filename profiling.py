@@ -0,0 +1,378 @@
+"""
+    Timing and profiling of single requests, used by the webservers to find where time goes when latency spikes.
+
+    With phase timing on, every request is timed in phases with perf_counter_ns():
+    recv (first bytes of request until all of it has arrived), parse, disk (finding and reading the file),
+    build (writing the response) and send. Phases up to build are sent to the client in a "Server-Timing" field,
+    and all phases are added up and written to the log at a fixed interval
+
+    With profiling on, every request is profiled with cProfile, and profiles of the slowest requests are kept
+    as files that can be read with pstats or snakeviz. Profiling is slow, so it is meant to be turned on for a while
+    when something is wrong. Both can be turned on and off while the server runs, with SIGUSR2 and SIGUSR1
+"""
+
+import os               # imported so profiles can be written to a directory
+import re               # imported so request targets can be made safe to use in file names
+import time             # imported so phases can be timed in nanoseconds
+import heapq            # imported so the slowest profiled requests are found quickly
+import tempfile         # imported so profiles are written outside the document root by default
+import signal           # imported so timing and profiling can be turned on and off while server runs
+import threading        # imported so totals can be shared by worker threads
+import cProfile         # imported so requests can be profiled
+
+
+# Characters of a request target that are not kept in the file name of its profile
+unsafeCharacters = re.compile(r'[^A-Za-z0-9._-]')
+
+# Directory profiles are written to by default. Profiles hold source paths, function names and request targets,
+# so they are kept out of the directory the server is started in, which it serves
+defaultDirectory = os.path.join(tempfile.gettempdir(), 'webserver-profiles')
+
+
+# Beginning of RequestTrace
+
+class RequestTrace:
+
+    """
+        Description:
+        Phases of one request, and its profile if it is being profiled
+
+        Arguments:
+        receivedAt: Time in nanoseconds from perf_counter_ns() the first bytes of the request arrived
+        parseStart: Time in nanoseconds from perf_counter_ns() parsing of the request started
+        profile:    cProfile.Profile that is enabled, None if request is not profiled
+    """
+
+    __slots__ = ('start', 'last', 'phases', 'profile')
+
+    def __init__(self, receivedAt, parseStart, profile):
+        self.start = receivedAt                         # Time request started arriving
+        self.last = parseStart                          # Time last phase ended
+        self.phases = [('recv', parseStart - receivedAt)]   # (phase, nanoseconds) in the order they happened
+        self.profile = profile
+
+
+    # Beginning of mark()
+
+    def mark(self, phase):
+
+        """
+            Description:
+            Ends a phase, it is timed from the end of the phase before it
+
+            Argument:
+            phase: Name of the phase, like "disk"
+        """
+
+        now = time.perf_counter_ns()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    # End of mark()
+
+
+
+    # Beginning of header()
+
+    def header(self):
+
+        """
+            Description:
+            Writes the phases timed so far as a "Server-Timing" field value, durations are in milliseconds
+
+            Returns:
+            serverTiming: Value like "recv;dur=0.012, parse;dur=0.004, disk;dur=0.031"
+        """
+
+        return ', '.join(f'{phase};dur={nanoseconds / 1_000_000:.3f}' for phase, nanoseconds in self.phases)
+
+    # End of header()
+
+# End of RequestTrace
+
+
+
+# Beginning of RequestProfiler
+
+class RequestProfiler:
+
+    """
+        Description:
+        Starts and finishes RequestTraces, adds up their phases, and keeps profiles of the slowest requests.
+        Does nothing, and costs one attribute lookup per request, while timing and profiling are both off
+
+        Arguments:
+        logInterval: Seconds between writing phase totals to the log
+        slowest:     Number of profiles kept, profiles of faster requests are deleted
+        directory:   Directory profiles are written to, must not be inside the document root, or anyone could download them
+        log:         Function the phase totals are written with, print by default
+    """
+
+
+    # Beginning of __init__()
+
+    def __init__(self, logInterval = 10, slowest = 10, directory = defaultDirectory, log = print):
+
+        self.timing = False                 # Phases are timed and sent to clients
+        self.profiling = False              # Requests are profiled
+        self.logInterval = logInterval
+        self.slowest = slowest
+        self.directory = directory
+        self.log = log
+
+        # Phase totals since they were last written to the log, phase mapped to [requests, nanoseconds, most nanoseconds]
+        self.totals = {}
+        self.loggedAt = time.monotonic()
+
+        # Kept profiles as a heap of (nanoseconds, number, path), fastest first so it is the one replaced
+        self.profiles = []
+        self.profileNumber = 0
+
+        # Totals and kept profiles are shared by worker threads
+        self.lock = threading.Lock()
+
+    # End of __init__()
+
+
+
+    # Beginning of enabled()
+
+    def enabled(self):
+
+        """
+            Description:
+            Tells if requests should be traced
+
+            Returns:
+            enabled: True if timing or profiling is on
+        """
+
+        return self.timing or self.profiling
+
+    # End of enabled()
+
+
+
+    # Beginning of start()
+
+    def start(self, receivedAt, parseStart):
+
+        """
+            Description:
+            Starts tracing a request that has just been parsed. Profiling of it starts here,
+            so parsing and receiving are not in the profile
+
+            Arguments:
+            receivedAt: Time in nanoseconds from perf_counter_ns() the first bytes of the request arrived
+            parseStart: Time in nanoseconds from perf_counter_ns() parsing of the request started
+
+            Returns:
+            trace: RequestTrace of the request, with its parse phase ended, None if timing and profiling are off
+        """
+
+
+        if not (self.timing or self.profiling):
+            return None
+
+        # Only one profiler can run in a thread at a time, request is not profiled if another one is running
+        profile = None
+        if self.profiling:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                profile = None
+
+        trace = RequestTrace(receivedAt, parseStart, profile)
+        trace.mark('parse')
+        return trace
+
+    # End of start()
+
+
+
+    # Beginning of finish()
+
+    def finish(self, trace, status, target):
+
+        """
+            Description:
+            Ends the send phase of a request, adds its phases to the totals,
+            and keeps its profile if it is one of the slowest. Totals are written to the log when interval has passed
+            A kept profile is written to disk before this returns, an event loop calls traceRecorder()
+            and runs profileWriter() in a worker thread instead
+
+            Arguments:
+            trace:  RequestTrace of the request, nothing is done if it is None
+            status: HTTP status of the response
+            target: Requested target, written in the name of its profile
+        """
+
+        keptProfile = self.traceRecorder(trace, status, target)
+        if keptProfile is not None:
+            self.profileWriter(*keptProfile)
+
+    # End of finish()
+
+
+
+    # Beginning of traceRecorder()
+
+    def traceRecorder(self, trace, status, target):
+
+        """
+            Description:
+            Does what finish() does, except writing a kept profile to disk, which is left to the caller
+
+            Arguments:
+            trace:  RequestTrace of the request, nothing is done if it is None
+            status: HTTP status of the response
+            target: Requested target, written in the name of its profile
+
+            Returns:
+            keptProfile: Arguments of profileWriter() if profile is kept, None otherwise
+        """
+
+
+        if trace is None:
+            return None
+
+        trace.mark('send')
+        if trace.profile is not None:
+            trace.profile.disable()
+        duration = trace.last - trace.start
+
+
+        with self.lock:
+            # Adds phases to the totals
+            for phase, nanoseconds in trace.phases:
+                total = self.totals.setdefault(phase, [0, 0, 0])
+                total[0] += 1
+                total[1] += nanoseconds
+                total[2] = max(total[2], nanoseconds)
+
+            # Totals are written when interval has passed, and started over
+            now = time.monotonic()
+            if now - self.loggedAt >= self.logInterval:
+                self.log(self.totalsWriter(now - self.loggedAt))
+                self.totals = {}
+                self.loggedAt = now
+
+            # Profile is kept if there is room, or if request was slower than the fastest kept one
+            keep = trace.profile is not None and \
+                   (len(self.profiles) < self.slowest or duration > self.profiles[0][0])
+            if keep:
+                self.profileNumber += 1
+                # Target is written by the client, every character but letters, digits, ".", "_" and "-" is replaced,
+                # so characters like NUL or ".." can not make the file name invalid or lead outside the directory
+                name = unsafeCharacters.sub('_', target.strip('/'))[:40].lstrip('.')
+                path = os.path.join(self.directory, f'{duration // 1000:010d}us-{status[:3]}-{os.getpid()}-'
+                                                    f'{self.profileNumber}-{name}.prof')
+                replaced = heapq.heappushpop(self.profiles, (duration, self.profileNumber, path)) \
+                           if len(self.profiles) >= self.slowest else None
+                if replaced is None:
+                    heapq.heappush(self.profiles, (duration, self.profileNumber, path))
+
+
+        # Profile is written and replaced profile is deleted without holding the lock
+        if not keep:
+            return None
+        return trace.profile, path, replaced[2] if replaced is not None else None
+
+    # End of traceRecorder()
+
+
+
+    # Beginning of profileWriter()
+
+    def profileWriter(self, profile, path, replacedPath):
+
+        """
+            Description:
+            Writes a kept profile to disk, and deletes the profile it replaced
+
+            Arguments:
+            profile:      cProfile.Profile of the request
+            path:         File the profile is written to
+            replacedPath: File of the profile it replaced, None if it replaced none
+        """
+
+        os.makedirs(self.directory, exist_ok = True)
+        profile.dump_stats(path)
+        if replacedPath is not None:
+            try:
+                os.remove(replacedPath)
+            except FileNotFoundError:
+                pass
+
+    # End of profileWriter()
+
+
+
+    # Beginning of totalsWriter()
+
+    def totalsWriter(self, seconds):
+
+        """
+            Description:
+            Writes phase totals as one line for the log. Lock must be held by caller
+
+            Argument:
+            seconds: Seconds the totals were added up over
+
+            Returns:
+            line: Average and most milliseconds of every phase, like "recv avg 0.010 ms max 0.200 ms"
+        """
+
+        requests = max((total[0] for total in self.totals.values()), default = 0)
+        phases = ', '.join(f'{phase} avg {total[1] / total[0] / 1_000_000:.3f} ms max {total[2] / 1_000_000:.3f} ms'
+                           for phase, total in self.totals.items())
+        return f'Phase timing of {requests} requests over {seconds:.0f} seconds: {phases}'
+
+    # End of totalsWriter()
+
+
+
+    # Beginning of signalInstaller()
+
+    def signalInstaller(self):
+
+        """
+            Description:
+            Lets timing and profiling be turned on and off while server runs:
+            SIGUSR1 turns profiling on or off, SIGUSR2 turns phase timing on or off
+            Must be called from the main thread. Does nothing on systems without these signals
+        """
+
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.signalHandler)
+            signal.signal(signal.SIGUSR2, self.signalHandler)
+
+    # End of signalInstaller()
+
+
+
+    # Beginning of signalHandler()
+
+    def signalHandler(self, signalNumber, frame):
+
+        """
+            Description:
+            Turns profiling or phase timing on or off when a signal arrives
+
+            Arguments:
+            signalNumber: SIGUSR1 for profiling, SIGUSR2 for timing
+            frame:        Frame that was running, not used
+        """
+
+        if signalNumber == signal.SIGUSR1:
+            self.profiling = not self.profiling
+            self.log(f'Profiling turned {"on" if self.profiling else "off"}, '
+                     f'profiles of the {self.slowest} slowest requests are kept in {os.path.abspath(self.directory)}')
+        else:
+            self.timing = not self.timing
+            self.log(f'Phase timing turned {"on" if self.timing else "off"}')
+
+    # End of signalHandler()
+
+# End of RequestProfiler
@@ -0,0 +1,240 @@
+"""
+    Streamed response bodies, sent as they are produced instead of being written completely first.
+
+    A streamed body is any iterator of byte chunks, usually a generator. Chunks are sent with chunked
+    transfer-encoding as they are produced, so the length never has to be known up front,
+    memory use stays at one chunk no matter how large the body is, and the first bytes reach the client right away.
+    A generator may return a dictionary of trailer fields, which are sent after the last chunk.
+    If the client goes away, the generator is closed, so the code producing chunks stops early
+
+    An event loop serving many connections in one thread must not run generators itself, since one slow generator
+    would hold up every connection. It has the frames produced by worker threads of a FrameProducer instead
+"""
+
+import socket           # imported so worker threads can wake the event loop up
+from collections import deque   # imported so produced frames are handed to the event loop without taking a lock
+from concurrent.futures import ThreadPoolExecutor  # imported so frames are produced by a fixed number of worker threads
+
+
+# Beginning of ResponseStream
+
+class ResponseStream:
+
+    """
+        Description:
+        Part of an HTTP response message whose body is produced by an iterator of chunks.
+        Servers ask it for frames to send one at a time, and must close it when they are done with it
+
+        Arguments:
+        chunks:  Iterator of chunks in the form of bytes or strings, strings are encoded as UTF-8.
+                 A generator may return a dictionary of trailer fields, field name mapped to value
+        chunked: True if chunks are framed with chunked transfer-encoding,
+                 False if they are sent as they are, for HTTP/1.0 clients, and the connection is closed after them
+    """
+
+
+    # Beginning of __init__()
+
+    def __init__(self, chunks, chunked = True):
+
+        self.chunks = iter(chunks)
+        self.chunked = chunked
+        self.sent = 0               # Bytes of frames handed out so far, counted for metrics and the access log
+        self.finished = False       # Last frame has been handed out
+
+    # End of __init__()
+
+
+
+    # Beginning of nextFrame()
+
+    def nextFrame(self):
+
+        """
+            Description:
+            Produces the next chunk and frames it for sending. Empty chunks are skipped, since a chunk of size 0 ends the body.
+            After the last chunk, the last-chunk and trailer fields are returned, then None
+
+            Returns:
+            frame: Bytes to send next, None when the body has been sent completely
+        """
+
+
+        if self.finished:
+            return None
+
+        try:
+            chunk = next(self.chunks)
+            while not chunk:
+                chunk = next(self.chunks)
+
+        # Iterator is done, body is ended with a chunk of size 0 and the trailer fields a generator returned
+        except StopIteration as end:
+            self.finished = True
+            if not self.chunked:
+                return None
+
+            trailers = end.value or {}
+            frame = b'0\r\n' + ''.join(f'{name}: {value}\r\n' for name, value in trailers.items()).encode('latin-1') + b'\r\n'
+            self.sent += len(frame)
+            return frame
+
+
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+
+        # Chunk is its size in hexadecimal, the data and a CRLF
+        frame = b'%x\r\n%s\r\n' % (len(chunk), chunk) if self.chunked else bytes(chunk)
+        self.sent += len(frame)
+        return frame
+
+    # End of nextFrame()
+
+
+
+    # Beginning of close()
+
+    def close(self):
+
+        """
+            Description:
+            Closes the iterator if it can be closed. A generator that is not done yet gets GeneratorExit
+            where it is paused, so it stops producing chunks and its finally blocks close what it opened
+        """
+
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+
+    # End of close()
+
+# End of ResponseStream
+
+
+
+# Beginning of FrameProducer
+
+class FrameProducer:
+
+    """
+        Description:
+        Produces frames of ResponseStreams in worker threads, for an event loop that serves many connections in one thread.
+        Event loop registers wakeupSocket with its selector, it is readable while produced frames wait to be collected
+
+        Arguments:
+        workers: Number of worker threads, the most generators that run at once
+    """
+
+
+    # Beginning of __init__()
+
+    def __init__(self, workers = 4):
+
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix = 'frame-producer')
+        # Worker threads send a byte to notifySocket when a frame is produced, which makes wakeupSocket readable
+        self.wakeupSocket, self.notifySocket = socket.socketpair()
+        self.wakeupSocket.setblocking(False)
+        self.notifySocket.setblocking(False)
+        # Produced frames as (owner, frame, error), appending and popping are atomic, so no lock is taken
+        self.frames = deque()
+
+    # End of __init__()
+
+
+
+    # Beginning of produce()
+
+    def produce(self, stream, owner):
+
+        """
+            Description:
+            Has the next frame of a stream produced by a worker thread. Stream must not be used until its frame is collected
+
+            Arguments:
+            stream: ResponseStream whose next frame is produced
+            owner:  Handed back along with the frame, like the connection the stream is sent through
+        """
+
+        self.executor.submit(self.frameProducer, stream, owner)
+
+    # End of produce()
+
+
+
+    # Beginning of frameProducer()
+
+    def frameProducer(self, stream, owner):
+
+        """
+            Description:
+            Runs in a worker thread. Produces the next frame of a stream and wakes the event loop up
+
+            Arguments:
+            stream: ResponseStream whose next frame is produced
+            owner:  Handed back along with the frame
+        """
+
+        try:
+            frame, error = stream.nextFrame(), None
+        except Exception as exception:
+            frame, error = None, exception
+
+        self.frames.append((owner, frame, error))
+
+        # Socket is only full if the event loop has not woken up for earlier frames yet, it collects this one then
+        try:
+            self.notifySocket.send(b'\0')
+        except OSError:
+            pass
+
+    # End of frameProducer()
+
+
+
+    # Beginning of produced()
+
+    def produced(self):
+
+        """
+            Description:
+            Collects frames produced since last time, called by the event loop when wakeupSocket is readable
+
+            Returns:
+            frames: List of (owner, frame, error). Frame is None when the stream has ended,
+                    error is the exception the stream raised, None if it raised none
+        """
+
+
+        # Wakeup bytes are read before frames are collected, so a frame produced meanwhile wakes the event loop again
+        try:
+            while self.wakeupSocket.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+        frames = []
+        while self.frames:
+            frames.append(self.frames.popleft())
+
+        return frames
+
+    # End of produced()
+
+
+
+    # Beginning of close()
+
+    def close(self):
+
+        """
+            Description:
+            Stops the worker threads without waiting for frames being produced, and closes the sockets
+        """
+
+        self.executor.shutdown(wait = False, cancel_futures = True)
+        self.wakeupSocket.close()
+        self.notifySocket.close()
+
+    # End of close()
+
+# End of FrameProducer
@@ -0,0 +1,108 @@
+"""
+    Tests of how accesslog.py writes records. Can be run with: python3 -m unittest test_accesslog
+    Records are written to a temporary log file by calling flush() directly, so no writer thread is needed
+"""
+
+import io               # imported so what is reported on stderr can be caught
+import os               # imported so the log file can be found
+import contextlib       # imported so stderr can be redirected while records are written
+import tempfile         # imported so the log file can be thrown away after the tests
+import unittest         # imported so the tests can be run without other packages
+
+from accesslog import AccessLog
+from httpparser import HttpRequest
+
+
+# Beginning of AccessLogTest
+
+class AccessLogTest(unittest.TestCase):
+
+    """
+        Description:
+        Tests of formatting and queueing records, and of records that can not be formatted
+    """
+
+
+    # Beginning of setUp()
+
+    def setUp(self):
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'access.log')
+
+        # Writer thread is never started, since it is already marked as running, records are written by flush()
+        self.accessLog = AccessLog(path = self.path, maxRecords = 3)
+        self.accessLog.writer = True
+        self.addCleanup(setattr, self.accessLog, 'writer', None)
+
+    # End of setUp()
+
+
+
+    # Beginning of logReader()
+
+    def logReader(self):
+
+        """
+            Description:
+            Writes queued records, keeping what is reported on stderr in self.stderr, and reads the log file
+
+            Returns:
+            lines: Lines of the log file
+        """
+
+        self.stderr = io.StringIO()
+        with contextlib.redirect_stderr(self.stderr):
+            self.accessLog.flush()
+        with open(self.path) as file:
+            return file.read().splitlines()
+
+    # End of logReader()
+
+# End of AccessLogTest
+
+
+
+# Beginning of FlushTest
+
+class FlushTest(AccessLogTest):
+
+    """
+        Description:
+        Tests of records that can not be formatted, and of records dropped when the queue is full
+    """
+
+    def testBadRecordDoesNotStopOthers(self):
+        self.accessLog.info('Placeholder %s %s has one argument', 'index.html')
+        self.accessLog.info('No placeholder', 'index.html')
+        self.accessLog.info('Served %s', 'index.html')
+        lines = self.logReader()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].endswith('info Served index.html'))
+        self.assertEqual(self.stderr.getvalue().count('Log record could not be formatted'), 2)
+
+    def testBadStatusInJson(self):
+        self.accessLog.configure(logFormat = 'json')
+        self.accessLog.access(('127.0.0.1', 0), None, 'bad status', 0, 0)
+        self.accessLog.access(('127.0.0.1', 0), HttpRequest('GET', '/', 'HTTP/1.1', {}), '200 OK', 6, 0)
+        lines = self.logReader()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('"status": 200', lines[0])
+        self.assertIn('ValueError', self.stderr.getvalue())
+
+    def testFullQueueDropsAndCounts(self):
+        for number in range(5):
+            self.accessLog.info('Message %s', number)
+        lines = self.logReader()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[2].endswith('info Message 2'))
+        self.assertTrue(lines[3].endswith('warning Log fell behind, 2 records were dropped'))
+        self.assertEqual(self.accessLog.dropped, 0)
+
+# End of FlushTest
+
+
+
+if __name__ == '__main__':  # runs the tests
+    unittest.main()
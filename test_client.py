@@ -0,0 +1,128 @@
+"""
+    Tests of how client.py reuses connections. Can be run with: python3 -m unittest test_client
+    Requests are sent to a small server in a thread, which answers a given number of requests on every connection
+"""
+
+import socket           # imported so the test server can listen for connections
+import threading        # imported so the test server runs next to the client
+import unittest         # imported so the tests can be run without other packages
+
+from client import HttpClient
+
+
+# Beginning of ScriptedServer
+
+class ScriptedServer:
+
+    """
+        Description:
+        Server that answers every GET request with "ok", and closes each connection after a given number of responses.
+        Paths requested on every connection are kept, so tests can see which requests shared a connection
+
+        Argument:
+        plans: List with one entry per connection, in the order they are accepted: (responses, announce).
+               Connection is closed after responses requests, announce is True if the last response has "Connection: close",
+               False if the connection is closed without telling the client, like a server closing an idle connection
+    """
+
+
+    # Beginning of __init__()
+
+    def __init__(self, plans):
+
+        self.plans = list(plans)
+        self.connections = []       # Paths requested on every accepted connection
+
+        self.serverSocket = socket.create_server(('127.0.0.1', 0))
+        self.port = self.serverSocket.getsockname()[1]
+        self.thread = threading.Thread(target = self.serverLoop, daemon = True)
+        self.thread.start()
+
+    # End of __init__()
+
+
+
+    # Beginning of serverLoop()
+
+    def serverLoop(self):
+
+        """
+            Description:
+            Accepts one connection per plan and answers requests on it, one connection at a time
+        """
+
+        for responses, announce in self.plans:
+            connectionSocket, _ = self.serverSocket.accept()
+            paths = []
+            self.connections.append(paths)
+            received = b''
+
+            with connectionSocket:
+                while len(paths) < responses:
+                    # Reads until a full request message has arrived
+                    while b'\r\n\r\n' not in received:
+                        data = connectionSocket.recv(4096)
+                        if not data:
+                            break
+                        received += data
+                    if b'\r\n\r\n' not in received:
+                        break
+
+                    header, received = received.split(b'\r\n\r\n', 1)
+                    paths.append(header.split(b' ')[1].decode())
+
+                    last = len(paths) == responses and announce
+                    connectionSocket.sendall(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n'
+                                             + (b'Connection: close\r\n' if last else b'') + b'\r\nok')
+
+        self.serverSocket.close()
+
+    # End of serverLoop()
+
+# End of ScriptedServer
+
+
+
+# Beginning of ConnectionReuseTest
+
+class ConnectionReuseTest(unittest.TestCase):
+
+    """
+        Description:
+        Tests of connections kept in the pool, and of connections the server has closed
+    """
+
+    def setUp(self):
+        self.client = HttpClient(timeout = 5)
+        self.addCleanup(self.client.close)
+
+    def requester(self, server, *paths):
+        for path in paths:
+            response = self.client.request('127.0.0.1', server.port, path)
+            self.assertEqual((response.status, response.body), (200, b'ok'))
+
+    def testKeepAliveIsReused(self):
+        server = ScriptedServer([(3, False)])
+        self.requester(server, '/a', '/b', '/c')
+        self.assertEqual(server.connections, [['/a', '/b', '/c']])
+
+    def testConnectionCloseIsNotReused(self):
+        # Connection answered with "Connection: close" is never put in the pool, next request uses a new one
+        server = ScriptedServer([(2, True), (2, True)])
+        self.requester(server, '/a', '/b', '/c', '/d')
+        self.assertEqual(server.connections, [['/a', '/b'], ['/c', '/d']])
+        self.assertEqual(self.client.pool.get(('127.0.0.1', server.port), []), [])
+
+    def testIdleConnectionClosedByServerIsRetried(self):
+        # Server closes the pooled connection without telling, request is sent again on a new connection
+        server = ScriptedServer([(1, False), (1, False)])
+        self.requester(server, '/a')
+        self.requester(server, '/b')
+        self.assertEqual(server.connections, [['/a'], ['/b']])
+
+# End of ConnectionReuseTest
+
+
+
+if __name__ == '__main__':  # runs the tests
+    unittest.main()
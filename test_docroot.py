@@ -0,0 +1,104 @@
+"""
+    Tests of how docroot.py finds files. Can be run with: python3 -m unittest test_docroot
+    Files are indexed from a temporary document root, with a secret file next to it that must never be found
+"""
+
+import os               # imported so files can be written to the document root
+import tempfile         # imported so the document root can be thrown away after the tests
+import unittest         # imported so the tests can be run without other packages
+
+from docroot import DocumentIndex
+
+
+# Beginning of DocumentIndexTest
+
+class DocumentIndexTest(unittest.TestCase):
+
+    """
+        Description:
+        Tests of path normalization, of paths leading outside the document root, and of hidden files
+    """
+
+
+    # Beginning of setUp()
+
+    def setUp(self):
+
+        # Document root is a directory inside the temporary directory, secret.txt is next to it
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.root = os.path.join(self.directory.name, 'root')
+        os.makedirs(os.path.join(self.root, 'sub'))
+        os.makedirs(os.path.join(self.root, '.git'))
+
+        for name in ('index.html', 'sub/page.html', '.env', '.git/config', '../secret.txt'):
+            with open(os.path.join(self.root, name), 'w') as file:
+                file.write(name)
+
+        self.documentIndex = DocumentIndex(self.root)
+        self.documentIndex.scan()
+
+    # End of setUp()
+
+
+
+    def testNormalPaths(self):
+        pathNormalizer = self.documentIndex.pathNormalizer
+        self.assertEqual(pathNormalizer('/sub/page.html?x=1#top'), '/sub/page.html')
+        self.assertEqual(pathNormalizer('/sub/./page.html'), '/sub/page.html')
+        self.assertEqual(pathNormalizer('//sub//page.html'), '/sub/page.html')
+        self.assertEqual(pathNormalizer('/sub/'), '/sub/')
+        self.assertEqual(pathNormalizer('/a/../sub/page.html'), '/sub/page.html')
+
+    def testDotDotStaysInsideRoot(self):
+        pathNormalizer = self.documentIndex.pathNormalizer
+        self.assertEqual(pathNormalizer('/../secret.txt'), '/secret.txt')
+        self.assertEqual(pathNormalizer('/sub/../../secret.txt'), '/secret.txt')
+        self.assertIsNone(self.documentIndex.lookup('/../secret.txt'))
+        self.assertIsNone(self.documentIndex.lookup('/sub/../../secret.txt'))
+
+    def testEncodedDotDotStaysInsideRoot(self):
+        # "%2e%2e" is decoded before ".." is resolved, so it is resolved like ".."
+        self.assertEqual(self.documentIndex.pathNormalizer('/%2e%2e/secret.txt'), '/secret.txt')
+        self.assertEqual(self.documentIndex.pathNormalizer('/sub/%2E%2E/%2e%2e/secret.txt'), '/secret.txt')
+        self.assertIsNone(self.documentIndex.lookup('/%2e%2e/secret.txt'))
+        self.assertIsNone(self.documentIndex.lookup('/%2e%2e%2fsecret.txt'))
+
+    def testTargetsThatAreNotPaths(self):
+        pathNormalizer = self.documentIndex.pathNormalizer
+        self.assertIsNone(pathNormalizer('secret.txt'))
+        self.assertIsNone(pathNormalizer('http://example.com/index.html'))
+        self.assertIsNone(pathNormalizer('/index.html%00.txt'))
+        self.assertIsNone(pathNormalizer('/..%5csecret.txt'))
+
+    def testHiddenFilesAreNotFound(self):
+        for target in ('/.env', '/.git/config', '/%2eenv', '/sub/../.env', '/.git/'):
+            self.assertIsNone(self.documentIndex.lookup(target), target)
+        self.assertNotIn('/.env', self.documentIndex.documents)
+
+    def testFilesAreFound(self):
+        self.assertEqual(self.documentIndex.lookup('/').path, os.path.join(self.root, 'index.html'))
+        self.assertEqual(self.documentIndex.lookup('/sub/%70age.html').path, os.path.join(self.root, 'sub', 'page.html'))
+
+    def testNewFileIsAddedToIndex(self):
+        with open(os.path.join(self.root, 'sub', 'new.html'), 'w') as file:
+            file.write('new')
+        self.assertIsNotNone(self.documentIndex.lookup('/sub/new.html'))
+        self.assertIn('/sub/new.html', self.documentIndex.documents)
+        self.assertIn('/sub/new.html', self.documentIndex.directories['sub'][1])
+
+    def testNewFileIsLeftToRunningScan(self):
+        # Index is not changed while a scan holds scanLock, the file is still found on disk
+        with open(os.path.join(self.root, 'sub', 'new.html'), 'w') as file:
+            file.write('new')
+        with self.documentIndex.scanLock:
+            self.assertIsNotNone(self.documentIndex.lookup('/sub/new.html'))
+        self.assertNotIn('/sub/new.html', self.documentIndex.documents)
+        self.assertNotIn('/sub/new.html', self.documentIndex.directories['sub'][1])
+
+# End of DocumentIndexTest
+
+
+
+if __name__ == '__main__':  # runs the tests
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+    Tests of how filecache.py counts and checks cached files. Can be run with: python3 -m unittest test_filecache
+    Files are cached from a temporary directory
+"""
+
+import os               # imported so files can be written to the directory
+import tempfile         # imported so the directory can be thrown away after the tests
+import unittest         # imported so the tests can be run without other packages
+from unittest import mock       # imported so a file can be changed while the cache reads it
+
+import filecache
+from filecache import FileCache
+
+
+# Beginning of FileCacheTest
+
+class FileCacheTest(unittest.TestCase):
+
+    """
+        Description:
+        Tests of the byte budget, of files that change while they are read, and of variants
+    """
+
+
+    # Beginning of setUp()
+
+    def setUp(self):
+
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.fileCache = FileCache(maxBytes = 1024, checkInterval = 0, streamThreshold = 4096, root = self.root.name)
+
+    # End of setUp()
+
+
+
+    # Beginning of fileWriter()
+
+    def fileWriter(self, name, data, mode = 'wb'):
+
+        """
+            Description:
+            Writes a file to the directory
+
+            Arguments:
+            name: Name of the file
+            data: Data of the file in the form of bytes
+            mode: "wb" to write the file, "ab" to append to it
+        """
+
+        with open(os.path.join(self.root.name, name), mode) as file:
+            file.write(data)
+
+    # End of fileWriter()
+
+
+
+    def testBytesCountedAreBytesRead(self):
+        self.fileWriter('a.txt', b'hello\n')
+        data, _ = self.fileCache.read('a.txt')
+        self.assertEqual(data, b'hello\n')
+        self.assertEqual(self.fileCache.stats()['bytes'], 6)
+        self.assertEqual(self.fileCache.entries[os.path.join(self.root.name, 'a.txt')][1], 6)
+
+    def testFileGrowingWhileReadIsNotCached(self):
+        self.fileWriter('a.txt', b'hello\n')
+        realOpen = open
+
+        # File is appended to right after it has been read, like a log file that is written to
+        def growingOpener(path, mode):
+            file = realOpen(path, mode)
+            read = file.read
+            def grower():
+                data = read()
+                self.fileWriter('a.txt', b'more\n', 'ab')
+                return data
+            file.read = grower
+            return file
+
+        with mock.patch.object(filecache, 'open', growingOpener, create = True):
+            data, _ = self.fileCache.read('a.txt')
+        self.assertEqual(data, b'hello\n')
+        self.assertEqual(self.fileCache.stats()['files'], 0)
+        self.assertEqual(self.fileCache.stats()['bytes'], 0)
+
+        # Next read caches the file as it is now
+        data, _ = self.fileCache.read('a.txt')
+        self.assertEqual(data, b'hello\nmore\n')
+        self.assertEqual(self.fileCache.stats()['bytes'], 11)
+
+    def testVariantOfUncachedFile(self):
+        self.fileCache.maxBytes = 0
+        self.fileWriter('a.txt', b'hello\n')
+        data, _ = self.fileCache.read('a.txt')
+        variant = self.fileCache.variant('a.txt', data, 'upper', lambda data, path, name: data.upper())
+        self.assertEqual(variant, b'HELLO\n')
+        self.assertEqual(self.fileCache.stats()['bytes'], 0)
+
+    def testVariantIsMadeOnce(self):
+        self.fileWriter('a.txt', b'hello\n')
+        data, _ = self.fileCache.read('a.txt')
+        made = []
+        variantMaker = lambda data, path, name: made.append(name) or data.upper()
+        self.fileCache.variant('a.txt', data, 'upper', variantMaker)
+        self.assertEqual(self.fileCache.variant('a.txt', data, 'upper', variantMaker), b'HELLO\n')
+        self.assertEqual(made, ['upper'])
+        self.assertEqual(self.fileCache.stats()['bytes'], 12)
+
+# End of FileCacheTest
+
+
+
+if __name__ == '__main__':  # runs the tests
+    unittest.main()
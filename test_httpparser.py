@@ -0,0 +1,64 @@
+"""
+    Tests of HttpRequestParser in httpparser.py. Can be run with: python3 -m unittest test_httpparser
+"""
+
+import unittest         # imported so the tests can be run without other packages
+
+from httpparser import HttpRequestParser, HttpParseError
+
+
+# Beginning of ContentLengthTest
+
+class ContentLengthTest(unittest.TestCase):
+
+    """
+        Description:
+        Tests of how the "Content-Length" field of a request is parsed
+    """
+
+
+    # Beginning of parse()
+
+    def parse(self, contentLength):
+
+        """
+            Description:
+            Parses a POST request with provided "Content-Length" field, followed by a GET request
+
+            Argument:
+            contentLength: Value of the "Content-Length" field, in the form of bytes
+
+            Returns:
+            parser: The parser after the first request message has been parsed
+        """
+
+        parser = HttpRequestParser()
+        parser.feed(b'POST / HTTP/1.1\r\nContent-Length: ' + contentLength + b'\r\n\r\nabcGET / HTTP/1.1\r\n\r\n')
+        parser.next()
+        return parser
+
+    # End of parse()
+
+
+
+    def testBodyIsSkipped(self):
+        parser = self.parse(b'3')
+        self.assertEqual(parser.next().method, 'GET')
+
+    def testNonAsciiDigitIsBadRequest(self):
+        # "²" is a digit to str.isdigit(), but not to int()
+        with self.assertRaises(HttpParseError) as raised:
+            self.parse('²'.encode('latin-1'))
+        self.assertEqual(raised.exception.status, '400 Bad Request')
+
+    def testTooLargeBody(self):
+        with self.assertRaises(HttpParseError) as raised:
+            self.parse(b'99999999')
+        self.assertEqual(raised.exception.status, '413 Content Too Large')
+
+# End of ContentLengthTest
+
+
+
+if __name__ == '__main__':  # runs the tests
+    unittest.main()
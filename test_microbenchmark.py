@@ -0,0 +1,56 @@
+"""
+    Tests of microbenchmark.py. Can be run with: python3 -m unittest test_microbenchmark
+    Timings are not checked here, since they depend on the machine, that is done by running microbenchmark.py.
+    These tests only make sure every case still runs, is in the baseline, and is compared the way it should be
+"""
+
+import json             # imported so the baseline can be read
+import shutil           # imported so the files of the cases are removed afterwards
+import tempfile         # imported so the files of the cases are kept out of the repository
+import unittest         # imported so the tests can be run without other packages
+
+import microbenchmark
+
+
+# Beginning of MicrobenchmarkTest
+
+class MicrobenchmarkTest(unittest.TestCase):
+
+    """
+        Description:
+        Tests of the cases, the baseline and the comparison against it
+    """
+
+    def testEveryCaseRuns(self):
+        documentRoot = tempfile.mkdtemp(prefix = 'microbenchmark-')
+        self.addCleanup(shutil.rmtree, documentRoot)
+        cases = microbenchmark.caseBuilder(documentRoot)
+        self.assertEqual(sorted(cases), sorted(microbenchmark.caseNames))
+        for name in microbenchmark.caseNames:
+            cases[name]()
+
+    def testEveryCaseIsInBaseline(self):
+        with open(microbenchmark.baselinePath) as baselineFile:
+            baseline = json.load(baselineFile)
+        self.assertEqual(sorted(baseline['results']), sorted(microbenchmark.caseNames))
+        for result in baseline['results'].values():
+            self.assertGreaterEqual(result['noise'], 0)
+
+    def testNoiseWidensAllowedSlowdown(self):
+        baseline = {'results': {'quiet': {'nsPerCall': 100, 'bytesPerCall': 100, 'noise': 0},
+                                'noisy': {'nsPerCall': 100, 'bytesPerCall': 100, 'noise': 0.5}}}
+        results = {'quiet': {'nsPerCall': 140, 'bytesPerCall': 100}, 'noisy': {'nsPerCall': 190, 'bytesPerCall': 100}}
+        _, regressions = microbenchmark.baselineComparer(baseline, results, 0.3)
+        self.assertEqual(regressions, ['quiet'])
+
+        # Slower than the median round of the baseline by more than the tolerance is a regression also for a noisy case
+        results['noisy']['nsPerCall'] = 200
+        _, regressions = microbenchmark.baselineComparer(baseline, results, 0.3)
+        self.assertEqual(regressions, ['quiet', 'noisy'])
+
+# End of MicrobenchmarkTest
+
+
+
+if __name__ == '__main__':  # runs the tests
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+    Tests of how streaming.py frames streamed bodies. Can be run with: python3 -m unittest test_streaming
+    Frames are taken from ResponseStream one at a time, like the servers do, and compared byte by byte
+"""
+
+import select           # imported so a test can wait for FrameProducer to wake the event loop up
+import unittest         # imported so the tests can be run without other packages
+
+from streaming import ResponseStream, FrameProducer
+
+
+# Beginning of ResponseStreamTest
+
+class ResponseStreamTest(unittest.TestCase):
+
+    """
+        Description:
+        Tests of chunk framing, trailer fields and closing of the iterator
+    """
+
+
+    # Beginning of frameCollector()
+
+    def frameCollector(self, stream):
+
+        """
+            Description:
+            Takes every frame of a stream until it returns None
+
+            Argument:
+            stream: ResponseStream the frames are taken from
+
+            Returns:
+            frames: List of frames in the form of bytes
+        """
+
+        frames = []
+        while (frame := stream.nextFrame()) is not None:
+            frames.append(frame)
+        return frames
+
+    # End of frameCollector()
+
+
+
+    def testChunksAreFramed(self):
+        stream = ResponseStream(iter([b'hello', 'wörld', b'x' * 26]))
+        self.assertEqual(self.frameCollector(stream),
+                         [b'5\r\nhello\r\n', b'6\r\nw\xc3\xb6rld\r\n', b'1a\r\n' + b'x' * 26 + b'\r\n', b'0\r\n\r\n'])
+        self.assertEqual(stream.sent, 10 + 11 + 32 + 5)
+
+    def testEmptyChunksAreSkipped(self):
+        # A chunk of size 0 would end the body early
+        stream = ResponseStream(iter([b'', b'a', '', b'b', b'']))
+        self.assertEqual(self.frameCollector(stream), [b'1\r\na\r\n', b'1\r\nb\r\n', b'0\r\n\r\n'])
+
+    def testEmptyBody(self):
+        self.assertEqual(self.frameCollector(ResponseStream(iter([]))), [b'0\r\n\r\n'])
+
+    def testTrailersOfGenerator(self):
+        def chunks():
+            yield b'data'
+            return {'Checksum': 'abc', 'Server-Timing': 'total;dur=1'}
+
+        self.assertEqual(self.frameCollector(ResponseStream(chunks())),
+                         [b'4\r\ndata\r\n', b'0\r\nChecksum: abc\r\nServer-Timing: total;dur=1\r\n\r\n'])
+
+    def testUnchunkedForHttp10(self):
+        stream = ResponseStream(iter([b'hello', b'', 'world']), chunked = False)
+        self.assertEqual(self.frameCollector(stream), [b'hello', b'world'])
+        self.assertEqual(stream.sent, 10)
+
+    def testNoFramesAfterEnd(self):
+        stream = ResponseStream(iter([b'a']))
+        self.frameCollector(stream)
+        self.assertIsNone(stream.nextFrame())
+
+    def testCloseStopsGenerator(self):
+        closed = []
+        def chunks():
+            try:
+                while True:
+                    yield b'data'
+            finally:
+                closed.append(True)
+
+        stream = ResponseStream(chunks())
+        stream.nextFrame()
+        stream.close()
+        self.assertEqual(closed, [True])
+
+# End of ResponseStreamTest
+
+
+
+# Beginning of FrameProducerTest
+
+class FrameProducerTest(unittest.TestCase):
+
+    """
+        Description:
+        Tests of frames produced by worker threads, and of errors raised by streams
+    """
+
+    def setUp(self):
+        self.frameProducer = FrameProducer(workers = 1)
+        self.addCleanup(self.frameProducer.close)
+
+    def producedWaiter(self):
+        # Event loop would wait for wakeupSocket with its selector
+        readable, _, _ = select.select([self.frameProducer.wakeupSocket], [], [], 5)
+        self.assertTrue(readable)
+        return self.frameProducer.produced()
+
+    def testFrameIsHandedBackWithOwner(self):
+        self.frameProducer.produce(ResponseStream(iter([b'hello'])), 'connection')
+        self.assertEqual(self.producedWaiter(), [('connection', b'5\r\nhello\r\n', None)])
+
+    def testErrorIsHandedBack(self):
+        def chunks():
+            raise ValueError('broken')
+            yield b''
+
+        self.frameProducer.produce(ResponseStream(chunks()), 'connection')
+        (owner, frame, error), = self.producedWaiter()
+        self.assertEqual((owner, frame), ('connection', None))
+        self.assertIsInstance(error, ValueError)
+
+# End of FrameProducerTest
+
+
+
+if __name__ == '__main__':  # runs the tests
+    unittest.main()
@@ -0,0 +1,319 @@
+"""
+    Tests of how webserver.py answers requests. Can be run with: python3 -m unittest test_webserver
+    Requests are sent to connectionHandler() through a pair of connected sockets, so no port is used,
+    and files are served from a temporary document root
+"""
+
+import os               # imported so files can be written to the document root
+import zlib             # imported so compressed responses can be decompressed
+import socket           # imported so connectionHandler() can be given a connected socket
+import tempfile         # imported so the document root can be thrown away after the tests
+import threading        # imported so connectionHandler() can answer while requests are sent
+import unittest         # imported so the tests can be run without other packages
+
+import webserver
+from docroot import DocumentIndex
+
+
+# Beginning of WebserverTest
+
+class WebserverTest(unittest.TestCase):
+
+    """
+        Description:
+        Base of the tests, serves a temporary document root with index.html in it
+    """
+
+
+    # Beginning of setUp()
+
+    def setUp(self):
+
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.fileWriter('index.html', b'hello\n')
+
+        # Server finds files in the temporary document root, and logs nothing
+        documentIndex = webserver.documentIndex
+        webserver.documentIndex = DocumentIndex(self.root.name)
+        self.addCleanup(setattr, webserver, 'documentIndex', documentIndex)
+        webserver.accessLog.configure(level = 'error', sampleRate = 0)
+
+    # End of setUp()
+
+
+
+    # Beginning of fileWriter()
+
+    def fileWriter(self, name, data):
+
+        """
+            Description:
+            Writes a file to the document root
+
+            Arguments:
+            name: Name of the file, like "index.html"
+            data: Data of the file in the form of bytes
+        """
+
+        with open(os.path.join(self.root.name, name), 'wb') as file:
+            file.write(data)
+
+    # End of fileWriter()
+
+
+
+    # Beginning of exchange()
+
+    def exchange(self, requests):
+
+        """
+            Description:
+            Sends request messages to connectionHandler() all at once, and receives until it closes the connection.
+            Last request message should have "Connection: close", so the connection is closed after it
+
+            Argument:
+            requests: Request messages in the form of bytes
+
+            Returns:
+            received: Every byte received from the server
+        """
+
+        client, server = socket.socketpair()
+        handler = threading.Thread(target = webserver.connectionHandler, args = (server, ('127.0.0.1', 0)))
+        handler.start()
+
+        with client:
+            client.sendall(requests)
+            received = b''
+            while data := client.recv(65536):
+                received += data
+
+        handler.join()
+        return received
+
+    # End of exchange()
+
+
+
+    # Beginning of responseSplitter()
+
+    def responseSplitter(self, received, bodiless = ()):
+
+        """
+            Description:
+            Splits received bytes into response messages, using "Content-Length" to find where bodies end
+
+            Arguments:
+            received: Bytes received from the server
+            bodiless: Places of responses that have no body whatever "Content-Length" says,
+                      like responses to HEAD requests and "304 Not Modified"
+
+            Returns:
+            responses: List of (status line, header fields, body), field names in lower case
+        """
+
+        responses = []
+        while received:
+            header, _, received = received.partition(b'\r\n\r\n')
+            statusLine, *lines = header.decode('latin-1').split('\r\n')
+            fields = {name.lower(): value.strip() for name, _, value in (line.partition(':') for line in lines)}
+            length = 0 if len(responses) in bodiless else int(fields.get('content-length', 0))
+            responses.append((statusLine, fields, received[:length]))
+            received = received[length:]
+
+        return responses
+
+    # End of responseSplitter()
+
+# End of WebserverTest
+
+
+
+# Beginning of MethodTest
+
+class MethodTest(WebserverTest):
+
+    """
+        Description:
+        Tests of how request methods other than GET are answered
+    """
+
+    def testPipelinedHeadAndGet(self):
+        received = self.exchange(b'HEAD /index.html HTTP/1.1\r\n\r\n'
+                                 b'GET /index.html HTTP/1.1\r\nConnection: close\r\n\r\n')
+        head, get = self.responseSplitter(received, bodiless = (0,))
+        self.assertEqual(head[0], 'HTTP/1.1 200 OK')
+        self.assertEqual(head[1]['content-length'], '6')
+        self.assertEqual(get[0], 'HTTP/1.1 200 OK')
+        self.assertEqual(get[2], b'hello\n')
+        # HEAD response ends with its header, GET response follows it right away
+        self.assertTrue(received.split(b'\r\n\r\n', 1)[1].startswith(b'HTTP/1.1 200 OK'))
+
+    def testHeadOfMissingFile(self):
+        received = self.exchange(b'HEAD /missing.html HTTP/1.1\r\nConnection: close\r\n\r\n')
+        self.assertTrue(received.startswith(b'HTTP/1.1 404 Not Found'))
+        self.assertTrue(received.endswith(b'\r\n\r\n'))
+
+    def testOtherMethodIsNotAllowed(self):
+        received = self.exchange(b'DELETE /index.html HTTP/1.1\r\n\r\n'
+                                 b'GET /index.html HTTP/1.1\r\nConnection: close\r\n\r\n')
+        delete, get = self.responseSplitter(received)
+        self.assertEqual(delete[0], 'HTTP/1.1 405 Method Not Allowed')
+        self.assertEqual(delete[1]['allow'], 'GET, HEAD')
+        self.assertEqual(get[2], b'hello\n')
+
+# End of MethodTest
+
+
+
+# Beginning of RangeTest
+
+class RangeTest(WebserverTest):
+
+    """
+        Description:
+        Tests of ranges of files asked for with the "Range" field
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.fileWriter('ten.txt', b'0123456789')
+
+    def rangeGetter(self, rangeField, extraFields = b''):
+        received = self.exchange(b'GET /ten.txt HTTP/1.1\r\nRange: ' + rangeField + b'\r\n' + extraFields +
+                                 b'Connection: close\r\n\r\n')
+        response, = self.responseSplitter(received)
+        return response
+
+    def testSuffixRange(self):
+        statusLine, fields, body = self.rangeGetter(b'bytes=-3')
+        self.assertEqual(statusLine, 'HTTP/1.1 206 Partial Content')
+        self.assertEqual(fields['content-range'], 'bytes 7-9/10')
+        self.assertEqual(body, b'789')
+
+    def testSuffixLongerThanFile(self):
+        statusLine, fields, body = self.rangeGetter(b'bytes=-50')
+        self.assertEqual(statusLine, 'HTTP/1.1 206 Partial Content')
+        self.assertEqual(fields['content-range'], 'bytes 0-9/10')
+        self.assertEqual(body, b'0123456789')
+
+    def testMultipleRanges(self):
+        statusLine, fields, body = self.rangeGetter(b'bytes=0-1,5-6')
+        self.assertEqual(statusLine, 'HTTP/1.1 206 Partial Content')
+        contentType, _, boundary = fields['content-type'].partition('; boundary=')
+        self.assertEqual(contentType, 'multipart/byteranges')
+
+        # Every part has its own "Content-Range" field, and the body ends with the closing boundary
+        parts = body.split(b'--' + boundary.encode())
+        self.assertEqual(parts[-1], b'--\r\n')
+        self.assertIn(b'Content-Range: bytes 0-1/10\r\n\r\n01\r\n', parts[1])
+        self.assertIn(b'Content-Range: bytes 5-6/10\r\n\r\n56\r\n', parts[2])
+
+    def testUnsatisfiableRange(self):
+        statusLine, fields, body = self.rangeGetter(b'bytes=20-')
+        self.assertEqual(statusLine, 'HTTP/1.1 416 Range Not Satisfiable')
+        self.assertEqual(fields['content-range'], 'bytes */10')
+        self.assertEqual(body, b'')
+
+    def testOldIfRangeGetsWholeFile(self):
+        statusLine, fields, body = self.rangeGetter(b'bytes=0-1', b'If-Range: "old"\r\n')
+        self.assertEqual(statusLine, 'HTTP/1.1 200 OK')
+        self.assertEqual(body, b'0123456789')
+
+# End of RangeTest
+
+
+
+# Beginning of ConditionalTest
+
+class ConditionalTest(WebserverTest):
+
+    """
+        Description:
+        Tests of requests with "If-None-Match" and "If-Modified-Since", answered with "304 Not Modified"
+        when the client already has the file. Every conditional request is followed by a plain one,
+        so a 304 that carried a body would break the response after it
+    """
+
+    def setUp(self):
+        super().setUp()
+        (_, fields, _), = self.responseSplitter(self.exchange(b'GET /index.html HTTP/1.1\r\nConnection: close\r\n\r\n'))
+        self.entityTag = fields['etag']
+        self.lastModified = fields['last-modified']
+
+    def conditionalGetter(self, conditionFields):
+        return self.exchange(b'GET /index.html HTTP/1.1\r\n' + conditionFields.encode() + b'\r\n\r\n'
+                             b'GET /index.html HTTP/1.1\r\nConnection: close\r\n\r\n')
+
+    def notModifiedChecker(self, conditionFields):
+        received = self.conditionalGetter(conditionFields)
+        conditional, plain = self.responseSplitter(received, bodiless = (0,))
+        self.assertEqual(conditional[0], 'HTTP/1.1 304 Not Modified')
+        self.assertEqual(conditional[1]['etag'], self.entityTag)
+        # Nothing follows the header of the 304, the next response starts right after it
+        self.assertTrue(received.split(b'\r\n\r\n', 1)[1].startswith(b'HTTP/1.1 200 OK'))
+        self.assertEqual(plain[2], b'hello\n')
+
+    def testMatchingEntityTag(self):
+        self.notModifiedChecker(f'If-None-Match: {self.entityTag}')
+
+    def testWeakAndListedEntityTags(self):
+        self.notModifiedChecker(f'If-None-Match: "other", W/{self.entityTag}')
+
+    def testNotModifiedSince(self):
+        self.notModifiedChecker(f'If-Modified-Since: {self.lastModified}')
+
+    def testOtherEntityTagWinsOverDate(self):
+        # "If-Modified-Since" is ignored when "If-None-Match" is sent, and the tag does not match
+        conditional, _ = self.responseSplitter(self.conditionalGetter(f'If-None-Match: "other"\r\n'
+                                                                      f'If-Modified-Since: {self.lastModified}'))
+        self.assertEqual(conditional[0], 'HTTP/1.1 200 OK')
+        self.assertEqual(conditional[2], b'hello\n')
+
+    def testModifiedSince(self):
+        # File changed after the date, it is sent again
+        conditional, _ = self.responseSplitter(self.conditionalGetter('If-Modified-Since: Thu, 01 Jan 2015 00:00:00 GMT'))
+        self.assertEqual(conditional[0], 'HTTP/1.1 200 OK')
+        self.assertEqual(conditional[2], b'hello\n')
+
+# End of ConditionalTest
+
+
+
+# Beginning of CompressionTest
+
+class CompressionTest(WebserverTest):
+
+    """
+        Description:
+        Tests of text files being sent compressed, also when the file cache is turned off
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.fileWriter('page.html', b'<p>hello</p>\n' * 200)
+
+    def compressedGetter(self):
+        received = self.exchange(b'GET /page.html HTTP/1.1\r\nAccept-Encoding: gzip\r\nConnection: close\r\n\r\n')
+        (statusLine, fields, body), = self.responseSplitter(received)
+        self.assertEqual(statusLine, 'HTTP/1.1 200 OK')
+        self.assertEqual(fields.get('content-encoding'), 'gzip')
+        self.assertEqual(zlib.decompress(body, 31), b'<p>hello</p>\n' * 200)
+
+    def testCachedFileIsCompressed(self):
+        self.compressedGetter()
+
+    def testUncachedFileIsCompressed(self):
+        maxBytes = webserver.fileCache.maxBytes
+        webserver.fileCache.maxBytes = 0
+        self.addCleanup(setattr, webserver.fileCache, 'maxBytes', maxBytes)
+        self.compressedGetter()
+        self.assertNotIn(os.path.join(self.root.name, 'page.html'), webserver.fileCache.entries)
+
+# End of CompressionTest
+
+
+
+if __name__ == '__main__':  # runs the tests
+    unittest.main()
@@ -1,5 +1,125 @@
 
 from socket import *    # imported for socket programming
+import os               # imported so size of streamed files can be found
+import mmap             # imported so ranges of large files can be sent without reading the file
+import zlib             # imported so files can be compressed with gzip or deflate
+import time             # imported so requests can be timed
+from email.utils import formatdate, parsedate_to_datetime    # imported so HTTP dates can be written and read
+from filecache import FileCache     # imported so requested files are kept in memory
+from docroot import DocumentIndex   # imported so requested files are found without touching the disk
+from httpparser import HttpRequest, HttpRequestParser, HttpParseError     # imported so request messages are parsed from bytes
+from metrics import MetricsRegistry # imported so requests, connections and cache use can be counted
+from profiling import RequestProfiler   # imported so requests can be timed in phases and profiled
+from accesslog import AccessLog     # imported so requests and status messages are logged without blocking
+from streaming import ResponseStream    # imported so response bodies can be sent as they are produced
+import select           # imported so a client closing its connection can be noticed while a body is streamed
+
+
+# Requested files are cached in memory, 64 MB at most, and checked against the disk at most once a second
+# Files of 1 MB or more are not read into memory, they are streamed from disk with sendfile
+fileCache = FileCache(maxBytes = 64 * 1024 * 1024, checkInterval = 1, streamThreshold = 1024 * 1024)
+
+# Every file the server can send, by URL path, rescanned every 5 seconds for files added, removed or renamed
+# Scanned when server starts, and 4096 paths that were not found at most are remembered until a change is found
+documentIndex = DocumentIndex(rescanInterval = 5, maxMisses = 4096)
+
+# Metrics of requests, connections and the file cache, made before worker processes are forked so they share it
+metrics = MetricsRegistry()
+metrics.callback('webserver_cache_hits_total', 'counter', 'Requests served from the file cache.',
+                 lambda: fileCache.hits)
+metrics.callback('webserver_cache_misses_total', 'counter', 'Requests that read a file from disk into the cache.',
+                 lambda: fileCache.misses)
+metrics.callback('webserver_cache_evictions_total', 'counter', 'Files removed from the cache to stay within its budget.',
+                 lambda: fileCache.evictions)
+metrics.callback('webserver_cache_bytes', 'gauge', 'Bytes of files kept in the cache.',
+                 lambda: fileCache.bytes)
+metrics.callback('webserver_cache_hit_ratio', 'gauge', 'Share of cached requests served from memory.',
+                 lambda: round(fileCache.hits / max(fileCache.hits + fileCache.misses, 1), 4))
+metrics.callback('webserver_documents', 'gauge', 'Files in the document index.',
+                 lambda: len(documentIndex.documents))
+metrics.callback('webserver_not_found_total', 'counter', 'Requests for files not in the document index.',
+                 lambda: documentIndex.notFound)
+
+# Access log and status messages, written to stdout in batches by a background thread
+# Made before worker processes are forked, every process starts its own writer thread
+accessLog = AccessLog()
+
+# Phase timing and profiling of requests, both off until turned on with an argument or a signal
+requestProfiler = RequestProfiler(log = accessLog.info)
+
+# Reserved path answered with the metrics in Prometheus text format, instead of a file
+metricsPath = '/metrics'
+
+# Methods the server answers, HEAD is answered like GET without the body. Other methods get 405 Method Not Allowed
+allowedMethods = ('GET', 'HEAD')
+
+# Paths answered with a streamed body instead of a file, path mapped to a function taking the HTTP request message
+# and returning (status, headerFields, chunks), where chunks is an iterator of bytes, usually a generator
+streamHandlers = {}
+
+# Size of the pieces large files are read and compressed in when they are streamed compressed
+streamChunkSize = 64 * 1024
+
+# Most ranges one request may ask for, requests asking for more get the whole file instead
+maxRanges = 16
+
+# Separates the parts of a response with several ranges, written once since it only needs to be unlikely in data
+rangeBoundary = os.urandom(12).hex()
+
+# Encodings files can be compressed with, in order of preference
+contentEncodings = ['gzip', 'deflate']
+
+# Files smaller than this are sent as they are, compressing them saves too little to be worth it
+compressionMinSize = 1024
+
+# Types of files that are compressed, other types like images and archives are compressed already
+compressibleTypes = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+# Tells browsers and caches how long files may be used without asking the server, None leaves the field out
+# "no-cache" makes them ask every time, which is cheap since unchanged files are answered with 304 Not Modified
+cacheControl = 'no-cache'
+
+# Persistent connections are closed after this many seconds without a request, so idle clients do not hold on to them
+keepAliveTimeout = 5
+
+# Persistent connections are closed after this many requests, so one client can not keep a connection forever
+keepAliveMaxRequests = 100
+
+# A request must be received completely within this many seconds of its first bytes, or it is answered with
+# 408 Request Timeout, so a client sending a byte at a time can not hold a connection
+requestTimeout = 10
+
+# Largest header and most header fields of a request, larger headers are answered with 431 Request Header Fields Too Large
+maxHeaderBytes = 16 * 1024
+maxHeaderFields = 100
+
+# Largest request body, larger bodies are answered with 413 Content Too Large instead of being received and skipped
+maxBodyBytes = 1024 * 1024
+
+# Slowest a client may receive a response, in bytes per second after the first sendGrace seconds
+# Connection of a client receiving slower is closed, so it can not hold a thread. 0 turns it off
+minSendRate = 1024
+sendGrace = 5
+
+# Most bytes of a file sent with one sendfile() call, so the send rate is checked while large files are sent
+sendBlockSize = 1024 * 1024
+
+# Most buffers handed to one sendmsg() call, the kernel refuses more than IOV_MAX of them
+maxSendBuffers = 1024
+
+# Pieces of headers that are the same in many responses, encoded once instead of for every response
+# Status lines and fields are added when they are first written, fields only if their value is in staticValues
+statusLines = {}
+staticFields = {
+    ('Connection', 'keep-alive'): b'Connection: keep-alive\r\n',
+    ('Connection', 'close'): b'Connection: close\r\n',
+    ('Content-Type', 'text/html; charset=UTF-8'): b'Content-Type: text/html; charset=UTF-8\r\n'
+}
+# Fields whose values repeat between responses, like "Accept-Ranges: bytes". Other fields, like "ETag", are encoded every time
+staticNames = frozenset(['Connection', 'Content-Type', 'Content-Encoding', 'Transfer-Encoding', 'Accept-Ranges',
+                         'Vary', 'Cache-Control', 'Retry-After'])
+# Most fields kept in staticFields, so odd values can not make it grow without end
+maxStaticFields = 1024
 
 
 # Beginning of main()
@@ -11,6 +131,13 @@ def main():
         The main method. It runs serverHandler() function with self defined arguments 
     """
   
+    # Phase timing and profiling can be turned on and off with SIGUSR2 and SIGUSR1 while server runs
+    requestProfiler.signalInstaller()
+
+    # Served directory is indexed once here, and rescanned for changes while server runs
+    documentIndex.scan()
+    accessLog.info('Indexed %s files in %s', len(documentIndex.documents), documentIndex.root)
+
     # Runs serverHandler with defined port number and IP address
     serverIP = '127.0.0.1'
     serverPort = 6969
@@ -47,8 +174,8 @@ def serverHandler(serverIP, serverPort):
 
     # ServerSocket will only handle one connection at a time
     serverSocket.listen(1)
-    # Status message for console 
-    print(f'Server is ready to receive on port {serverPort}...')
+    # Status message for log
+    accessLog.info('Server is ready to receive on port %s...', serverPort)
 
 
     # Will attempt to establish connection with client
@@ -59,30 +186,37 @@ def serverHandler(serverIP, serverPort):
             # Accepts connection from a client by creating a socket for this connection
             # Also saves client IP and port number
             connectionSocket, clientAddress = serverSocket.accept()
-            # Status message for console
-            print(f'Connection established with {clientAddress[0]} on client port {clientAddress[1]}')
+            metrics.connectionOpened()
+            # Status message for log
+            accessLog.debug('Connection established with %s on client port %s', clientAddress[0], clientAddress[1])
 
 
             # Runs connectionHandler() function with serverSocket as parameter
-            connectionHandler(connectionSocket) 
+            try:
+                connectionHandler(connectionSocket, clientAddress)
+            finally:
+                metrics.connectionClosed()
 
 
     # In case of user interrupting server, infinite loop is exited
     except KeyboardInterrupt:
-        # Status message for console
-        print('Received order to close server')
+        # Status message for log
+        accessLog.info('Received order to close server')
 
 
     # In case of Exception being raised, infinite loop is exited
     except Exception:
-        # Status message for console
-        print('Internal error, closing server')
+        # Status message for log
+        accessLog.error('Internal error, closing server')
 
 
     # Always executed after infinite loop is exited
     finally:
-        # Status message for console 
-        print(f'Closing server socket on port {serverPort}...')
+        # Status message for log, queued records are written before server exits
+        accessLog.info('Closing server socket on port %s...', serverPort)
+        accessLog.info('File cache: %s', fileCache.stats())
+        accessLog.info('Document index: %s', documentIndex.stats())
+        accessLog.close()
         # Closes connectionSocket and serverSocket
         connectionSocket.close()
         serverSocket.close()
@@ -93,7 +227,7 @@ def serverHandler(serverIP, serverPort):
 
 # Beginning of connectionHandler()
 
-def connectionHandler(connectionSocket):
+def connectionHandler(connectionSocket, clientAddress = None):
 
     """
         Description:
@@ -106,63 +240,165 @@ def connectionHandler(connectionSocket):
 
         If index.html is requested, said file is sent in an HTTP response message with "200 OK" as status
         If unknown file is requested, an HTTP response message with "404 Not Found" as status is sent
+        If request message is malformed, an HTTP response message with "400 Bad Request" as status is sent
+        and connection is closed
         If an exception occurs, an HTTP response message with "500 Internal Server Error" as status is sent
 
-        Argument:
+        Received bytes are fed to an HttpRequestParser, so request messages split over several
+        recv() calls, and several request messages received at once, are answered one by one in order
+
+        Connection is kept open between requests, as HTTP/1.1 does by default. It is closed after a response
+        with "Connection: close", after keepAliveMaxRequests requests, or when client has been idle
+        for keepAliveTimeout seconds, so an idle client never holds the thread handling it
+
+        Slow clients are not let hold the thread either. A request must arrive completely within requestTimeout
+        seconds of its first bytes, or it is answered with "408 Request Timeout". Headers larger than maxHeaderBytes
+        or with more than maxHeaderFields fields get "431 Request Header Fields Too Large", bodies larger than
+        maxBodyBytes get "413 Content Too Large". A client receiving a response slower than minSendRate is cut off
+
+        Every answered request is written to the access log. Status messages of the connection are debug messages,
+        they are thrown away without being formatted unless log level is debug
+
+        Arguments:
         connectionSocket: A TCP socket with IPv4 as underlying network, connected to a client
+        clientAddress:    (IP-address, port) of the client, asked from the socket if not given
     """
     
 
+    # Client IP and port number, written in the access log
+    if clientAddress is None:
+        try:
+            clientAddress = connectionSocket.getpeername()
+        except OSError:
+            clientAddress = ('-', 0)
+
+    # Parses request messages out of received bytes
+    parser = HttpRequestParser(maxHeaderBytes, maxHeaderFields, maxBodyBytes)
+    # Requests answered on this connection so far
+    requestsServed = 0
+
+    # Time the first bytes of the next request arrived, for phase timing
+    receivedAt = time.perf_counter_ns()
+    # Time from time.monotonic() the next request must have been received completely by
+    requestDeadline = time.monotonic() + requestTimeout
+
     while True:     # Infinite loop to ensure files can be requested several times
         
         # Responds to HTTP GET requests if possible.  
-        # Sends HTTP response with "200 OK" as status and file as data to client
+        # Sends HTTP response with "200 OK" or "404 Not Found" as status to client
+        httpRequestMessage = trace = None
         try: 
 
-            # Waits for client to send HTTP GET request
-            httpRequestMessage = connectionSocket.recv(1024).decode()
+            # Next request message that has been received completely
+            parseStart = time.perf_counter_ns()
+            httpRequestMessage = parser.next()
+
+            # No complete request message yet, waits for client to send more
+            if httpRequestMessage is None:
+                waiting = not parser.pending()      # No bytes of the next request have arrived yet
+
+                # recv() gives up when client has been idle for too long, or when a request it has started is late
+                try:
+                    connectionSocket.settimeout(keepAliveTimeout if waiting else httpTimeoutFinder(requestDeadline))
+                    received = connectionSocket.recv(65536)
+                except TimeoutError:
+                    if waiting:
+                        raise
+                    raise HttpParseError('408 Request Timeout', f'request was not received within {requestTimeout} seconds')
+
+                if waiting:
+                    receivedAt = time.perf_counter_ns()
+                    requestDeadline = time.monotonic() + requestTimeout
+
+                # Handles connectionSocket.recv() returning blank
+                if not received:
+
+                    # Status message for log
+                    accessLog.debug('Client has closed connection, closing connection socket...')
+                    # Closes connection and breaks the infinite loop
+                    connectionSocket.close()
+                    break
+
+                parser.feed(received)
+                continue
             
-            # Handles connectionSocket.recv() returning blank
-            if not httpRequestMessage:
-
-                # Status message for console
-                print("Client has closed connection, closing connection socket...")
-                # Closes connection and breaks the infinite loop
+            # Request is timed from when it has been received completely
+            requestStart = time.perf_counter()
+            # Phases of the request are timed if phase timing or profiling is on, None otherwise
+            trace = requestProfiler.start(receivedAt, parseStart)
+            
+            # Writes HTTP response message for the requested file, status is either 200 OK or 404 Not Found
+            status, connection, httpResponseParts = httpResponseBuilder(httpRequestMessage, requestsServed, trace)
+            requestsServed += 1
+
+
+            # Sends HTTP response to client, streamed bodies are counted after they are sent
+            httpResponseSender(connectionSocket, httpResponseParts)
+            sentBytes = httpResponseLength(httpResponseParts)
+            requestDuration = time.perf_counter() - requestStart
+            metrics.requestRecorder(status, requestDuration, sentBytes)
+            accessLog.access(clientAddress, httpRequestMessage, status, sentBytes, requestDuration)
+            requestProfiler.finish(trace, status, httpRequestMessage.target)
+            # Next request may already have been received along with this one
+            receivedAt = time.perf_counter_ns()
+            requestDeadline = time.monotonic() + requestTimeout
+
+            # Connection is closed after response if client asked for it, or it has served enough requests
+            if connection == 'close':
+                # Status message for log
+                accessLog.debug('Connection is not kept alive, closing connection socket...')
                 connectionSocket.close()
                 break
-            
-            # Status message for console
-            print("Message received")
-            
-            # Attempts to retreive data from requested file, 
-            # and then write HTTP response message with status of 200 OK
-            data = httpGETData(httpRequestMessage)                              # Data from requested file
-            connection = httpConnectionStatus(httpRequestMessage)               # Connection status from HTTP request message
-            status = "200 OK"                                                   # HTTP status
-            httpResponseMessage = httpResponseWriter(status, connection, data)  # HTTP response message
 
 
-            # Sends HTTP response to client
-            connectionSocket.send(httpResponseMessage.encode())
-            # Status message for console
-            print('Requested file sent')
+        # Handles client being idle for too long, or receiving a response too slowly
+        # Connection is closed without a response
+        except TimeoutError as error:
 
+            # Status message for log
+            accessLog.debug('Client has been idle for %s seconds or received too slowly (%s), closing connection socket...',
+                            keepAliveTimeout, error)
+            # Profiling of a request that timed out while it was sent is stopped, so the thread is not profiled any longer
+            if trace is not None and trace.profile is not None:
+                trace.profile.disable()
+            # Closes connection and breaks the infinite loop
+            connectionSocket.close()
+            break
 
-        # Handles exception if other file than index.html is being requested
-        # Sends HTTP response with "404 Not Found" as status to client
-        except FileNotFoundError:
 
-            # writes HTTP response message with "404 Not Found" as status
-            status = '404 Not Found'                                            # HTTP status
-            connection = httpConnectionStatus(httpRequestMessage)               # Connection status from HTTP request message
-            data = '<h1>File not found<h1>'                                     # Very simple HTML data
-            httpResponseMessage = httpResponseWriter(status, connection, data)  # HTTP response message
-            
+        # Handles client going away while a response is sent, like in the middle of a streamed body
+        # Nothing more can be sent, connection is closed without a response
+        except ConnectionError as error:
 
-            # Sends HTTP response to client
-            connectionSocket.send(httpResponseMessage.encode())
-            # Status message for console
-            print('Requested file not found, appropriate response message sent')
+            # Status message for log
+            accessLog.debug('Client went away while response was sent: %s, closing connection socket...', error)
+            if trace is not None and trace.profile is not None:
+                trace.profile.disable()
+            # Closes connection and breaks the infinite loop
+            connectionSocket.close()
+            break
+
+
+        # Handles malformed request message
+        # Sends HTTP response with status from the parser, like "400 Bad Request", and closes connection
+        except HttpParseError as error:
+
+            # Sends HTTP response to client, a slow client that does not take it within sendGrace seconds misses it
+            httpResponseMessage = httpResponseWriter(error.status, 'close', f'<h1>{error.status}<h1>')
+            try:
+                connectionSocket.settimeout(sendGrace)
+                connectionSocket.sendall(httpResponseMessage)
+            except OSError:
+                pass
+            metrics.requestRecorder(error.status, 0, len(httpResponseMessage))
+            accessLog.access(clientAddress, None, error.status, len(httpResponseMessage), 0)
+
+            # Error and status message for log
+            accessLog.warning('Malformed or too slow request message from %s: %s, appropriate response message sent, '
+                              'closing connection socket...', clientAddress[0], error)
+            # Closes connection and breaks the infinite loop
+            connectionSocket.close()
+            break
 
         
         # Handles any other exception
@@ -177,11 +413,16 @@ def connectionHandler(connectionSocket):
             
 
             # Sends HTTP response to client
-            connectionSocket.send(httpResponseMessage.encode())
-
-            # Error and status message for console
-            print(f'An error has occured: {error}\n' \
-                  'appropriate response message sent, closing connection socket...')          
+            connectionSocket.sendall(httpResponseMessage)
+            metrics.requestRecorder(status, 0, len(httpResponseMessage))
+            # Profiling of the failed request is stopped, so the thread is not profiled any longer
+            if trace is not None:
+                requestProfiler.finish(trace, status, httpRequestMessage.target)
+            accessLog.access(clientAddress, httpRequestMessage, status, len(httpResponseMessage), 0)
+
+            # Error and status message for log
+            accessLog.error('An error has occured: %s, appropriate response message sent, closing connection socket...',
+                            error)          
             # Closes connection and raises Exception
             connectionSocket.close()
             raise Exception()
@@ -190,114 +431,1123 @@ def connectionHandler(connectionSocket):
 
 
 
+# Beginning of httpResponseBuilder()
+
+def httpResponseBuilder(httpRequestMessage, requestsServed = 0, trace = None):
+
+    """
+        Description:
+        Writes the HTTP response message for an HTTP GET request message.
+        Shared by every server mode, so they all answer requests the same way
+
+        If requested file exists, it is sent with "200 OK" as status
+        If requested file does not exist, a response with "404 Not Found" as status is written
+        If ranges of the file are requested, they are sent with "206 Partial Content" as status,
+        or a response with "416 Range Not Satisfiable" is written if none of them are in the file
+        If client accepts compressed data, compressible files are sent compressed with gzip or deflate
+        If metricsPath is requested, the server's metrics are sent instead of a file
+        If client's copy of the file is still the same, a response with "304 Not Modified" as status
+        and no file is written, files are sent with "ETag" and "Last-Modified" fields so client can ask
+        HEAD requests get the same header as GET requests, without the body
+        Requests with a method not in allowedMethods get "405 Method Not Allowed", with an "Allow" field
+        Any other exception is raised for the caller to handle
+
+        Response message is returned as a list of parts that are sent one after another.
+        A part is either bytes or a memoryview, or for large files, a tuple (file, offset, count)
+        telling that count bytes from offset in an open file are sent with sendfile.
+        Files in the parts must be closed by the caller after sending, httpResponseSender() does that
+
+        If request is traced, the disk and build phases are timed, and phases so far are sent in a "Server-Timing" field
+
+        Arguments:
+        httpRequestMessage: An HTTP GET request message asking for specific file, parsed by HttpRequestParser
+        requestsServed:     Requests answered on the connection before this one
+        trace:              RequestTrace of the request from requestProfiler, None if it is not traced
+
+        Returns:
+        status:            HTTP status of the response message
+        connection:        Either "keep-alive" or "close", telling if connection is closed after the response
+        httpResponseParts: HTTP response message as a list of parts
+    """
+
+
+    # Methods the server does not answer are refused before anything is looked up
+    # Body of the request has been skipped by the parser, so the connection can be kept open
+    if httpRequestMessage.method not in allowedMethods:
+        status = '405 Method Not Allowed'
+        connection = httpConnectionStatus(httpRequestMessage, requestsServed)
+        headerFields = {'Allow': ', '.join(allowedMethods)}
+        httpTimingField(trace, headerFields)
+        return status, connection, [httpResponseWriter(status, connection, f'<h1>{status}<h1>', headerFields)]
+
+    # HEAD is answered with the header a GET would get. Body is never sent, since client does not read it,
+    # and bytes of it would be taken as the start of the next response. Files and streams of the body are closed unsent
+    if httpRequestMessage.method == 'HEAD':
+        getRequestMessage = HttpRequest('GET', httpRequestMessage.target, httpRequestMessage.version,
+                                        httpRequestMessage.headers)
+        status, connection, httpResponseParts = httpResponseBuilder(getRequestMessage, requestsServed, trace)
+        httpResponseCloser(httpResponseParts[1:])
+        return status, connection, httpResponseParts[:1]
+
+
+    # Reserved path is answered with the server's metrics
+    if httpRequestMessage.target == metricsPath:
+        return httpMetricsBuilder(httpRequestMessage, requestsServed)
+
+    # Paths with a stream handler are answered with the body it produces
+    streamHandler = streamHandlers.get(httpRequestMessage.target)
+    if streamHandler is not None:
+        status, headerFields, chunks = streamHandler(httpRequestMessage)
+        httpTimingField(trace, headerFields)
+        return httpStreamBuilder(httpRequestMessage, requestsServed, status, headerFields, chunks)
+
+
+    # Attempts to retreive data from requested file, status is 200 OK
+    try:
+        requestedFile = httpRequestedFile(httpRequestMessage)               # Requested file from the document index
+        data, modified = httpGETData(requestedFile)                         # Data and modification time of requested file
+        status = '200 OK'                                                   # HTTP status
+
+    # Requested file does not exist, status is 404 Not Found
+    except FileNotFoundError:
+        data = b'<h1>File not found<h1>'                                    # Very simple HTML data
+        status = '404 Not Found'                                            # HTTP status
+
+    # Finding and reading the file is the disk phase
+    if trace is not None:
+        trace.mark('disk')
+
+
+    connection = httpConnectionStatus(httpRequestMessage, requestsServed)   # Connection status from HTTP request message
+    headerFields = {}                                                       # Header fields besides the standard ones
+
+    # Tells client how long and for how many more requests the connection is kept open
+    if connection == 'keep-alive':
+        headerFields['Keep-Alive'] = f'timeout={keepAliveTimeout}, max={keepAliveMaxRequests - requestsServed - 1}'
+
+    # Type of the file as the document index found it when the file was indexed
+    if status == '200 OK':
+        headerFields['Content-Type'] = requestedFile.contentType
+
+    # Size of requested file before it is compressed, entity tag is made from it
+    identityLength = len(data) if isinstance(data, bytes) else os.fstat(data.fileno()).st_size
+
+
+    # Compressible file in memory is sent compressed if client accepts it
+    # Compressed data is made once per version of the file and cached along with it, or for every request if file is not cached
+    if status == '200 OK' and isinstance(data, bytes):
+        if len(data) >= compressionMinSize and httpCompressible(requestedFile):
+            # Response depends on "Accept-Encoding" field, caches must keep one copy per encoding
+            headerFields['Vary'] = 'Accept-Encoding'
+
+            encoding = httpEncodingNegotiator(httpRequestMessage)
+            encodedData = fileCache.variant(requestedFile.path, data, encoding, httpContentEncoder) if encoding else None
+            if encodedData is not None:
+                data = encodedData
+                headerFields['Content-Encoding'] = encoding
+
+    # Compressible large file is compressed while it is streamed, its compressed length is not known up front
+    elif status == '200 OK' and httpCompressible(requestedFile):
+        headerFields['Vary'] = 'Accept-Encoding'
+
+        encoding = httpEncodingNegotiator(httpRequestMessage)
+        if encoding:
+            headerFields['Content-Encoding'] = encoding
+
+
+    # Size of data in bytes, large file is an open file
+    if isinstance(data, bytes):
+        contentLength = len(data)
+    else:
+        contentLength = os.fstat(data.fileno()).st_size
+
+
+    # Large file that is compressed while it is streamed, ranges of it can not be sent
+    streamed = status == '200 OK' and not isinstance(data, bytes) and 'Content-Encoding' in headerFields
+
+    # Files tell client that ranges of them can be requested, and send requested ranges only
+    if status == '200 OK':
+        headerFields['Accept-Ranges'] = 'none' if streamed else 'bytes'
+
+        # Validators let client ask if its copy of the file is still the same
+        # Every encoding of a file is a different copy, so encoding is part of the entity tag
+        entityTag = httpEntityTagWriter(identityLength, modified, headerFields.get('Content-Encoding'))
+        headerFields['ETag'] = entityTag
+        headerFields['Last-Modified'] = httpDateWriter(modified)
+        if cacheControl is not None:
+            headerFields['Cache-Control'] = cacheControl
+
+        # Client's copy is still the same, only the header is sent
+        if httpNotModified(httpRequestMessage, entityTag, modified):
+            if not isinstance(data, bytes):
+                data.close()
+            status = '304 Not Modified'
+            httpTimingField(trace, headerFields)
+            return status, connection, [httpHeaderWriter(status, connection, contentLength, headerFields)]
+
+        # Large file is compressed while it is streamed, "Range" field is ignored and the whole file is sent
+        if streamed:
+            httpTimingField(trace, headerFields)
+            return httpStreamBuilder(httpRequestMessage, requestsServed, status, headerFields,
+                                     httpCompressedChunks(data, headerFields['Content-Encoding']))
+
+        # Ranges asked for in HTTP request message, None if whole file should be sent
+        ranges = httpRangeParser(httpRequestMessage, contentLength, modified, entityTag)
+        if ranges is not None:
+            httpTimingField(trace, headerFields)
+            return httpRangeBuilder(connection, data, contentLength, ranges, headerFields)
+
+
+    httpTimingField(trace, headerFields)
+
+    # Small file is in memory, header and data are separate parts that are sent together, data is never copied
+    if isinstance(data, bytes):
+        httpResponseParts = [httpHeaderWriter(status, connection, len(data), headerFields), data]
+
+    # Large file is an open file, only header is written and file is streamed after it
+    else:
+        httpResponseParts = [httpHeaderWriter(status, connection, contentLength, headerFields), (data, 0, contentLength)]
+
+    return status, connection, httpResponseParts
+
+# End of httpResponseBuilder()
+
+
+
+# Beginning of httpTimingField()
+
+def httpTimingField(trace, headerFields):
+
+    """
+        Description:
+        Ends the build phase of a traced request, and adds its phases so far to the header as a "Server-Timing" field
+        Browsers show the field in their developer tools. Does nothing if request is not traced
+
+        Arguments:
+        trace:        RequestTrace of the request, None if it is not traced
+        headerFields: Header fields besides the standard ones, the field is added to it
+    """
+
+    if trace is not None:
+        trace.mark('build')
+        if requestProfiler.timing:
+            headerFields['Server-Timing'] = trace.header()
+
+# End of httpTimingField()
+
+
+
+# Beginning of httpStreamBuilder()
+
+def httpStreamBuilder(httpRequestMessage, requestsServed, status, headerFields, chunks):
+
+    """
+        Description:
+        Writes an HTTP response message whose body is streamed from an iterator of chunks as they are produced
+        HTTP/1.1 clients get the body with chunked transfer-encoding, so the connection can be kept open after it.
+        HTTP/1.0 clients do not know chunked transfer-encoding, they get the chunks as they are
+        and the connection is closed to end the body
+        Fields named in a "Trailer" field in headerFields can be sent after the body, by a generator returning them
+
+        Arguments:
+        httpRequestMessage: The HTTP request message being answered, parsed by HttpRequestParser
+        requestsServed:     Requests answered on the connection before this one
+        status:             HTTP status of the response message
+        headerFields:       Header fields besides the standard ones, like "Content-Type"
+        chunks:             Iterator of chunks in the form of bytes, usually a generator
+
+        Returns:
+        status:            HTTP status of the response message
+        connection:        Either "keep-alive" or "close", telling if connection is closed after the response
+        httpResponseParts: Header in the form of bytes, followed by a ResponseStream of the body
+    """
+
+
+    connection = httpConnectionStatus(httpRequestMessage, requestsServed)   # Connection status from HTTP request message
+    chunked = httpRequestMessage.version != 'HTTP/1.0'
+
+    # Without chunked transfer-encoding, only closing the connection tells where the body ends
+    if chunked:
+        headerFields['Transfer-Encoding'] = 'chunked'
+    else:
+        connection = 'close'
+
+    # Tells client how long and for how many more requests the connection is kept open
+    if connection == 'keep-alive':
+        headerFields['Keep-Alive'] = f'timeout={keepAliveTimeout}, max={keepAliveMaxRequests - requestsServed - 1}'
+
+    return status, connection, [httpHeaderWriter(status, connection, None, headerFields), ResponseStream(chunks, chunked)]
+
+# End of httpStreamBuilder()
+
+
+
+# Beginning of httpCompressedChunks()
+
+def httpCompressedChunks(responseFile, encoding):
+
+    """
+        Description:
+        Generator that reads a large file a piece at a time and compresses it with gzip or deflate,
+        so a compressed file is sent without the whole file or its compressed data ever being in memory
+        File is closed when generator is done or closed, also if client goes away before the end
+
+        Arguments:
+        responseFile: Open file, read from its start
+        encoding:     "gzip" or "deflate"
+
+        Yields:
+        chunk: Compressed data in the form of bytes, may be empty when compressor holds data back
+    """
+
+
+    # Compresses with zlib, gzip format has its own header and deflate is zlib's format in HTTP
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31 if encoding == 'gzip' else 15)
+
+    try:
+        while True:
+            data = responseFile.read(streamChunkSize)
+            if not data:
+                break
+            yield compressor.compress(data)
+
+        yield compressor.flush()
+
+    # Always executed, also if generator is closed early
+    finally:
+        responseFile.close()
+
+# End of httpCompressedChunks()
+
+
+
+# Beginning of httpMetricsBuilder()
+
+def httpMetricsBuilder(httpRequestMessage, requestsServed = 0):
+
+    """
+        Description:
+        Writes HTTP response message with the server's metrics in Prometheus text format, with "200 OK" as status
+        Metrics change all the time, so caches are told not to keep them
+
+        Arguments:
+        httpRequestMessage: An HTTP GET request message for metricsPath
+        requestsServed:     Requests answered on the connection before this one
+
+        Returns:
+        status:            HTTP status of the response message
+        connection:        Either "keep-alive" or "close", telling if connection is closed after the response
+        httpResponseParts: HTTP response message as a list of parts
+    """
+
+
+    status = '200 OK'
+    connection = httpConnectionStatus(httpRequestMessage, requestsServed)
+    headerFields = {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8', 'Cache-Control': 'no-store'}
+
+    # Tells client how long and for how many more requests the connection is kept open
+    if connection == 'keep-alive':
+        headerFields['Keep-Alive'] = f'timeout={keepAliveTimeout}, max={keepAliveMaxRequests - requestsServed - 1}'
+
+    exposition = metrics.exposition().encode()
+    return status, connection, [httpHeaderWriter(status, connection, len(exposition), headerFields), exposition]
+
+# End of httpMetricsBuilder()
+
+
+
+# Beginning of httpResponseLength()
+
+def httpResponseLength(httpResponseParts):
+
+    """
+        Description:
+        Counts bytes of an HTTP response message written by httpResponseBuilder(), without reading any file
+
+        Argument:
+        httpResponseParts: HTTP response message as a list of parts
+
+        Returns:
+        length: Bytes of the response message, streamed bodies count the bytes produced so far
+    """
+
+    return sum(part[2] if isinstance(part, tuple) else part.sent if isinstance(part, ResponseStream) else len(part)
+               for part in httpResponseParts)
+
+# End of httpResponseLength()
+
+
+
+# Beginning of httpRangeParser()
+
+def httpRangeParser(httpRequestMessage, contentLength, modified, entityTag):
+
+    """
+        Description:
+        Finds the byte ranges asked for in the "Range" field of an HTTP request message
+        Ranges can be written as "start-end", "start-" (to end of file) or "-count" (last count bytes),
+        several ranges are seperated by commas: "Range: bytes=0-99,200-,-50"
+
+        Range is ignored, and the whole file sent, if:
+        the field is missing or can not be understood, it asks for more than maxRanges ranges,
+        or the "If-Range" field has an entity tag or date that does not match the file, meaning client's copy is old
+
+        Arguments:
+        httpRequestMessage: An HTTP GET request message
+        contentLength:      Size of requested file in bytes
+        modified:           Modification time of requested file in seconds since epoch
+        entityTag:          Entity tag of the file as it is sent
+
+        Returns:
+        ranges: List of (start, end) tuples, end included, in the order they were asked for.
+                Empty list if no range is inside the file. None if whole file should be sent
+    """
+
+
+    # Field asking for ranges
+    rangeField = httpHeaderValue(httpRequestMessage, 'Range')
+    if rangeField is None:
+        return None
+
+    # Client only wants ranges if its copy of the file is still the same, otherwise it wants the whole file
+    # Entity tags must match exactly here, weak tags never match, since ranges of two copies can not be mixed
+    ifRangeField = httpHeaderValue(httpRequestMessage, 'If-Range')
+    if ifRangeField is not None:
+        if ifRangeField.startswith('"') or ifRangeField.startswith('W/'):
+            if ifRangeField != entityTag:
+                return None
+        elif ifRangeField != httpDateWriter(modified):
+            return None
+
+    # Only bytes are understood as unit
+    unit, _, rangeSpecifiers = rangeField.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+
+    # Too many ranges make the response larger than the file, whole file is sent instead
+    rangeSpecifiers = rangeSpecifiers.split(',')
+    if len(rangeSpecifiers) > maxRanges:
+        return None
+
+
+    ranges = []
+    for rangeSpecifier in rangeSpecifiers:
+
+        # Every range is written as first and last byte seperated by "-", either can be left out
+        first, dash, last = rangeSpecifier.partition('-')
+        first, last = first.strip(), last.strip()
+        # Only ASCII digits are numbers, isdigit() alone also accepts characters like "²", which int() refuses
+        if not dash or not ((first + last).isascii() and (first + last).isdigit()):
+            return None
+
+        # "-count" asks for the last count bytes
+        if not first:
+            start = max(contentLength - int(last), 0)
+            end = contentLength - 1
+            if int(last) == 0:
+                continue
+
+        # "start-end" or "start-", end is cut to last byte in file
+        else:
+            start = int(first)
+            end = int(last) if last else contentLength - 1
+            if last and end < start:
+                return None
+            end = min(end, contentLength - 1)
+
+        # Range that starts after end of file can not be sent
+        if start < contentLength:
+            ranges.append((start, end))
+
+    return ranges
+
+# End of httpRangeParser()
+
+
+
+# Beginning of httpRangeBuilder()
+
+def httpRangeBuilder(connection, data, contentLength, ranges, headerFields):
+
+    """
+        Description:
+        Writes the HTTP response message for requested ranges of a file.
+        One range is sent with "206 Partial Content" as status and a "Content-Range" field,
+        several ranges are sent as parts of a "multipart/byteranges" message.
+        If no range is inside the file, "416 Range Not Satisfiable" is sent
+
+        Ranges are slices of a memoryview of the data, so they are never copied.
+        Large file is mapped into memory with mmap, only the pages that are sent are read from disk
+
+        Arguments:
+        connection:    Connection status from HTTP request message
+        data:          Data of requested file, bytes, or an open file that is closed by this function
+        contentLength: Size of requested file in bytes
+        ranges:        List of (start, end) tuples from httpRangeParser()
+        headerFields:  Dictionary of header fields of the whole file, like "Content-Encoding"
+
+        Returns:
+        status:            HTTP status of the response message
+        connection:        Connection status from HTTP request message
+        httpResponseParts: HTTP response message as a list of parts
+    """
+
+
+    # No range is inside the file, client is told the size of the file
+    if not ranges:
+        if not isinstance(data, bytes):
+            data.close()
+        status = '416 Range Not Satisfiable'
+        headerFields = {'Content-Range': f'bytes */{contentLength}'}
+        return status, connection, [httpResponseWriter(status, connection, b'', headerFields)]
+
+
+    # View of the data that can be sliced without copying
+    # Mapping stays valid after file is closed, and is unmapped when the last slice is gone
+    if isinstance(data, bytes):
+        view = memoryview(data)
+    else:
+        with data:
+            view = memoryview(mmap.mmap(data.fileno(), 0, access = mmap.ACCESS_READ))
+
+    status = '206 Partial Content'
+
+
+    # One range is sent as it is, with its place in the file in "Content-Range" field
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headerFields = {**headerFields, 'Content-Range': f'bytes {start}-{end}/{contentLength}'}
+        httpHeader = httpHeaderWriter(status, connection, end - start + 1, headerFields)
+        return status, connection, [httpHeader, view[start:end + 1]]
+
+
+    # Several ranges are sent as parts seperated by rangeBoundary, every part has its own header
+    httpResponseParts = []
+    for start, end in ranges:
+        partHeader = f'\r\n--{rangeBoundary}\r\n' \
+                     f'Content-Type: {headerFields.get("Content-Type", "application/octet-stream")}\r\n' \
+                     f'Content-Range: bytes {start}-{end}/{contentLength}\r\n' \
+                     '\r\n'
+        httpResponseParts.append(partHeader.encode())
+        httpResponseParts.append(view[start:end + 1])
+    httpResponseParts.append(f'\r\n--{rangeBoundary}--\r\n'.encode())
+
+    # Header of the whole message, Content-Length counts every part
+    headerFields = {**headerFields, 'Content-Type': f'multipart/byteranges; boundary={rangeBoundary}'}
+    httpHeader = httpHeaderWriter(status, connection, sum(len(part) for part in httpResponseParts), headerFields)
+
+    return status, connection, [httpHeader] + httpResponseParts
+
+# End of httpRangeBuilder()
+
+
+
+# Beginning of httpResponseSender()
+
+def httpResponseSender(connectionSocket, httpResponseParts):
+
+    """
+        Description:
+        Sends an HTTP response message written by httpResponseBuilder() through a blocking socket
+        Parts in a row that are bytes, like a header and the data after it, are sent together by httpVectorSender(),
+        without joining them. File parts are sent with sendfile(), so the kernel copies them
+        straight from disk to the socket and memory use stays the same no matter how large the file is
+        Streamed bodies are sent a chunk at a time as they are produced. Before a chunk is produced,
+        the socket is checked for the client having closed the connection, so producing stops early
+        Files and streams in the parts are always closed, also if sending fails
+
+        Client must receive the response at minSendRate bytes per second or faster, after the first sendGrace seconds.
+        Only time spent sending counts, time spent producing chunks of a streamed body is left out.
+        Before every send, socket is given a timeout of what is left of the time the bytes sent so far are allowed,
+        and TimeoutError is raised if client falls behind, so a client reading a byte at a time can not hold the thread
+
+        Arguments:
+        connectionSocket:  A TCP socket with IPv4 as underlying network, connected to a client
+        httpResponseParts: HTTP response message as a list of parts
+    """
+
+
+    # Time sending started and bytes handed to the socket so far, they give the time the next send must be done by
+    sendStart = time.monotonic()
+    sentBytes = 0
+
+    # Without a minimum rate, every send gives up after keepAliveTimeout seconds without progress
+    if not minSendRate:
+        connectionSocket.settimeout(keepAliveTimeout)
+
+    try:
+        buffers = []    # Parts in a row that are bytes, not sent yet
+
+        for part in httpResponseParts:
+
+            # Part is bytes, it is sent along with the bytes after it
+            if not isinstance(part, (tuple, ResponseStream)):
+                buffers.append(part)
+                continue
+
+            # Bytes before a file or a stream are sent first
+            if buffers:
+                sentBytes += sum(memoryview(buffer).nbytes for buffer in buffers)
+                httpVectorSender(connectionSocket, buffers, httpSendDeadline(sendStart, sentBytes))
+                buffers = []
+
+            # Part is a streamed body, chunks are sent as they are produced until it ends or client goes away
+            if isinstance(part, ResponseStream):
+                while True:
+                    if httpClientGone(connectionSocket):
+                        raise ConnectionResetError('client closed connection while body was streamed')
+                    # Time spent producing the chunk is server's, not client's, so it is left out of the rate
+                    produceStart = time.monotonic()
+                    frame = part.nextFrame()
+                    sendStart += time.monotonic() - produceStart
+                    if frame is None:
+                        break
+                    sentBytes += len(frame)
+                    httpVectorSender(connectionSocket, [frame], httpSendDeadline(sendStart, sentBytes))
+                continue
+
+            # Part is count bytes from offset in an open file, sent a block at a time so the rate is checked between blocks
+            responseFile, offset, count = part
+            for blockOffset in range(offset, offset + count, sendBlockSize):
+                blockCount = min(sendBlockSize, offset + count - blockOffset)
+                sentBytes += blockCount
+                deadline = httpSendDeadline(sendStart, sentBytes)
+                if deadline is not None:
+                    connectionSocket.settimeout(httpTimeoutFinder(deadline))
+                sent = connectionSocket.sendfile(responseFile, blockOffset, blockCount)
+
+                # File was shorter than promised in Content-Length, client can not trust the connection anymore
+                if sent != blockCount:
+                    raise ConnectionError('file changed while it was sent')
+
+        # Bytes at the end of the message, usually all of it
+        if buffers:
+            sentBytes += sum(memoryview(buffer).nbytes for buffer in buffers)
+            httpVectorSender(connectionSocket, buffers, httpSendDeadline(sendStart, sentBytes))
+
+    # Always executed, also if sending fails
+    finally:
+        httpResponseCloser(httpResponseParts)
+
+# End of httpResponseSender()
+
+
+
+# Beginning of httpVectorSender()
+
+def httpVectorSender(connectionSocket, buffers, deadline = None):
+
+    """
+        Description:
+        Sends several buffers through a blocking socket as if they were one, with as few system calls as possible
+        Buffers are handed to the kernel together with sendmsg() (writev), so they are never joined into one copy.
+        sendmsg() may send only some of the bytes, the rest is sent again from where it stopped,
+        a buffer that was partly sent is sliced with a memoryview, which does not copy it either
+
+        Arguments:
+        connectionSocket: A TCP socket with IPv4 as underlying network, connected to a client
+        buffers:          List of bytes-like objects, like bytes, memoryviews or mmaps, sent in order
+        deadline:         Time from time.monotonic() all buffers must be sent by, TimeoutError is raised after it.
+                          None keeps the timeout the socket has
+    """
+
+
+    # Systems without sendmsg(), like Windows, send the buffers one at a time
+    if not hasattr(connectionSocket, 'sendmsg'):
+        for buffer in buffers:
+            if deadline is not None:
+                connectionSocket.settimeout(httpTimeoutFinder(deadline))
+            connectionSocket.sendall(buffer)
+        return
+
+    # Empty buffers are left out, so a call that sends nothing means nothing was left
+    buffers = [buffer for buffer in buffers if len(buffer)]
+    first = 0           # Index of first buffer not sent completely
+
+    while first < len(buffers):
+        if deadline is not None:
+            connectionSocket.settimeout(httpTimeoutFinder(deadline))
+        sent = connectionSocket.sendmsg(buffers[first:first + maxSendBuffers])
+
+        # Skips buffers that were sent completely, what is left of a partly sent buffer is sent next time
+        while sent:
+            length = memoryview(buffers[first]).nbytes
+            if sent >= length:
+                sent -= length
+                first += 1
+            else:
+                buffers[first] = memoryview(buffers[first])[sent:]
+                sent = 0
+
+# End of httpVectorSender()
+
+
+
+# Beginning of httpSendDeadline()
+
+def httpSendDeadline(sendStart, sentBytes):
+
+    """
+        Description:
+        Finds the time a number of bytes of a response must have been sent by, at minSendRate after sendGrace seconds
+
+        Arguments:
+        sendStart: Time from time.monotonic() sending of the response started
+        sentBytes: Bytes of the response sent so far, including the ones about to be sent
+
+        Returns:
+        deadline: Time from time.monotonic(), None if minSendRate is 0
+    """
+
+    if not minSendRate:
+        return None
+
+    return sendStart + sendGrace + sentBytes / minSendRate
+
+# End of httpSendDeadline()
+
+
+
+# Beginning of httpTimeoutFinder()
+
+def httpTimeoutFinder(deadline):
+
+    """
+        Description:
+        Finds the socket timeout that ends at a deadline
+
+        Argument:
+        deadline: Time from time.monotonic()
+
+        Returns:
+        timeout: Seconds left until deadline. Raises TimeoutError if deadline has passed
+    """
+
+    timeout = deadline - time.monotonic()
+    if timeout <= 0:
+        raise TimeoutError('deadline has passed')
+
+    return timeout
+
+# End of httpTimeoutFinder()
+
+
+
+# Beginning of httpResponseCloser()
+
+def httpResponseCloser(httpResponseParts):
+
+    """
+        Description:
+        Closes files and streams in the parts of an HTTP response message, whether they were sent or not
+        A stream that was not done gets its generator closed, so it stops producing chunks
+
+        Argument:
+        httpResponseParts: HTTP response message as a list of parts
+    """
+
+    for part in httpResponseParts:
+        if isinstance(part, tuple):
+            part[0].close()
+        elif isinstance(part, ResponseStream):
+            part.close()
+
+# End of httpResponseCloser()
+
+
+
+# Beginning of httpClientGone()
+
+def httpClientGone(connectionSocket):
+
+    """
+        Description:
+        Checks without waiting if client has closed its connection, by peeking at the socket
+        Socket is readable with nothing to read once client has closed it. Bytes waiting to be read,
+        like a pipelined request message, mean the client is still there
+
+        Argument:
+        connectionSocket: A connected TCP socket
+
+        Returns:
+        gone: True if client has closed or reset the connection
+    """
+
+
+    # poll() is used instead of select(), which can not watch file descriptors above 1024
+    if not hasattr(select, 'poll'):
+        return False
+    poller = select.poll()
+    poller.register(connectionSocket, select.POLLIN)
+    if not poller.poll(0):
+        return False
+
+    try:
+        return connectionSocket.recv(1, MSG_PEEK) == b''
+    except OSError:
+        return True
+
+# End of httpClientGone()
+
+
+
 # Beginning of httpGETData()
 
-def httpGETData(httpRequestMessage):
+def httpGETData(requestedFile):
 
     """
         Description:
         Retrieves data from file requested by HTTP GET request message.
         File must exist for function to work
+        Files are read through fileCache, so frequently requested files are served from memory
+        Files are read in binary mode, so any type of file can be served
+
+        Argument:
+        requestedFile: Document of requested file, found by httpRequestedFile()
+
+        Returns:
+        data:     Data from requested file in the form of bytes.
+                  For files too large to be read into memory, an open file in binary mode
+                  that must be closed by the caller
+        modified: Modification time of requested file in seconds since epoch
+    """
+
+
+    # Attempts to read contents of requested file to variable, data
+    # File may have been removed since it was indexed, open() then raises FileNotFoundError
+    data, modified = fileCache.read(requestedFile.path)
+
+    return data, modified
+
+# End of httpGETData()
+
+
+
+# Beginning of httpRequestedFile()
+
+def httpRequestedFile(httpRequestMessage):
+
+    """
+        Description:
+        Finds file requested by HTTP GET request message in documentIndex.
+        Target is normalized first, so "/a/../index.html" is "/index.html", and no target leads outside the server directory
+        Missing files are answered from the index without touching the disk
 
         Argument:
         httpRequestMessage: An HTTP GET request message asking for specific file
 
         Returns:
-        data: Data from requested file in the form of a string    
+        requestedFile: Document of requested file, with its path, size, modification time and "Content-Type" field
+                       Raises FileNotFoundError if file does not exist
     """
 
 
-    # received HTTP GET request should be formatted like this: "GET /file ..."
-    # Word on index 1 of request String should therefore be the requested file
-    requestedFilename = httpRequestMessage.split()[1]
+    # Target of request line is the requested file, like "/index.html", "/" is a request for index.html
+    requestedFile = documentIndex.lookup(httpRequestMessage.target)
 
-    # if-statement that retreives data from requested file
-    if requestedFilename == '/':    # "/" is a request for index.html
+    if requestedFile is None:
+        raise FileNotFoundError(httpRequestMessage.target)
 
-        # opens index.html and reads its contents to variable, data
-        with open('index.html') as requestedFile:
-            data = requestedFile.read()
+    return requestedFile
 
-    else:   # handles requests for explicit file
+# End of httpRequestedFile()
 
-        # requestedFilename should start with "/", 
-        # therefore characters from index 1 and onwards should be requested file
-        # Opens file and attempts to read its contents to variable, data
-        with open(requestedFilename[1:]) as requestedFile:
-            data = requestedFile.read()
 
-    return data
 
-# End of httpGETData()
+# Beginning of httpCompressible()
 
+def httpCompressible(requestedFile):
 
+    """
+        Description:
+        Decides if a file is worth compressing, from the type the document index found for it
 
-# Beginning of httpConnectionStatus()
+        Argument:
+        requestedFile: Document of requested file
+
+        Returns:
+        compressible: True if type of file is in compressibleTypes
+    """
+
+    return requestedFile.contentType.startswith(compressibleTypes)
 
-def httpConnectionStatus(httpRequestMessage):
+# End of httpCompressible()
+
+
+
+# Beginning of httpEncodingNegotiator()
+
+def httpEncodingNegotiator(httpRequestMessage):
 
     """
         Description:
-        Sets connection status based on provided HTTP request message's connection status
+        Picks the encoding data is compressed with, from the "Accept-Encoding" field of an HTTP request message
+        Every encoding in the field may have a quality, like "gzip;q=0.5". Quality 0 means not acceptable,
+        "*" stands for every encoding not named. Highest quality wins, ties go to order of contentEncodings
 
         Argument:
         httpRequestMessage: An HTTP request message
 
         Returns:
-        connectionStatus: Connection status indicated in HTTP request message
-                          Set to 'close' if "Connection" field is not in HTTP request message 
+        encoding: "gzip" or "deflate", None if data should be sent as it is
     """
 
-    
-    # connectionStatus, set to 'close' by default
-    connectionStatus = 'close'
-    
-    # splits httpRequestMessage with '\r\n' as seperator, 
-    # this will generate an array containing each field in HTTP request message
-    requestMessageFields = httpRequestMessage.split('\r\n')
 
-    # For loop that iterates through all fields in httpRequestMessage
-    for field in requestMessageFields:
-        
-        # Looks for "Connection" field, by matching start of string with 'Connection:'
-        if field.startswith('Connection:'):
-            # Character 12 and onwards in "Connection" field contains connection status
-            connectionStatus = field[12:]
-            # Preemtively breaks for loop
-            break
-    
-    return connectionStatus
+    # Client that does not say what it accepts gets data as it is
+    acceptEncoding = httpHeaderValue(httpRequestMessage, 'Accept-Encoding')
+    if not acceptEncoding:
+        return None
+
+    # Quality of every encoding in the field, quality is 1 if it is not written
+    qualities = {}
+    for item in acceptEncoding.split(','):
+        name, *parameters = item.split(';')
+        quality = 1.0
+        for parameter in parameters:
+            key, _, value = parameter.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    # Picks acceptable encoding with highest quality
+    encoding, bestQuality = None, 0.0
+    for name in contentEncodings:
+        quality = qualities.get(name, qualities.get('*', 0.0))
+        if quality > bestQuality:
+            encoding, bestQuality = name, quality
+
+    return encoding
+
+# End of httpEncodingNegotiator()
+
+
+
+# Beginning of httpContentEncoder()
+
+def httpContentEncoder(data, path, encoding):
+
+    """
+        Description:
+        Compresses data of a file with gzip or deflate, used by fileCache.variant() to make compressed variants
+        For gzip, a precompressed sibling file on disk ("index.html.gz") is used instead, if it is not older than the file
+
+        Arguments:
+        data:     Data of the file in the form of bytes
+        path:     Resolved path of the file
+        encoding: Name of the variant, "gzip" or "deflate"
+
+        Returns:
+        encodedData: Compressed data in the form of bytes, None if compressing did not make data smaller
+    """
+
+
+    # Precompressed sibling is used if it was made from this version of the file or a newer one
+    if encoding == 'gzip':
+        try:
+            if os.stat(path + '.gz').st_mtime_ns >= os.stat(path).st_mtime_ns:
+                with open(path + '.gz', 'rb') as siblingFile:
+                    return siblingFile.read()
+        except FileNotFoundError:
+            pass
+
+    # Compresses with zlib, gzip format has its own header and deflate is zlib's format in HTTP
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31 if encoding == 'gzip' else 15)
+    encodedData = compressor.compress(data) + compressor.flush()
+
+    return encodedData if len(encodedData) < len(data) else None
+
+# End of httpContentEncoder()
+
+
+
+# Beginning of httpConnectionStatus()
+
+def httpConnectionStatus(httpRequestMessage, requestsServed = 0):
+
+    """
+        Description:
+        Decides if connection is kept open after the response to provided HTTP request message
+        HTTP/1.1 keeps connections open unless "Connection" field has "close" in it,
+        HTTP/1.0 closes them unless "Connection" field has "keep-alive" in it
+        Connection is always closed after keepAliveMaxRequests requests
+
+        Arguments:
+        httpRequestMessage: An HTTP request message, parsed by HttpRequestParser
+        requestsServed:     Requests answered on the connection before this one
+
+        Returns:
+        connectionStatus: Either "keep-alive" or "close"
+    """
+
+
+    # Connection has served as many requests as it may
+    if requestsServed + 1 >= keepAliveMaxRequests:
+        return 'close'
+
+    # Header fields were parsed once, with lower case names, so "Connection" field is found with one lookup
+    # "Connection" field is a list of options, like "keep-alive, Upgrade"
+    options = [option.strip().lower() for option in httpRequestMessage.headers.get('connection', '').split(',')]
+
+    if 'close' in options:
+        return 'close'
+    if 'keep-alive' in options:
+        return 'keep-alive'
+
+    # Without either option, HTTP/1.0 closes connections and HTTP/1.1 keeps them open
+    if httpRequestMessage.version == 'HTTP/1.0':
+        return 'close'
+    return 'keep-alive'
 
 # End of httpConnectionStatus()
 
 
 
+# Beginning of httpHeaderValue()
+
+def httpHeaderValue(httpRequestMessage, fieldName):
+
+    """
+        Description:
+        Finds value of a header field in an HTTP request message
+        Field names are matched without caring about upper or lower case
+
+        Arguments:
+        httpRequestMessage: An HTTP request message, parsed by HttpRequestParser
+        fieldName:          Name of wanted field, like "Range"
+
+        Returns:
+        value: Value of the field without surrounding whitespace, None if field is not in message
+    """
+
+    return httpRequestMessage.headers.get(fieldName.lower())
+
+# End of httpHeaderValue()
+
+
+
+# Beginning of httpEntityTagWriter()
+
+def httpEntityTagWriter(size, modified, encoding = None):
+
+    """
+        Description:
+        Writes the entity tag of a file, like "\"2a3f-65e1c0d2\"", from its size and modification time.
+        Tag changes whenever the file changes, without the file having to be read or hashed
+
+        Arguments:
+        size:     Size of the file in bytes, before it is compressed
+        modified: Modification time of the file in seconds since epoch
+        encoding: Encoding the file is sent with, like "gzip", None if it is sent as it is
+
+        Returns:
+        entityTag: The entity tag, quotes included, in the form of a string
+    """
+
+    if encoding:
+        return f'"{size:x}-{modified:x}-{encoding}"'
+    return f'"{size:x}-{modified:x}"'
+
+# End of httpEntityTagWriter()
+
+
+
+# Beginning of httpNotModified()
+
+def httpNotModified(httpRequestMessage, entityTag, modified):
+
+    """
+        Description:
+        Tells if client's copy of the requested file is the same as the server's,
+        so a "304 Not Modified" response without the file can be sent instead
+
+        "If-None-Match" lists entity tags of the copies client has, or is "*" for any copy.
+        Tags are compared weakly, "W/" in front of a tag is ignored
+        "If-Modified-Since" has the modification time of client's copy, it is only used without "If-None-Match"
+
+        Arguments:
+        httpRequestMessage: An HTTP GET request message
+        entityTag:          Entity tag of the file as it is sent
+        modified:           Modification time of the file in seconds since epoch
+
+        Returns:
+        notModified: True if client's copy is still the same
+    """
+
+
+    # Entity tags are more precise than dates, so dates are ignored when tags are sent
+    ifNoneMatchField = httpHeaderValue(httpRequestMessage, 'If-None-Match')
+    if ifNoneMatchField is not None:
+        if ifNoneMatchField.strip() == '*':
+            return True
+        return any(tag.strip().removeprefix('W/') == entityTag for tag in ifNoneMatchField.split(','))
+
+
+    # Date that can not be read is ignored, as if the field was not sent
+    ifModifiedSinceField = httpHeaderValue(httpRequestMessage, 'If-Modified-Since')
+    if ifModifiedSinceField is None:
+        return False
+    try:
+        since = parsedate_to_datetime(ifModifiedSinceField).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+    return modified <= since
+
+# End of httpNotModified()
+
+
+
+# Beginning of httpDateWriter()
+
+def httpDateWriter(timestamp):
+
+    """
+        Description:
+        Writes a time as an HTTP date, like "Sun, 06 Nov 1994 08:49:37 GMT"
+
+        Argument:
+        timestamp: Time in seconds since epoch
+
+        Returns:
+        httpDate: The time as an HTTP date in the form of a string
+    """
+
+    return formatdate(timestamp, usegmt = True)
+
+# End of httpDateWriter()
+
+
+
 # Beginning of httpResponseWriter()
 
-def httpResponseWriter(status, connection, data):
+def httpResponseWriter(status, connection, data, headerFields = None):
 
     """
         Description:
         Writes HTTP response message with provided status and data.
-        Inclueded fields in HTTP response message are: Content-Length, Connection and Content-Type
+        Inclueded fields in HTTP response message are: Content-Length, Connection and Content-Type,
+        followed by provided header fields
 
         Arguments:
-        status:     Contains status code and phrase for the HTTP response message
-        data:       HTTP response message's attached data
-        connection: Decides if client stays connected, is either "keep-alive" or "close"
+        status:       Contains status code and phrase for the HTTP response message
+        data:         HTTP response message's attached data, either bytes or a string that is encoded as UTF-8
+        connection:   Decides if client stays connected, is either "keep-alive" or "close"
+        headerFields: Dictionary of other header fields, field name mapped to value. Is not required
         
         Returns:
-        httpResponseMessage: Fully written HTTP response message in the form of a string    
+        httpResponseMessage: Fully written HTTP response message in the form of bytes
     """
 
 
+    # Content-Length counts bytes, so data is encoded before it is measured
+    if isinstance(data, str):
+        data = data.encode()
+
     # Writes the HTTP response message
-    httpResponseMessage = f'HTTP/1.1 {status}\r\n' \
-                          f'Content-Length: {len(data)}\r\n' \
-                          f'Connection: {connection}\r\n' \
-                          'Content-Type: text/html; charset=UTF-8\r\n' \
-                          '\r\n' \
-                          f'{data}'
+    httpResponseMessage = httpHeaderWriter(status, connection, len(data), headerFields) + data
     
     return httpResponseMessage
 
@@ -305,5 +1555,87 @@ def httpResponseWriter(status, connection, data):
 
 
 
+# Beginning of httpHeaderWriter()
+
+def httpHeaderWriter(status, connection, contentLength, headerFields = None):
+
+    """
+        Description:
+        Writes status line and header fields of an HTTP response message, ended by a blank line
+        Sent along with the data after it, or on its own when the data is streamed from a file after the header
+        Status lines and fields that repeat between responses, like "Connection: keep-alive", are encoded once
+        and kept in statusLines and staticFields, so only fields like "ETag" are encoded for every response
+
+        Arguments:
+        status:        Contains status code and phrase for the HTTP response message
+        connection:    Decides if client stays connected, is either "keep-alive" or "close"
+        contentLength: Size of the data following the header, in bytes. None leaves "Content-Length" out,
+                       for bodies that are streamed
+        headerFields:  Dictionary of other header fields, field name mapped to value. Is not required
+                       A "Content-Type" field replaces the default one
+
+        Returns:
+        httpHeader: Status line and header fields in the form of bytes
+    """
+
+
+    headerFields = headerFields or {}
+
+    # Status line is encoded the first time a status is sent
+    statusLine = statusLines.get(status)
+    if statusLine is None:
+        statusLine = statusLines[status] = f'HTTP/1.1 {status}\r\n'.encode('latin-1')
+
+    # Writes status line and header fields as a list of bytes, streamed bodies have no "Content-Length" field
+    httpHeader = [statusLine]
+    if contentLength is not None:
+        httpHeader.append(b'Content-Length: %d\r\n' % contentLength)
+    httpHeader.append(httpFieldWriter('Connection', connection))
+    httpHeader.append(httpFieldWriter('Content-Type', headerFields.get('Content-Type', 'text/html; charset=UTF-8')))
+
+    # Writes other header fields
+    for name, value in headerFields.items():
+        if name != 'Content-Type':
+            httpHeader.append(httpFieldWriter(name, value))
+
+    # Blank line ends the header
+    httpHeader.append(b'\r\n')
+
+    return b''.join(httpHeader)
+
+# End of httpHeaderWriter()
+
+
+
+# Beginning of httpFieldWriter()
+
+def httpFieldWriter(name, value):
+
+    """
+        Description:
+        Encodes one header field, ended by CRLF. Fields named in staticNames are encoded once and kept in staticFields
+
+        Arguments:
+        name:  Name of the field, like "Accept-Ranges"
+        value: Value of the field, like "bytes"
+
+        Returns:
+        field: Header field in the form of bytes, like "Accept-Ranges: bytes" followed by CRLF
+    """
+
+    field = staticFields.get((name, value))
+    if field is not None:
+        return field
+
+    field = f'{name}: {value}\r\n'.encode('latin-1')
+    if name in staticNames and len(staticFields) < maxStaticFields:
+        staticFields[(name, value)] = field
+
+    return field
+
+# End of httpFieldWriter()
+
+
+
 if __name__ == '__main__':  # runs the main method
     main()